@@ -1,3 +1,16 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import ArchiveEntry, Radar
+
+
+@admin.register(Radar)
+class RadarAdmin(admin.ModelAdmin):
+    list_display = ("name", "location", "configuration")
+    list_editable = ("location", "configuration")
+
+
+@admin.register(ArchiveEntry)
+class ArchiveEntryAdmin(admin.ModelAdmin):
+    list_display = ("path", "is_dir", "radar", "timestamp", "size")
+    list_filter = ("is_dir", "radar")
+    search_fields = ("path",)
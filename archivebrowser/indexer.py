@@ -0,0 +1,187 @@
+# archivebrowser/indexer.py
+
+# --------------------------------------------------------------------------
+# Incremental scanner that keeps the ArchiveEntry index up to date
+# --------------------------------------------------------------------------
+# The archive lives under settings.ARCHIVE_ROOT as
+#
+#     <radar>/<year>/<month>/<day>/<image>
+#
+# Listing millions of images on every scan would take far too long, so the
+# scanner relies on directory modification times: a directory's mtime only
+# changes when entries are added to, removed from or renamed inside it. If
+# the stored mtime still matches, the directory is not listed again and its
+# subdirectories are taken from the index instead (each of them is still
+# checked the same way). Only directories that changed are listed and
+# compared with the index.
+#
+# Run it with "python manage.py index_archive".
+
+import calendar
+import datetime
+import os
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import ArchiveEntry, Radar
+
+# Date and time inside an image name, e.g. "NXPOL1_20251206_143000.png" or
+# "scan-2025-12-06T14:30.png"
+_NAME_TIMESTAMP = re.compile(
+    r"(?<!\d)(\d{4})-?(\d{2})-?(\d{2})[T_-]?(\d{2}):?(\d{2})(?::?(\d{2}))?(?!\d)"
+)
+
+# Month directories may be numbers ("12") or English names ("December")
+_MONTH_NUMBERS = {name.lower(): number for number, name in enumerate(calendar.month_name) if name}
+
+
+def image_extensions():
+    return tuple(getattr(settings, "ARCHIVE_IMAGE_EXTENSIONS", (".png", ".jpg", ".jpeg", ".gif")))
+
+
+def _number(text, names=None):
+    if text.isdigit():
+        return int(text)
+    return names.get(text.lower()) if names else None
+
+
+def path_components(rel_path, is_dir):
+    """Return the radar/year/month/day fields for a relative archive path.
+
+    Only directory names count, so an image takes its components from the
+    directories it is stored in.
+    """
+    parts = rel_path.split("/")
+    if not is_dir:
+        parts = parts[:-1]
+    parts += [""] * (4 - len(parts))
+    return {
+        "radar": parts[0],
+        "year": _number(parts[1]),
+        "month": _number(parts[2], _MONTH_NUMBERS),
+        "day": _number(parts[3]),
+    }
+
+
+def image_timestamp(name, components, mtime):
+    """When an image was taken, as precisely as its name and path tell.
+
+    Falls back to midnight of its day directory, then to the file's mtime.
+    """
+    match = _NAME_TIMESTAMP.search(name)
+    if match:
+        parts = [int(p) for p in match.groups(default="0")]
+        try:
+            return datetime.datetime(*parts, tzinfo=datetime.timezone.utc)
+        except ValueError:
+            pass
+    try:
+        return datetime.datetime(
+            components["year"], components["month"], components["day"],
+            tzinfo=datetime.timezone.utc,
+        )
+    except (TypeError, ValueError):
+        return datetime.datetime.fromtimestamp(mtime, tz=datetime.timezone.utc)
+
+
+# --------------------------------------------------------------------------
+# Scanning
+# --------------------------------------------------------------------------
+def scan_archive(root=None, full=False):
+    """Bring the index in line with the archive on disk.
+
+    With full=True every directory is listed again, which also picks up
+    images that were overwritten in place. Returns a Counter of what was
+    done ("listed", "skipped", "added", "updated", "removed").
+    """
+    root = root or settings.ARCHIVE_ROOT
+    counts = Counter()
+    if not os.path.isdir(root):
+        # No archive at all: an empty index is the honest answer
+        counts["removed"] += ArchiveEntry.objects.count()
+        ArchiveEntry.objects.all().delete()
+        return counts
+
+    # The root itself is always listed; it only holds one entry per radar.
+    # Every radar directory gets a Radar row for its location/configuration.
+    pending = _sync_directory(root, None, counts)
+    Radar.objects.bulk_create(
+        [Radar(name=directory.name) for directory in pending], ignore_conflicts=True
+    )
+    while pending:
+        directory = pending.pop()
+        try:
+            mtime = os.stat(os.path.join(root, directory.path)).st_mtime
+        except FileNotFoundError:
+            # Removed while we were scanning; the next scan of its parent
+            # drops it from the index
+            continue
+
+        if not full and directory.mtime == mtime:
+            counts["skipped"] += 1
+            pending.extend(directory.children.filter(is_dir=True))
+            continue
+
+        pending.extend(_sync_directory(root, directory, counts))
+        directory.mtime = mtime
+        directory.save(update_fields=["mtime"])
+    return counts
+
+
+def _sync_directory(root, directory, counts):
+    """List one directory and apply the differences to its index entries.
+
+    Returns the index entries of its subdirectories.
+    """
+    counts["listed"] += 1
+    rel_dir = directory.path if directory is not None else ""
+    children = ArchiveEntry.objects.filter(parent=directory)
+    known = {child.name: child for child in children}
+    extensions = image_extensions()
+
+    new, changed, seen = [], [], set()
+    with os.scandir(os.path.join(root, rel_dir)) as listing:
+        for item in listing:
+            is_dir = item.is_dir()
+            if not is_dir and not item.name.lower().endswith(extensions):
+                continue
+            seen.add(item.name)
+            stat = item.stat()
+            child = known.get(item.name)
+
+            if child is not None and child.is_dir != is_dir:
+                # A file replaced by a directory of the same name or vice versa
+                child.delete()
+                child = None
+
+            if child is None:
+                rel_path = f"{rel_dir}/{item.name}" if rel_dir else item.name
+                components = path_components(rel_path, is_dir)
+                entry = ArchiveEntry(
+                    parent=directory, path=rel_path, name=item.name, is_dir=is_dir,
+                    # New directories get mtime 0 so they are always listed
+                    mtime=0, **components,
+                )
+                if not is_dir:
+                    entry.size, entry.mtime = stat.st_size, stat.st_mtime
+                    entry.timestamp = image_timestamp(item.name, components, stat.st_mtime)
+                new.append(entry)
+            elif not is_dir and (child.size, child.mtime) != (stat.st_size, stat.st_mtime):
+                child.size, child.mtime = stat.st_size, stat.st_mtime
+                changed.append(child)
+
+    gone = [child.pk for name, child in known.items() if name not in seen]
+    with transaction.atomic():
+        if gone:
+            # Deleting a directory entry also deletes everything below it
+            ArchiveEntry.objects.filter(pk__in=gone).delete()
+        ArchiveEntry.objects.bulk_create(new, batch_size=1000)
+        ArchiveEntry.objects.bulk_update(changed, ["size", "mtime"], batch_size=1000)
+
+    counts["added"] += len(new)
+    counts["updated"] += len(changed)
+    counts["removed"] += len(gone)
+    return list(children.filter(is_dir=True))
@@ -0,0 +1,34 @@
+# archivebrowser/management/commands/index_archive.py
+
+# --------------------------------------------------------------------------
+# python manage.py index_archive [--root DIR] [--full]
+# --------------------------------------------------------------------------
+# Updates the archive index from ARCHIVE_ROOT. Directories whose mtime has
+# not changed since the previous run are not listed again, so running this
+# regularly (e.g. from cron or Task Scheduler) is cheap even for a large
+# archive. --full lists every directory, which also notices images that
+# were overwritten in place.
+
+from django.core.management.base import BaseCommand
+
+from archivebrowser.indexer import scan_archive
+
+
+class Command(BaseCommand):
+    help = "Scan the radar image archive and update its index."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--root", help="Archive directory to scan (defaults to ARCHIVE_ROOT).",
+        )
+        parser.add_argument(
+            "--full", action="store_true",
+            help="List every directory, even ones whose mtime is unchanged.",
+        )
+
+    def handle(self, *args, **options):
+        counts = scan_archive(options["root"], full=options["full"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Listed {counts['listed']} directories, skipped {counts['skipped']} unchanged; "
+            f"{counts['added']} added, {counts['updated']} updated, {counts['removed']} removed."
+        ))
@@ -0,0 +1,35 @@
+# Generated by Django 6.0 on 2026-10-18 13:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchiveEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=1024, unique=True)),
+                ('name', models.CharField(max_length=255)),
+                ('is_dir', models.BooleanField(default=False)),
+                ('radar', models.CharField(blank=True, max_length=64)),
+                ('year', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('month', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('day', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('size', models.BigIntegerField(default=0)),
+                ('mtime', models.FloatField(default=0)),
+                ('parent', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='children', to='archivebrowser.archiveentry')),
+            ],
+            options={
+                'ordering': ['name'],
+                'indexes': [models.Index(fields=['parent', 'name'], name='archivebrow_parent__2aa816_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 6.0 on 2026-10-18 13:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('archivebrowser', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Radar',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True)),
+                ('location', models.CharField(blank=True, db_index=True, max_length=200)),
+                ('configuration', models.CharField(blank=True, max_length=100)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='archiveentry',
+            name='configuration',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='archiveentry',
+            name='timestamp',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='archiveentry',
+            index=models.Index(fields=['radar', 'timestamp', 'id'], name='archivebrow_radar_b26f55_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archiveentry',
+            index=models.Index(fields=['configuration', 'timestamp', 'id'], name='archivebrow_configu_05a9ca_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archiveentry',
+            index=models.Index(fields=['timestamp', 'id'], name='archivebrow_timesta_2fbc4b_idx'),
+        ),
+    ]
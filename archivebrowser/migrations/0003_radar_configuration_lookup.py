@@ -0,0 +1,21 @@
+# Generated by Django 6.0 on 2026-10-18 15:50
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('archivebrowser', '0002_archive_filters'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='archiveentry',
+            name='archivebrow_configu_05a9ca_idx',
+        ),
+        migrations.RemoveField(
+            model_name='archiveentry',
+            name='configuration',
+        ),
+    ]
@@ -1,3 +1,74 @@
+# archivebrowser/models.py
+
 from django.db import models
 
-# Create your models here.
+# --------------------------------------------------------------------------
+# Index of the radar image archive
+# --------------------------------------------------------------------------
+# The archive on disk is organised as <radar>/<year>/<month>/<day>/<image>.
+# It can hold millions of images, so the browser never lists directories
+# itself. Instead the indexer (see indexer.py) records every directory and
+# image here once, and the tree view reads one level at a time from this
+# table.
+
+class Radar(models.Model):
+    """One radar of the archive (a top-level directory).
+
+    Rows are created by the indexer; location and configuration are filled
+    in by hand in the admin and are what the browser's filters offer.
+    """
+    name = models.CharField(max_length=64, unique=True)
+    location = models.CharField(max_length=200, blank=True, db_index=True)
+    configuration = models.CharField(max_length=100, blank=True)
+
+    class Meta:
+        ordering = ["name"]
+
+    def __str__(self):
+        return self.name
+
+
+class ArchiveEntry(models.Model):
+    # The containing directory; top-level radar directories have no parent
+    parent = models.ForeignKey(
+        "self", on_delete=models.CASCADE, null=True, blank=True, related_name="children"
+    )
+
+    # Path relative to ARCHIVE_ROOT, always with "/" separators, and the
+    # last component of it
+    path = models.CharField(max_length=1024, unique=True)
+    name = models.CharField(max_length=255)
+    is_dir = models.BooleanField(default=False)
+
+    # Path components, filled in as far as the entry's depth allows, so a
+    # day directory knows its radar, year and month without walking up
+    radar = models.CharField(max_length=64, blank=True)
+    year = models.PositiveSmallIntegerField(null=True, blank=True)
+    month = models.PositiveSmallIntegerField(null=True, blank=True)
+    day = models.PositiveSmallIntegerField(null=True, blank=True)
+
+    # For images only: when the scan was taken (from the file name when it
+    # contains a date and time, otherwise the day directory). Location and
+    # configuration are looked up through the Radar table, so edits made
+    # in the admin apply to images indexed before them.
+    timestamp = models.DateTimeField(null=True, blank=True)
+
+    # File system metadata. For directories mtime is what lets the indexer
+    # skip listing directories that have not changed since the last scan.
+    size = models.BigIntegerField(default=0)
+    mtime = models.FloatField(default=0)
+
+    class Meta:
+        # One level of the tree is always read as "children of X ordered by
+        # name", which the first index answers directly. The others serve
+        # the filters, which return images in (timestamp, id) order for
+        # some radars or just a date range (see views.py).
+        indexes = [
+            models.Index(fields=["parent", "name"]),
+            models.Index(fields=["radar", "timestamp", "id"]),
+            models.Index(fields=["timestamp", "id"]),
+        ]
+        ordering = ["name"]
+
+    def __str__(self):
+        return self.path
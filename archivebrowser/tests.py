@@ -5,8 +5,17 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 
+import os
+import shutil
+import tempfile
+
 import django
-from django.test import TestCase
+from PIL import Image
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from .indexer import image_timestamp, path_components, scan_archive
+from .models import ArchiveEntry, Radar
 
 # TODO: Configure your database in settings.py and sync before running tests.
 
@@ -23,4 +32,182 @@ class SimpleTest(TestCase):
         """
         Tests that 1 + 1 always equals 2.
         """
-        self.assertEqual(1 + 1, 2)
\ No newline at end of file
+        self.assertEqual(1 + 1, 2)
+
+
+# --------------------------------------------------------------------------
+# Archive index
+# --------------------------------------------------------------------------
+
+def create_archive(root, images, size=None):
+    """Create image files at the given relative paths under root.
+
+    With size=(width, height) they are real PNGs; otherwise placeholders.
+    """
+    for rel_path in images:
+        path = os.path.join(root, *rel_path.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if size:
+            Image.new("RGB", size, "navy").save(path)
+        else:
+            with open(path, "wb") as f:
+                f.write(b"png")
+
+
+class ArchiveIndexerTests(TestCase):
+    """Tests for the incremental archive scanner."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        create_archive(self.root, [
+            "NXPOL1/2025/12/06/radarImage1.png",
+            "NXPOL1/2025/12/06/radarImage2.png",
+            "NXPOL1/2025/12/07/radarImage3.png",
+            "NXPOL2/2025/December/06/radarImage4.png",
+        ])
+
+    def test_scan_indexes_directories_and_images(self):
+        """Every directory and image is indexed with its path components."""
+        counts = scan_archive(self.root)
+        self.assertEqual(counts["added"], 13)  # 9 directories, 4 images
+        image = ArchiveEntry.objects.get(name="radarImage4.png")
+        self.assertEqual((image.radar, image.year, image.month, image.day), ("NXPOL2", 2025, 12, 6))
+        self.assertEqual(image.parent.path, "NXPOL2/2025/December/06")
+        self.assertEqual(path_components("NXPOL1/2025", True)["month"], None)
+
+    def test_unchanged_directories_are_not_listed_again(self):
+        """A second scan skips every directory and picks up additions and removals."""
+        scan_archive(self.root)
+        counts = scan_archive(self.root)
+        self.assertEqual(counts["listed"], 1)  # only the root
+        self.assertEqual(counts["added"] + counts["removed"], 0)
+
+        create_archive(self.root, ["NXPOL1/2025/12/08/radarImage5.png"])
+        shutil.rmtree(os.path.join(self.root, "NXPOL2"))
+        counts = scan_archive(self.root)
+        self.assertTrue(ArchiveEntry.objects.filter(name="radarImage5.png").exists())
+        self.assertFalse(ArchiveEntry.objects.filter(radar="NXPOL2").exists())
+        self.assertEqual(counts["removed"], 1)
+
+
+class ArchiveChildrenApiTests(TestCase):
+    """Tests for the lazily loaded, paginated tree endpoint."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        create_archive(self.root, [f"NXPOL1/2025/12/06/image{i}.png" for i in range(5)])
+        scan_archive(self.root)
+        self.url = reverse("archive_children")
+
+    def test_levels_are_loaded_one_at_a_time(self):
+        """Without a parent only radars are returned; months get names."""
+        radars = self.client.get(self.url).json()["entries"]
+        self.assertEqual([e["name"] for e in radars], ["NXPOL1"])
+
+        year = self.client.get(self.url, {"parent": radars[0]["id"]}).json()["entries"][0]
+        month = self.client.get(self.url, {"parent": year["id"]}).json()["entries"][0]
+        self.assertEqual(month["label"], "December")
+
+    @override_settings(ARCHIVE_PAGE_SIZE=2)
+    def test_keyset_pagination(self):
+        """Pages follow each other by name until next is None."""
+        day = ArchiveEntry.objects.get(path="NXPOL1/2025/12/06")
+        names, after = [], None
+        while True:
+            params = {"parent": day.id}
+            if after:
+                params["after"] = after
+            page = self.client.get(self.url, params).json()
+            names += [e["name"] for e in page["entries"]]
+            after = page["next"]
+            if after is None:
+                break
+        self.assertEqual(names, [f"image{i}.png" for i in range(5)])
+        self.assertTrue(page["entries"][0]["url"].endswith("NXPOL1/2025/12/06/image4.png"))
+
+
+class ArchiveFilterTests(TestCase):
+    """Tests for the date range / location / configuration filters."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        Radar.objects.create(name="NXPOL1", location="Norman, OK", configuration="dual-pol")
+        Radar.objects.create(name="NXPOL2", location="Boulder, CO", configuration="single-pol")
+        images = []
+        for day in range(1, 11):
+            images.append(f"NXPOL1/2025/12/{day:02d}/NXPOL1_202512{day:02d}_120000.png")
+            images.append(f"NXPOL2/2025/12/{day:02d}/NXPOL2_202512{day:02d}_060000.png")
+        create_archive(self.root, images)
+        scan_archive(self.root)
+        self.url = reverse("archive_images")
+
+    def fetch_all(self, **params):
+        names, after = [], None
+        while True:
+            query = dict(params, **({"after": after} if after else {}))
+            response = self.client.get(self.url, query)
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            names += [e["name"] for e in page["entries"]]
+            after = page["next"]
+            if after is None:
+                return names
+
+    def test_timestamps_come_from_names_or_directories(self):
+        """Names with a date and time win; otherwise the day directory is used."""
+        components = {"year": 2025, "month": 12, "day": 6}
+        self.assertEqual(image_timestamp("x_20251207_1430.png", components, 0).hour, 14)
+        self.assertEqual(image_timestamp("radarImage1.png", components, 0).day, 6)
+        image = ArchiveEntry.objects.get(name="NXPOL1_20251203_120000.png")
+        self.assertEqual(image.timestamp.day, 3)
+
+    @override_settings(ARCHIVE_PAGE_SIZE=3)
+    def test_radar_and_date_range(self):
+        """NXPOL1, 2025-12-01..2025-12-07 returns those seven images in order."""
+        names = self.fetch_all(radar="NXPOL1", start="2025-12-01", end="2025-12-07")
+        self.assertEqual(names, [f"NXPOL1_202512{d:02d}_120000.png" for d in range(1, 8)])
+
+    def test_location_and_configuration(self):
+        """Location and configuration both go through the radar table."""
+        self.assertEqual(len(self.fetch_all(location="Boulder, CO")), 10)
+        names = self.fetch_all(configuration="dual-pol", start="2025-12-10")
+        self.assertEqual(names, ["NXPOL1_20251210_120000.png"])
+        self.assertEqual(self.client.get(self.url, {"start": "not-a-date"}).status_code, 400)
+
+    def test_configuration_set_after_scan(self):
+        """A radar configured in the admin after the scan filters its images."""
+        create_archive(self.root, ["NXPOL3/2025/12/01/NXPOL3_20251201_000000.png"])
+        scan_archive(self.root)
+        self.assertEqual(self.fetch_all(configuration="mobile"), [])
+        Radar.objects.filter(name="NXPOL3").update(configuration="mobile")
+        self.assertEqual(self.fetch_all(configuration="mobile"), ["NXPOL3_20251201_000000.png"])
+
+
+@override_settings(THUMBNAIL_WORKERS=0)
+class ArchiveThumbnailTests(TestCase):
+    """Tests for quicklooks of archive images."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        create_archive(self.root, ["NXPOL1/2025/12/06/big.png"], size=(2000, 1000))
+        scan_archive(self.root)
+
+    def test_quicklook_is_downscaled(self):
+        """The quicklook fits the requested size and keeps the aspect ratio."""
+        thumbnails = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, thumbnails)
+        with self.settings(ARCHIVE_ROOT=self.root, THUMBNAIL_ROOT=thumbnails):
+            entry = self.client.get(reverse("archive_images")).json()["entries"][0]
+            response = self.client.get(entry["thumbnail_url"] + "&size=512")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("max-age", response["Cache-Control"])
+        image_path = os.path.join(thumbnails, "quicklook.webp")
+        with open(image_path, "wb") as f:
+            f.write(b"".join(response.streaming_content))
+        with Image.open(image_path) as image:
+            self.assertEqual(image.size, (512, 256))
@@ -1,7 +1,10 @@
 # archivebrowser/urls.py
 from django.urls import path
-from .views import radar_tree
+from .views import archive_children, archive_images, archive_thumbnail, radar_tree
 
 urlpatterns = [
     path("", radar_tree, name="radar_tree"),
+    path("api/children", archive_children, name="archive_children"),
+    path("api/images", archive_images, name="archive_images"),
+    path("thumbnails/<int:entry_id>", archive_thumbnail, name="archive_thumbnail"),
 ]
@@ -1,38 +1,219 @@
-﻿from django.shortcuts import render
+import calendar
+import datetime
+import os
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import Http404, HttpResponseBadRequest, JsonResponse
+from django.shortcuts import get_object_or_404, render
+from django.urls import reverse
+from django.views.decorators.http import require_GET
+
+from uploader.thumbnails import (
+    FORMATS, SIZES, get_thumbnail, render_image_thumbnail, thumbnail_key, thumbnail_response,
+)
+
+from .models import ArchiveEntry, Radar
+
 
 def radar_tree(request):
     """
-    Build a hierarchical tree of radar images and pass it to the template.
-    Leaf nodes include the image URL so we can display it on click.
-    """
-    # Define the tree with image URLs
-    tree = {
-        "NXPOL1": {
-            "2025": {
-                "December": {
-                    "06": [
-                        {"name": "radarImage1.png", "url": "/media/radarImage1.png"},
-                        {"name": "radarImage2.png", "url": "/media/radarImage2.png"}
-                    ],
-                    "07": [
-                        {"name": "radarImage3.png", "url": "/media/radarImage3.png"}
-                    ],
-                }
-            }
-        },
-        "NXPOL2": {
-            "2025": {
-                "December": {
-                    "06": [
-                        {"name": "radarImage4.png", "url": "/media/radarImage4.png"}
-                    ]
-                }
-            }
-        }
-    }
+    Render the archive browser page.
 
-    # Pass the tree to the template
+    The tree itself is not built here: the archive can hold millions of
+    images, so the page asks archive_children for one level at a time as
+    the user expands it.
+    """
+    # Choices for the filter form
+    radars = Radar.objects.all()
     context = {
-        "tree": tree
+        "radars": radars,
+        "locations": sorted({r.location for r in radars if r.location}),
+        "configurations": sorted({r.configuration for r in radars if r.configuration}),
     }
     return render(request, "archivebrowser/radar_tree.html", context)
+
+
+# --------------------------------------------------------------------------
+# One level of the tree, one page at a time
+# --------------------------------------------------------------------------
+# GET /archive/api/children?parent=<id>&after=<name>&limit=<n>
+#
+# Without "parent" the top-level (radar) entries are returned. Entries are
+# ordered by name and paged by "keyset": the next page starts after the last
+# name of the previous one, so every page is a single index range scan on
+# (parent, name) however deep into a large directory the user scrolls.
+
+def entry_label(entry):
+    """Text shown in the tree; month directories get the month's name."""
+    if entry.is_dir and entry.path.count("/") == 2 and entry.month:
+        return calendar.month_name[entry.month]
+    return entry.name
+
+
+def entry_json(entry):
+    data = {
+        "id": entry.id,
+        "name": entry.name,
+        "label": entry_label(entry),
+        "is_dir": entry.is_dir,
+    }
+    if not entry.is_dir:
+        data["url"] = settings.ARCHIVE_URL + entry.path
+        data["size"] = entry.size
+        # The version makes the long-cached thumbnail URL change with the image
+        data["thumbnail_url"] = (
+            reverse("archive_thumbnail", args=[entry.id]) + f"?v={int(entry.mtime)}-{entry.size}"
+        )
+    return data
+
+
+def _page_limit(request):
+    page_size = getattr(settings, "ARCHIVE_PAGE_SIZE", 200)
+    limit = int(request.GET.get("limit", page_size))
+    return max(1, min(limit, page_size))
+
+
+@require_GET
+def archive_children(request):
+    try:
+        limit = _page_limit(request)
+    except ValueError:
+        return HttpResponseBadRequest("limit must be an integer")
+
+    parent = None
+    if request.GET.get("parent"):
+        parent = get_object_or_404(ArchiveEntry, id=request.GET["parent"], is_dir=True)
+
+    entries = ArchiveEntry.objects.filter(parent=parent).order_by("name")
+    after = request.GET.get("after")
+    if after:
+        entries = entries.filter(name__gt=after)
+
+    # Fetch one extra row to find out whether another page follows
+    page = list(entries[:limit + 1])
+    has_more = len(page) > limit
+    page = page[:limit]
+
+    return JsonResponse({
+        "entries": [entry_json(entry) for entry in page],
+        "next": page[-1].name if has_more else None,
+    })
+
+
+# --------------------------------------------------------------------------
+# Filtered image search
+# --------------------------------------------------------------------------
+# GET /archive/api/images?radar=NXPOL1&start=2025-12-01&end=2025-12-07
+#                        &location=...&configuration=...&after=<cursor>
+#
+# Returns matching images (never directories) in time order, one page at a
+# time. Every filter is an indexed column (see ArchiveEntry.Meta.indexes),
+# and pages continue from the (timestamp, id) of the last image returned,
+# so a page deep into years of scans costs the same as the first one.
+
+def _parse_date(request, name):
+    value = request.GET.get(name)
+    return datetime.date.fromisoformat(value) if value else None
+
+
+def _cursor(entry):
+    # UTC without an offset, so the cursor has no "+" to get mangled in URLs
+    timestamp = entry.timestamp.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return f"{timestamp.isoformat()}|{entry.id}"
+
+
+def _parse_cursor(cursor):
+    timestamp, entry_id = cursor.rsplit("|", 1)
+    timestamp = datetime.datetime.fromisoformat(timestamp).replace(tzinfo=datetime.timezone.utc)
+    return timestamp, int(entry_id)
+
+
+def filter_images(radar=None, location=None, configuration=None, start=None, end=None):
+    """Images matching the given filters, ordered by (timestamp, id).
+
+    start and end are dates; both days are included.
+    """
+    images = ArchiveEntry.objects.filter(is_dir=False, timestamp__isnull=False)
+    if radar:
+        images = images.filter(radar=radar)
+    if location:
+        images = images.filter(radar__in=Radar.objects.filter(location=location).values("name"))
+    if configuration:
+        images = images.filter(
+            radar__in=Radar.objects.filter(configuration=configuration).values("name")
+        )
+    if start:
+        images = images.filter(timestamp__gte=datetime.datetime.combine(
+            start, datetime.time.min, tzinfo=datetime.timezone.utc))
+    if end:
+        images = images.filter(timestamp__lt=datetime.datetime.combine(
+            end + datetime.timedelta(days=1), datetime.time.min, tzinfo=datetime.timezone.utc))
+    return images.order_by("timestamp", "id")
+
+
+@require_GET
+def archive_images(request):
+    try:
+        limit = _page_limit(request)
+        images = filter_images(
+            radar=request.GET.get("radar"),
+            location=request.GET.get("location"),
+            configuration=request.GET.get("configuration"),
+            start=_parse_date(request, "start"),
+            end=_parse_date(request, "end"),
+        )
+        if request.GET.get("after"):
+            timestamp, entry_id = _parse_cursor(request.GET["after"])
+            images = images.filter(
+                Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=entry_id)
+            )
+    except ValueError as exc:
+        return HttpResponseBadRequest(f"Invalid filter: {exc}")
+
+    # Fetch one extra row to find out whether another page follows
+    page = list(images[:limit + 1])
+    has_more = len(page) > limit
+    page = page[:limit]
+
+    entries = []
+    for entry in page:
+        data = entry_json(entry)
+        data["radar"] = entry.radar
+        data["timestamp"] = entry.timestamp.isoformat()
+        entries.append(data)
+    return JsonResponse({
+        "entries": entries,
+        "next": _cursor(page[-1]) if has_more else None,
+    })
+
+
+# --------------------------------------------------------------------------
+# Thumbnails and quicklooks
+# --------------------------------------------------------------------------
+# GET /archive/thumbnails/<id>?size=1024&format=webp
+#
+# A downscaled copy of an archive image (see uploader/thumbnails.py), so
+# clicking through scans does not download every full-size image.
+
+@require_GET
+def archive_thumbnail(request, entry_id):
+    entry = get_object_or_404(ArchiveEntry, id=entry_id, is_dir=False)
+
+    fmt = request.GET.get("format", "webp")
+    if fmt not in FORMATS:
+        return HttpResponseBadRequest(f"Unknown format {fmt!r}")
+    try:
+        size = int(request.GET.get("size", 256))
+    except ValueError:
+        size = None
+    if size not in SIZES:
+        return HttpResponseBadRequest(f"size must be one of {', '.join(map(str, SIZES))}")
+
+    source = os.path.join(settings.ARCHIVE_ROOT, *entry.path.split("/"))
+    if not os.path.exists(source):
+        raise Http404("Image is no longer in the archive")
+
+    key = thumbnail_key("archive", entry.path, entry.size, entry.mtime, size, fmt)
+    path = get_thumbnail(key, fmt, size, render_image_thumbnail, source)
+    return thumbnail_response(path, fmt, key)
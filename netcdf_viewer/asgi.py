@@ -0,0 +1,27 @@
+"""
+ASGI config for netcdf_viewer project.
+
+This module exposes the ASGI application as a module-level variable named
+``application``. Serving the site through an ASGI server, e.g.
+
+    uvicorn netcdf_viewer.asgi:application --workers 2
+
+lets the async API views (slice, frames, metadata) wait for NetCDF reads
+without tying up a worker, so one slow read on network storage no longer
+stalls every other viewer served by that worker. The WSGI entry point in
+wsgi.py keeps working as before.
+
+For more information, visit
+https://docs.djangoproject.com/en/stable/howto/deployment/asgi/
+"""
+
+import os
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault(
+    'DJANGO_SETTINGS_MODULE',
+    'netcdf_viewer.settings')
+
+# This application object is used by any ASGI server configured to use
+# this file.
+application = get_asgi_application()
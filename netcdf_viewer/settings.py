@@ -55,6 +55,7 @@ INSTALLED_APPS = [
 # Middleware framework
 # https://docs.djangoproject.com/en/2.1/topics/http/middleware/
 MIDDLEWARE = [
+    'uploader.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -85,15 +86,57 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'netcdf_viewer.wsgi.application'
+ASGI_APPLICATION = 'netcdf_viewer.asgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/2.1/ref/settings/#databases
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+# SQLite is tuned for many readers next to the upload and ingest workers:
+# WAL lets reads carry on while one connection writes, writers wait up to
+# busy_timeout ms for the lock instead of failing with "database is
+# locked", and the file is read through a memory map. IMMEDIATE
+# transactions take the write lock up front, so two writers never deadlock
+# upgrading from a read.
+#
+# Set NETCDF_DB_ENGINE=postgresql (and NETCDF_DB_NAME, NETCDF_DB_USER,
+# NETCDF_DB_PASSWORD, NETCDF_DB_HOST, NETCDF_DB_PORT) to use PostgreSQL
+# instead; that needs "pip install psycopg[binary]".
+#
+# Connections are kept open for NETCDF_DB_CONN_MAX_AGE seconds (default 60)
+# and checked before reuse, so requests do not reconnect every time.
+DB_CONN_MAX_AGE = int(os.environ.get('NETCDF_DB_CONN_MAX_AGE', 60))
+
+if os.environ.get('NETCDF_DB_ENGINE', 'sqlite') == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('NETCDF_DB_NAME', 'netcdf_viewer'),
+            'USER': os.environ.get('NETCDF_DB_USER', ''),
+            'PASSWORD': os.environ.get('NETCDF_DB_PASSWORD', ''),
+            'HOST': os.environ.get('NETCDF_DB_HOST', 'localhost'),
+            'PORT': os.environ.get('NETCDF_DB_PORT', '5432'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    'PRAGMA busy_timeout=20000;'
+                    'PRAGMA mmap_size=268435456;'
+                    'PRAGMA cache_size=-32000;'
+                ),
+                'transaction_mode': 'IMMEDIATE',
+            },
+        }
     }
-}
 
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
@@ -124,3 +167,143 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/2.1/howto/static-files/
 STATIC_URL = '/static/'
 STATIC_ROOT = posixpath.join(*(BASE_DIR.split(os.path.sep) + ['static']))
+
+# NetCDF viewer tuning
+# Maximum number of NetCDF files each worker process keeps open, and how
+# long (in seconds) an unused handle stays open before it is closed.
+NETCDF_CACHE_MAX_OPEN = 8
+NETCDF_CACHE_IDLE_TIMEOUT = 300
+
+# Slices larger than this (cells per axis) are block-reduced before they
+# are drawn. Zoomed views use tiles of NETCDF_TILE_SIZE cells instead, and
+# each process keeps recently used tile pyramids up to
+# NETCDF_PYRAMID_CACHE_BYTES (a pyramid takes about 1.33 x 4 bytes per cell
+# of its slice).
+NETCDF_DISPLAY_MAX_SIZE = 1024
+NETCDF_TILE_SIZE = 256
+NETCDF_PYRAMID_CACHE_BYTES = 256 * 1024 * 1024
+
+# Metadata ingest after upload (see uploader/ingest.py). With
+# NETCDF_INGEST_ASYNC = False files are ingested inside the upload request
+# (and new collections are built inside the request that creates them).
+NETCDF_INGEST_ASYNC = True
+NETCDF_INGEST_WORKERS = 2
+# Also compute per-variable statistics (min/max/mean/percentiles) at ingest
+NETCDF_INGEST_STATISTICS = True
+
+# Uploads are streamed to disk and hashed in chunks of this many bytes.
+# Files larger than NETCDF_CHUNKED_UPLOAD_THRESHOLD are sent from the browser
+# through the resumable chunked upload API instead of a single form post.
+FILE_UPLOAD_HANDLERS = ['uploader.uploads.HashingUploadHandler']
+NETCDF_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+NETCDF_CHUNKED_UPLOAD_THRESHOLD = 64 * 1024 * 1024
+
+# Largest batch of time steps returned by one frames API request (playback)
+NETCDF_MAX_FRAMES_PER_REQUEST = 32
+
+# Memory budgets (in bytes) of the in-process caches for slice arrays and
+# finished responses (encoded slices, rendered plots). See response_cache.py.
+NETCDF_SLICE_CACHE_BYTES = 256 * 1024 * 1024
+NETCDF_PAYLOAD_CACHE_BYTES = 64 * 1024 * 1024
+
+# Name of an entry in CACHES (e.g. a Redis or memcached backend) shared by
+# all worker processes as a second cache tier. None keeps caching in-process.
+NETCDF_SHARED_CACHE = None
+
+# Radar image archive browsed by the archivebrowser app, organised as
+# <radar>/<year>/<month>/<day>/<image>, and the URL its files are served
+# from. Run "python manage.py index_archive" after images are added.
+ARCHIVE_ROOT = os.path.join(MEDIA_ROOT, 'archive')
+ARCHIVE_URL = MEDIA_URL + 'archive/'
+ARCHIVE_IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif')
+
+# Most tree entries returned by one request of the archive browser
+ARCHIVE_PAGE_SIZE = 200
+
+# Cache directory for rendered thumbnails and quicklooks, the number of
+# worker processes that render them and how long browsers may keep them
+# (their URLs change whenever the source does). See uploader/thumbnails.py.
+THUMBNAIL_ROOT = os.path.join(MEDIA_ROOT, 'thumbnails')
+THUMBNAIL_WORKERS = 2
+THUMBNAIL_MAX_AGE = 365 * 24 * 60 * 60
+
+# Time series / profile extraction (see uploader/timeseries.py): memory for
+# cached chunk columns, the largest column worth caching and the largest
+# box (in cells) one request may ask for
+NETCDF_SERIES_CACHE_BYTES = 128 * 1024 * 1024
+NETCDF_SERIES_BLOCK_BYTES = 16 * 1024 * 1024
+NETCDF_SERIES_MAX_CELLS = 4096
+
+# Worker processes that read member file headers when a collection of
+# files is built (see uploader/aggregation.py); 0 reads them in-process
+NETCDF_COLLECTION_WORKERS = 4
+
+# Memory used per block when a derived expression reduces a variable along
+# a dimension, e.g. mean(reflectivity, time) (see uploader/expressions.py)
+NETCDF_DERIVED_BLOCK_BYTES = 64 * 1024 * 1024
+
+# Subset exports (see uploader/export.py): memory per block of time steps
+# written, and how many exports may stream at once in each process.
+# NetCDF exports are written to a temporary file before they are sent, so
+# their size (float32 values) is limited to NETCDF_EXPORT_NETCDF_MAX_BYTES.
+NETCDF_EXPORT_BLOCK_BYTES = 32 * 1024 * 1024
+NETCDF_EXPORT_MAX_CONCURRENT = 4
+NETCDF_EXPORT_NETCDF_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+# Blocking NetCDF reads of the async API views (see uploader/async_reads.py):
+# threads in the read pool, reads of one file in progress at once, and
+# seconds before a read is given up on
+NETCDF_READ_WORKERS = 8
+NETCDF_READS_PER_FILE = 4
+NETCDF_READ_TIMEOUT = 30
+
+# Request instrumentation (see uploader/instrumentation.py): Server-Timing
+# headers and Prometheus metrics at /metrics (readable by staff users, or
+# by anyone while DEBUG is on). It is on only in development by default,
+# since the headers tell every client how long each stage took. A
+# fraction of requests can also be profiled with cProfile; profiles of
+# requests slower than NETCDF_PROFILE_SLOW_SECONDS are saved to
+# NETCDF_PROFILE_DIR.
+NETCDF_INSTRUMENTATION = DEBUG
+NETCDF_PROFILE_SAMPLE_RATE = 0
+NETCDF_PROFILE_SLOW_SECONDS = 1.0
+NETCDF_PROFILE_DIR = os.path.join(BASE_DIR, 'profiles')
+
+# Memory one slice read may use (see the memory governor in
+# uploader/slicing.py). Larger slices are reduced while they are read.
+NETCDF_READ_BUDGET_BYTES = 256 * 1024 * 1024
+
+# Optional rewrite of every upload into a chunk layout suited to the viewer
+# (see uploader/optimize.py): chunks NETCDF_OPTIMIZE_TIME_CHUNK steps deep
+# and about NETCDF_OPTIMIZE_CHUNK_BYTES large, compressed with "zlib" or
+# "lz4" (used when the netCDF library has the Blosc filter). The original
+# is kept; the viewer reads the copy once it is finished.
+NETCDF_OPTIMIZE_UPLOADS = False
+NETCDF_OPTIMIZE_WORKERS = 1
+NETCDF_OPTIMIZE_COMPRESSION = 'zlib'
+NETCDF_OPTIMIZE_COMPLEVEL = 4
+NETCDF_OPTIMIZE_CHUNK_BYTES = 1024 * 1024
+NETCDF_OPTIMIZE_TIME_CHUNK = 8
+
+# Files converted with "manage.py convert_to_zarr" are read from a Zarr
+# store (see uploader/backends.py), which uses the NETCDF_OPTIMIZE_* chunk
+# layout and compression above. Large reads from a store are split into
+# bands read in parallel by this many threads (1 reads in one go).
+NETCDF_ZARR_READ_THREADS = 4
+
+# Bulk uploads and "manage.py ingest_netcdf" (see uploader/bulk.py): worker
+# processes checking file headers (and then computing statistics), threads
+# copying files into MEDIA_ROOT and files inserted per database
+# transaction.
+NETCDF_BULK_WORKERS = 4
+NETCDF_BULK_COPY_WORKERS = 4
+NETCDF_BULK_BATCH_SIZE = 500
+
+# Decoded time axes kept in memory (see uploader/time_axis.py), 8 bytes per
+# step each for the timestamps and the raw values, and the number of
+# labelled ticks drawn under the time slider.
+NETCDF_TIME_AXIS_CACHE_BYTES = 16 * 1024 * 1024
+NETCDF_TIME_TICKS = 10
+
+# Files shown per page of the file list (/files/).
+NETCDF_FILES_PER_PAGE = 50
@@ -1,7 +1,32 @@
 from django.contrib import admin
-from .models import NetCDFFile
+from .models import NetCDFCollection, NetCDFCollectionMember, NetCDFFile, NetCDFVariable
+
+class NetCDFVariableInline(admin.TabularInline):
+    model = NetCDFVariable
+    fields = ("name", "dimensions", "shape", "dtype", "chunking")
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
 
 @admin.register(NetCDFFile)
 class NetCDFFileAdmin(admin.ModelAdmin):
-    list_display = ("file", "uploaded_at")
-    ordering = ("-uploaded_at",)
+    list_display = ("file", "uploaded_at", "ingest_status", "optimize_status", "storage_format")
+    list_filter = ("ingest_status", "optimize_status", "storage_format")
+    ordering = ("-uploaded_at", "-id")
+    inlines = [NetCDFVariableInline]
+    # Skip counting every file on each page of the change list
+    show_full_result_count = False
+
+class NetCDFCollectionMemberInline(admin.TabularInline):
+    model = NetCDFCollectionMember
+    fields = ("position", "file", "time_offset", "time_count")
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+@admin.register(NetCDFCollection)
+class NetCDFCollectionAdmin(admin.ModelAdmin):
+    list_display = ("name", "time_count", "built_at")
+    readonly_fields = ("time_count", "built_at", "build_error", "variables")
+    exclude = ("times",)
+    inlines = [NetCDFCollectionMemberInline]
@@ -0,0 +1,283 @@
+# uploader/aggregation.py
+
+# --------------------------------------------------------------------------
+# Collections: a virtual dataset made of many files along time
+# --------------------------------------------------------------------------
+# A NetCDFCollection lists member files in time order. Member i covers the
+# global time steps time_offset .. time_offset + time_count - 1, so finding
+# the file for a global step is a binary search over the members' offsets.
+# Only that one file is opened to read the step; the slider can span
+# thousands of scans without any of the others being touched.
+#
+# Building a collection reads just the header and time axis of each member
+# (no data), on a pool of worker processes, and saves the offsets. Builds
+# started from the collection page run on a background thread, like ingest
+# and optimisation of uploads, so the request does not wait for thousands
+# of headers.
+#
+# Members are joined along a dimension called "time". A file without one
+# counts as a single step; a file whose time dimension is empty is left out.
+
+import logging
+import math
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import django
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .backends import open_dataset
+from .ingest import decode_times
+from .models import NetCDFCollection, NetCDFCollectionMember, NetCDFFile
+from .slicing import read_slice, read_time_range
+
+logger = logging.getLogger(__name__)
+
+
+class CollectionError(ValueError):
+    """Raised when files cannot be combined into a collection."""
+
+
+# --------------------------------------------------------------------------
+# Reading headers (runs in the worker processes)
+# --------------------------------------------------------------------------
+def read_header(path):
+    """Time axis and plottable variables of one file (no database access)."""
+    with open_dataset(path) as ds:
+        variables = []
+        for name, var in ds.variables.items():
+            if len(var.dimensions) < 2:
+                continue
+            chunking = var.chunking()
+            variables.append({
+                "name": name,
+                "dimensions": list(var.dimensions),
+                "shape": list(var.shape),
+                "chunking": None if chunking == "contiguous" else list(chunking),
+            })
+
+        time_count = len(ds.dimensions["time"]) if "time" in ds.dimensions else 1
+        values, timestamps = [None] * time_count, [None] * time_count
+        time_var = ds.variables.get("time")
+        if time_var is not None and time_var.dimensions == ("time",):
+            raw = np.ma.filled(np.ma.asarray(time_var[:], dtype=float), np.nan)
+            values = [v if math.isfinite(v) else None for v in raw.tolist()]
+            timestamps = decode_times(time_var)
+    return {"time_count": time_count, "values": values, "timestamps": timestamps, "variables": variables}
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Workers started with "spawn" must set Django up before they
+            # can import this module
+            _executor = ProcessPoolExecutor(
+                max_workers=getattr(settings, "NETCDF_COLLECTION_WORKERS", 4),
+                initializer=django.setup,
+            )
+        return _executor
+
+
+def read_headers(paths, workers=None):
+    """read_header for many files, on the process pool when there are several."""
+    if workers is None:
+        workers = getattr(settings, "NETCDF_COLLECTION_WORKERS", 4)
+    if not workers or len(paths) < 2:
+        return [read_header(path) for path in paths]
+    chunksize = max(1, len(paths) // (workers * 4))
+    return list(_get_executor().map(read_header, paths, chunksize=chunksize))
+
+
+# --------------------------------------------------------------------------
+# Building
+# --------------------------------------------------------------------------
+def _order_key(item):
+    """Sort members by first timestamp, then first raw time value."""
+    position, (_, header) = item
+    stamp, value = header["timestamps"][0], header["values"][0]
+    if stamp is not None:
+        return (0, stamp.timestamp(), position)
+    return (1, value if value is not None else math.inf, position)
+
+
+def _shared_variables(headers):
+    """Variables every member has with the same dimensions and spatial shape."""
+    def layout(info):
+        dims = info["dimensions"]
+        shape = [size for dim, size in zip(dims, info["shape"]) if dim != "time"]
+        return dims, shape
+
+    first = headers[0]["variables"]
+    others = [{v["name"]: layout(v) for v in h["variables"]} for h in headers[1:]]
+    return [
+        var for var in first
+        if all(o.get(var["name"]) == layout(var) for o in others)
+    ]
+
+
+def _time_label(stamp, value):
+    return stamp.isoformat() if stamp is not None else value
+
+
+def build_collection(collection, files, workers=None):
+    """(Re)build a collection from NetCDFFile rows.
+
+    Reads every file's header in parallel, orders the files by time and
+    stores the members with their offsets. Files with an empty time
+    dimension are skipped. Raises CollectionError when a file cannot be
+    read, no file has any time steps or the files share no plottable
+    variable.
+    """
+    files = list(files)
+    if not files:
+        raise CollectionError("A collection needs at least one file")
+    try:
+        headers = read_headers([f.data_path for f in files], workers)
+    except (OSError, RuntimeError) as exc:
+        raise CollectionError(f"Could not read a member file: {exc}")
+
+    # A file created before its first scan was written has no steps (and no
+    # first time to be ordered by)
+    pairs = [(nc_file, header) for nc_file, header in zip(files, headers) if header["time_count"]]
+    if not pairs:
+        raise CollectionError("None of the files has any time steps")
+
+    ordered = [pair for _, pair in sorted(enumerate(pairs), key=_order_key)]
+    variables = _shared_variables([header for _, header in ordered])
+    if not variables:
+        raise CollectionError("The files have no plottable variable in common")
+
+    members, times, offset = [], [], 0
+    for position, (nc_file, header) in enumerate(ordered):
+        members.append(NetCDFCollectionMember(
+            collection=collection, file=nc_file, position=position,
+            time_offset=offset, time_count=header["time_count"],
+        ))
+        times.extend(map(_time_label, header["timestamps"], header["values"]))
+        offset += header["time_count"]
+
+    with transaction.atomic():
+        collection.members.all().delete()
+        NetCDFCollectionMember.objects.bulk_create(members, batch_size=1000)
+        collection.time_count = offset
+        collection.variables = variables
+        collection.times = times
+        collection.built_at = timezone.now()
+        collection.build_error = ""
+        collection.save()
+    return collection
+
+
+# --------------------------------------------------------------------------
+# Building in the background
+# --------------------------------------------------------------------------
+_jobs = ThreadPoolExecutor(max_workers=1, thread_name_prefix="netcdf-collection")
+
+
+def _build_in_background(collection_id, file_ids):
+    try:
+        collection = NetCDFCollection.objects.filter(id=collection_id).first()
+        if collection is None:
+            return
+        try:
+            build_collection(collection, NetCDFFile.objects.filter(id__in=file_ids))
+        except Exception as exc:
+            logger.exception("Building collection %s failed", collection)
+            collection.build_error = str(exc)
+            collection.save(update_fields=["build_error"])
+    finally:
+        # Worker threads get their own database connection; release it
+        connection.close()
+
+
+def submit_build(collection, files):
+    """Schedule the build of a new collection.
+
+    With NETCDF_INGEST_ASYNC the build runs on a background thread once
+    the current transaction commits, and failures are recorded in
+    collection.build_error; otherwise it runs immediately and raises
+    CollectionError.
+    """
+    if getattr(settings, "NETCDF_INGEST_ASYNC", True):
+        file_ids = [f.id for f in files]
+        transaction.on_commit(lambda: _jobs.submit(_build_in_background, collection.id, file_ids))
+    else:
+        build_collection(collection, files)
+
+
+# --------------------------------------------------------------------------
+# Global time index -> (member, local index)
+# --------------------------------------------------------------------------
+class CollectionIndex:
+    """Maps a collection's global time steps to member files."""
+
+    def __init__(self, members):
+        self.members = list(members)
+        self.offsets = np.array([m.time_offset for m in self.members], dtype=np.int64)
+        last = self.members[-1] if self.members else None
+        self.time_count = last.time_offset + last.time_count if last else 0
+
+    def _position(self, time_idx):
+        if not 0 <= time_idx < self.time_count:
+            raise IndexError(f"time index {time_idx} outside 0:{self.time_count}")
+        return int(np.searchsorted(self.offsets, time_idx, side="right")) - 1
+
+    def locate(self, time_idx):
+        """(member, local index) holding global step time_idx."""
+        member = self.members[self._position(time_idx)]
+        return member, time_idx - member.time_offset
+
+    def split(self, start, stop):
+        """(member, local start, local stop) for each file covering start..stop-1."""
+        if not 0 <= start < stop <= self.time_count:
+            raise IndexError(f"time range {start}:{stop} outside 0:{self.time_count}")
+        pieces = []
+        position = self._position(start)
+        local = start - self.members[position].time_offset
+        while start < stop:
+            member = self.members[position]
+            local_stop = min(member.time_count, local + stop - start)
+            pieces.append((member, local, local_stop))
+            start += local_stop - local
+            position, local = position + 1, 0
+        return pieces
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def collection_index(collection):
+    """The CollectionIndex of a collection, cached until it is rebuilt."""
+    with _indexes_lock:
+        cached = _indexes.get(collection.pk)
+    if cached is not None and cached[0] == collection.built_at:
+        return cached[1]
+    index = CollectionIndex(collection.members.select_related("file"))
+    with _indexes_lock:
+        _indexes[collection.pk] = (collection.built_at, index)
+    return index
+
+
+# --------------------------------------------------------------------------
+# Reading from member files
+# --------------------------------------------------------------------------
+def read_member_slice(ds, var_name, local_idx, selection=None):
+    """One step of a variable from an open member file."""
+    return read_slice(ds, var_name, dict(selection or {}, time=local_idx))
+
+
+def read_member_range(ds, var_name, start, stop, selection=None):
+    """Steps start..stop-1 of a member, as a (steps, rows, cols) array."""
+    var = ds.variables[var_name]
+    if "time" in var.dimensions:
+        return read_time_range(ds, var_name, start, stop, selection)
+    return np.stack([read_member_slice(ds, var_name, i, selection) for i in range(start, stop)])
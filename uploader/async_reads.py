@@ -0,0 +1,133 @@
+# uploader/async_reads.py
+
+# --------------------------------------------------------------------------
+# Running blocking NetCDF reads from async views
+# --------------------------------------------------------------------------
+# netCDF4 has no async API: a read blocks its thread until HDF5 is done,
+# which on network storage can take a while. The async views (slice,
+# frames, metadata) therefore hand every read to a bounded thread pool
+# (NETCDF_READ_WORKERS) and await it, so the event loop keeps serving other
+# requests in the meantime.
+#
+# Two more limits keep one busy file from taking over:
+#
+#   - at most NETCDF_READS_PER_FILE reads of the same file run or wait in
+#     the pool at once; further requests for that file wait without
+#     occupying a pool thread, and
+#   - a read that takes longer than NETCDF_READ_TIMEOUT seconds is given up
+#     on (the view answers 504).
+#
+# When a client goes away Django cancels the view. A read still queued for
+# the pool is then dropped; one that already started finishes in the
+# background (its result still lands in the caches), but the file's slot
+# is only freed once it has.
+#
+# The limiter works with any event loop, including the short-lived ones
+# Django creates to run async views under WSGI.
+
+import asyncio
+import contextvars
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, "NETCDF_READ_WORKERS", 8),
+    thread_name_prefix="netcdf-read",
+)
+
+
+class FileLimiter:
+    """Caps how many reads of one file are in progress at once."""
+
+    def __init__(self, per_file):
+        self.per_file = per_file
+        self._lock = threading.Lock()
+        self._active = {}
+        self._waiting = {}
+
+    def active(self, key):
+        with self._lock:
+            return self._active.get(key, 0)
+
+    async def acquire(self, key):
+        with self._lock:
+            if self._active.get(key, 0) < self.per_file:
+                self._active[key] = self._active.get(key, 0) + 1
+                return
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            waiter = (loop, future)
+            self._waiting.setdefault(key, deque()).append(waiter)
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                queue = self._waiting.get(key)
+                queued = queue is not None and waiter in queue
+                if queued:
+                    queue.remove(waiter)
+            # A slot handed over just before the cancellation is passed on
+            # (when the hand-over itself was cancelled, _wake passes it on)
+            if not queued and not future.cancelled():
+                self.release(key)
+            raise
+
+    def release(self, key):
+        """Free a slot, handing it straight to the next waiter if any."""
+        with self._lock:
+            queue = self._waiting.get(key)
+            if queue:
+                loop, future = queue.popleft()
+                if not queue:
+                    del self._waiting[key]
+                loop.call_soon_threadsafe(self._wake, key, future)
+                return
+            self._active[key] -= 1
+            if not self._active[key]:
+                del self._active[key]
+
+    def _wake(self, key, future):
+        if future.done():
+            # The waiter was cancelled in the meantime
+            self.release(key)
+        else:
+            future.set_result(None)
+
+
+file_limiter = FileLimiter(getattr(settings, "NETCDF_READS_PER_FILE", 4))
+
+
+def _call(func, args):
+    # Pool threads keep their own database connection between reads, like
+    # request threads do: it is only closed once it is older than
+    # CONN_MAX_AGE or has broken, the same checks Django makes around
+    # each request
+    close_old_connections()
+    try:
+        return func(*args)
+    finally:
+        close_old_connections()
+
+
+async def run_read(file_key, func, *args):
+    """Run func(*args) on the read pool, within file_key's concurrency limit.
+
+    Exceptions raised by func are re-raised here. Raises TimeoutError when
+    the read takes longer than NETCDF_READ_TIMEOUT seconds.
+    """
+    await file_limiter.acquire(file_key)
+    try:
+        # The read runs in this request's context (for instrumentation.py)
+        work = _executor.submit(contextvars.copy_context().run, _call, func, args)
+    except BaseException:
+        file_limiter.release(file_key)
+        raise
+    # The slot is held until the read itself is over (or was never started)
+    work.add_done_callback(lambda _: file_limiter.release(file_key))
+    return await asyncio.wait_for(
+        asyncio.wrap_future(work), getattr(settings, "NETCDF_READ_TIMEOUT", 30)
+    )
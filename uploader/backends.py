@@ -0,0 +1,270 @@
+# uploader/backends.py
+
+# --------------------------------------------------------------------------
+# Storage backends: where a file's data is read from
+# --------------------------------------------------------------------------
+# The viewer reads data through objects that look like netCDF4 Datasets:
+# ds.variables, ds.dimensions, var.dimensions/shape/dtype/chunking(),
+# attributes, and indexing a variable with var[...]. Two backends provide
+# them:
+#
+#   netcdf4  a NetCDF/HDF5 file - the upload or its optimised copy
+#            (optimize.py) - opened with netCDF4.
+#   zarr     a local directory Zarr (v2) store with consolidated metadata,
+#            written by "python manage.py convert_to_zarr". Every chunk is
+#            its own file.
+#
+# HDF5 reads are serialised by a library-wide lock, so a netCDF4 handle is
+# used by one request at a time (see dataset_cache.py). A Zarr store has no
+# such lock and its chunks are decompressed by numcodecs with the GIL
+# released, so Zarr handles are shared by concurrent requests and a large
+# read is split into bands of chunk rows that are read in parallel on a
+# small thread pool (NETCDF_ZARR_READ_THREADS threads).
+#
+# open_dataset(path) picks the backend from the path: directories are Zarr
+# stores, anything else is opened with netCDF4.
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from netCDF4 import Dataset
+
+from .slicing import invalid_values
+
+# zarr is only needed once files have been converted
+try:
+    import zarr
+except ImportError:
+    zarr = None
+
+# Attributes holding raw values, which netCDF4 returns in the variable's type
+TYPED_ATTRIBUTES = ("_FillValue", "missing_value", "valid_min", "valid_max", "valid_range")
+
+
+class NetCDF4Backend:
+    name = "netcdf4"
+    # Handles must not be used by two threads at once
+    thread_safe = False
+
+    def open(self, path):
+        return Dataset(path, "r")
+
+
+class ZarrBackend:
+    name = "zarr"
+    thread_safe = True
+
+    def open(self, path):
+        if zarr is None:
+            raise ImproperlyConfigured("Reading Zarr stores needs the zarr package.")
+        return ZarrDataset(zarr.open_consolidated(path, mode="r"))
+
+
+BACKENDS = {backend.name: backend for backend in (NetCDF4Backend(), ZarrBackend())}
+
+
+def backend_for(path):
+    """The backend that reads path."""
+    return BACKENDS["zarr"] if os.path.isdir(path) else BACKENDS["netcdf4"]
+
+
+def open_dataset(path):
+    """Open path read-only with its backend; usable as a context manager."""
+    return backend_for(path).open(path)
+
+
+# --------------------------------------------------------------------------
+# Parallel chunk reads
+# --------------------------------------------------------------------------
+_read_pool = None
+_read_pool_lock = threading.Lock()
+
+
+def _get_read_pool():
+    global _read_pool
+    with _read_pool_lock:
+        if _read_pool is None:
+            _read_pool = ThreadPoolExecutor(
+                max_workers=getattr(settings, "NETCDF_ZARR_READ_THREADS", 4),
+                thread_name_prefix="netcdf-zarr-read",
+            )
+        return _read_pool
+
+
+def _row_bands(index, shape, chunks):
+    """Split a read into bands of whole chunk rows, or None if not worth it.
+
+    Only plain reads (one int or slice per dimension) whose row slice has
+    step 1 and covers more than one chunk row are split.
+    """
+    if len(shape) < 2 or len(index) != len(shape):
+        return None
+    if not all(isinstance(i, (int, np.integer, slice)) for i in index):
+        return None
+    rows = index[-2]
+    if not isinstance(rows, slice):
+        return None
+    start, stop, step = rows.indices(shape[-2])
+    chunk_rows = chunks[-2]
+    if step != 1 or stop - start <= chunk_rows:
+        return None
+    # Band edges fall on chunk boundaries so no chunk is read twice
+    edges = [start] + list(range((start // chunk_rows + 1) * chunk_rows, stop, chunk_rows)) + [stop]
+    return [index[:-2] + (slice(a, b), index[-1]) for a, b in zip(edges[:-1], edges[1:])]
+
+
+# --------------------------------------------------------------------------
+# netCDF4-like view of a Zarr store
+# --------------------------------------------------------------------------
+class ZarrDimension:
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def isunlimited(self):
+        return False
+
+
+class ZarrVariable:
+    """One Zarr array with the parts of netCDF4.Variable the viewer uses.
+
+    As with netCDF4, indexing returns a masked array with packed values
+    unpacked unless set_auto_mask/set_auto_scale turned that off. Handles
+    are shared between threads, so those settings are kept per thread.
+    """
+
+    def __init__(self, name, array):
+        self._array = array
+        self._attributes = dict(array.attrs)
+        self._local = threading.local()
+        self.name = name
+        self.dimensions = tuple(self._attributes.pop("_ARRAY_DIMENSIONS", ()))
+        self.shape = array.shape
+        self.dtype = array.dtype
+        self.datatype = array.dtype
+        self.ndim = array.ndim
+        self.size = array.size
+
+    def __getattr__(self, name):
+        # Only called for names that are not real attributes
+        if not name.startswith("_") or name in TYPED_ATTRIBUTES:
+            try:
+                return self.getncattr(name)
+            except KeyError:
+                pass
+        raise AttributeError(name)
+
+    # Attributes ----------------------------------------------------------
+    def ncattrs(self):
+        return list(self._attributes)
+
+    def getncattr(self, name):
+        value = self._attributes[name]
+        if name in TYPED_ATTRIBUTES:
+            value = np.asarray(value, dtype=self.dtype)
+            return value if value.ndim else value[()]
+        return np.asarray(value) if isinstance(value, list) else value
+
+    # Storage -------------------------------------------------------------
+    def chunking(self):
+        return list(self._array.chunks)
+
+    def get_var_chunk_cache(self):
+        # Chunks are separate files cached by the operating system, so there
+        # is no HDF5-style chunk cache to size; report one as big as possible
+        return (2 ** 63 - 1, 0, 0.75)
+
+    def set_var_chunk_cache(self, size=None, nelems=None, preemption=None):
+        pass
+
+    # Masking and scaling -------------------------------------------------
+    @property
+    def mask(self):
+        return getattr(self._local, "mask", True)
+
+    @property
+    def scale(self):
+        return getattr(self._local, "scale", True)
+
+    def set_auto_mask(self, value):
+        self._local.mask = bool(value)
+
+    def set_auto_scale(self, value):
+        self._local.scale = bool(value)
+
+    def set_auto_maskandscale(self, value):
+        self.set_auto_mask(value)
+        self.set_auto_scale(value)
+
+    # Reading -------------------------------------------------------------
+    def __getitem__(self, index):
+        raw = np.asarray(self._read(index))
+        if not (self.mask or self.scale) or raw.dtype.kind not in "iuf":
+            return raw
+
+        data = raw
+        if self.scale and ("scale_factor" in self._attributes or "add_offset" in self._attributes):
+            data = raw * self._attributes.get("scale_factor", 1.0) + self._attributes.get("add_offset", 0.0)
+        if not self.mask:
+            return data
+        invalid = invalid_values(self, raw)
+        return np.ma.masked_array(data, mask=np.ma.nomask if invalid is None else invalid)
+
+    def _read(self, index):
+        index = index if isinstance(index, tuple) else (index,)
+        bands = _row_bands(index, self.shape, self._array.chunks)
+        if bands is None or getattr(settings, "NETCDF_ZARR_READ_THREADS", 4) < 2:
+            return self._array[index]
+        # Result axis of the rows: dimensions given as ints are dropped
+        axis = sum(1 for i in index[:-2] if isinstance(i, slice))
+        parts = list(_get_read_pool().map(self._array.__getitem__, bands))
+        return np.concatenate(parts, axis=axis)
+
+
+# Group attribute in which write_zarr records the variables' order
+VARIABLE_ORDER_ATTRIBUTE = "_VARIABLE_ORDER"
+
+
+class ZarrDataset:
+    """A consolidated Zarr group with the parts of netCDF4.Dataset the viewer uses."""
+
+    def __init__(self, group):
+        self._group = group
+        self._attributes = dict(group.attrs)
+        # Zarr lists arrays alphabetically; stores written by write_zarr
+        # record the source file's order (stores from elsewhere keep Zarr's)
+        order = self._attributes.pop(VARIABLE_ORDER_ATTRIBUTE, None)
+        arrays = dict(group.arrays())
+        names = [name for name in order or [] if name in arrays]
+        names += [name for name in arrays if name not in names]
+        self.variables = {}
+        self.dimensions = {}
+        for name in names:
+            var = ZarrVariable(name, arrays[name])
+            self.variables[name] = var
+            for dim, size in zip(var.dimensions, var.shape):
+                self.dimensions.setdefault(dim, ZarrDimension(dim, size))
+
+    def ncattrs(self):
+        return list(self._attributes)
+
+    def getncattr(self, name):
+        value = self._attributes[name]
+        return np.asarray(value) if isinstance(value, list) else value
+
+    def close(self):
+        # The store keeps no open files between reads
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
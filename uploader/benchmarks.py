@@ -0,0 +1,229 @@
+# uploader/benchmarks.py
+
+# --------------------------------------------------------------------------
+# Benchmarks of the viewer's hot paths on synthetic NetCDF files
+# --------------------------------------------------------------------------
+# Run with "python manage.py benchmark" (see management/commands). For each
+# combination of size, chunking, compression level and data type a
+# synthetic file is written and these stages are timed:
+#
+#   upload        POST of a new file through the upload form (incl. ingest)
+#   metadata      extract_metadata_from_path
+#   slice_read    one time step read from an open file
+#   downsample    reduction of that slice to display resolution
+#   figure        building the Plotly heatmap and its HTML from that
+#   page          full viewer request through the test client (cold caches)
+#   slice_api     full slice API request through the test client (cold caches)
+#
+# Every stage is repeated and summarised as percentiles in milliseconds.
+# Results can be saved as a JSON baseline and later runs compared against
+# it to spot regressions.
+
+import datetime
+import itertools
+import os
+import platform
+import tempfile
+import time
+
+import numpy as np
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, override_settings
+from django.urls import reverse
+from netCDF4 import Dataset
+
+from .ingest import extract_metadata_from_path
+from .lod import downsample_to
+from .models import NetCDFFile
+from .response_cache import payload_cache, slice_cache
+from .slicing import read_time_slice
+
+# (time steps, rows, cols) of each size
+SIZES = {
+    "tiny": (4, 32, 32),
+    "small": (12, 256, 256),
+    "medium": (24, 1024, 1024),
+    "large": (48, 2048, 2048),
+}
+
+# How the data variable is laid out on disk
+CHUNKINGS = ("contiguous", "step", "block")
+
+DTYPES = ("f4", "i2")
+
+STAGES = ("upload", "metadata", "slice_read", "downsample", "figure", "page", "slice_api")
+
+PERCENTILES = (50, 90, 99)
+
+
+def benchmark_cases(sizes, chunkings, compression_levels, dtypes):
+    """Every valid combination of the options, as a list of case dicts.
+
+    Compression needs chunked storage, so compressed contiguous cases are
+    left out.
+    """
+    cases = []
+    for size, chunking, level, dtype in itertools.product(sizes, chunkings, compression_levels, dtypes):
+        if chunking == "contiguous" and level:
+            continue
+        cases.append({
+            "name": f"{size}-{chunking}-z{level}-{dtype}",
+            "size": size, "chunking": chunking, "complevel": level, "dtype": dtype,
+        })
+    return cases
+
+
+def make_synthetic_file(path, case, copy=0):
+    """Write a (time, lat, lon) reflectivity file for a benchmark case.
+
+    copy is stored as an attribute so copies have different contents (the
+    upload stage would otherwise be deduplicated after the first upload).
+    """
+    steps, rows, cols = SIZES[case["size"]]
+    options = {}
+    if case["chunking"] == "contiguous":
+        options["contiguous"] = True
+    else:
+        chunks = (1, rows, cols) if case["chunking"] == "step" else (min(8, steps), min(256, rows), min(256, cols))
+        options.update(chunksizes=chunks, zlib=bool(case["complevel"]), complevel=case["complevel"] or 1)
+    if case["dtype"] == "i2":
+        options["fill_value"] = np.int16(-32768)
+
+    with Dataset(path, "w", format="NETCDF4") as ds:
+        ds.benchmark_copy = copy
+        ds.createDimension("time", steps)
+        ds.createDimension("lat", rows)
+        ds.createDimension("lon", cols)
+        times = ds.createVariable("time", "f8", ("time",))
+        times.units = "minutes since 2025-12-06 00:00:00"
+        times[:] = np.arange(steps) * 5
+        ds.createVariable("lat", "f4", ("lat",))[:] = np.linspace(-10, 10, rows)
+        ds.createVariable("lon", "f4", ("lon",))[:] = np.linspace(-10, 10, cols)
+
+        var = ds.createVariable("reflectivity", case["dtype"], ("time", "lat", "lon"), **options)
+        if case["dtype"] == "i2":
+            # Packed the way radar products often are
+            var.scale_factor = np.float32(0.01)
+            var.add_offset = np.float32(0)
+
+        # A smooth moving pattern plus noise, written one step at a time
+        rng = np.random.default_rng(copy)
+        y, x = np.meshgrid(np.linspace(0, 6, rows), np.linspace(0, 6, cols), indexing="ij")
+        for t in range(steps):
+            field = 25 + 20 * np.sin(x + t / 4) * np.cos(y) + rng.normal(0, 2, (rows, cols))
+            var[t] = field.astype(np.float32)
+    return path
+
+
+def summarise(samples):
+    """Percentiles, mean and count of timings given in seconds, in ms."""
+    values = np.asarray(samples) * 1000
+    summary = {f"p{p}": round(float(np.percentile(values, p)), 3) for p in PERCENTILES}
+    summary["mean"] = round(float(values.mean()), 3)
+    summary["n"] = len(values)
+    return summary
+
+
+def _timed(samples, func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    samples.append(time.perf_counter() - start)
+    return result
+
+
+def _request(samples, method, *args):
+    """Time one test client request; error responses stop the benchmark."""
+    response = _timed(samples, method, *args)
+    if response.status_code >= 400:
+        raise RuntimeError(f"{args[0]} answered {response.status_code}")
+    return response
+
+
+def _clear_caches():
+    slice_cache.clear()
+    payload_cache.clear()
+
+
+def run_case(case, repeat, workdir):
+    """Time every stage of one case; returns {stage: summary}."""
+    # Imported here: views import this app's models, which must be ready
+    from .views import DISPLAY_MAX_SIZE, render_heatmap
+
+    samples = {stage: [] for stage in STAGES}
+    steps = SIZES[case["size"]][0]
+    client = Client()
+
+    # upload: distinct copies so none of them is deduplicated
+    for copy in range(repeat):
+        path = make_synthetic_file(os.path.join(workdir, f"{case['name']}-{copy}.nc"), case, copy)
+        with open(path, "rb") as f:
+            upload = SimpleUploadedFile(os.path.basename(path), f.read())
+        os.unlink(path)
+        _request(samples["upload"], client.post, reverse("upload_netcdf"), {"file": upload})
+    nc_file = NetCDFFile.objects.latest("id")
+    path = nc_file.file.path
+
+    with Dataset(path, "r") as ds:
+        for i in range(repeat):
+            _timed(samples["metadata"], extract_metadata_from_path, path)
+            data = _timed(samples["slice_read"], read_time_slice, ds, "reflectivity", i % steps)
+            reduced, _ = _timed(
+                samples["downsample"], downsample_to, data, DISPLAY_MAX_SIZE, DISPLAY_MAX_SIZE, "mean"
+            )
+            # Already at display size, so this times the figure alone
+            _timed(samples["figure"], render_heatmap, reduced, "reflectivity", i % steps, "mean", {})
+
+    slice_url = reverse("slice_api", args=[nc_file.id, "reflectivity"])
+    for i in range(repeat):
+        _clear_caches()
+        _request(samples["page"], client.post, reverse("upload_netcdf"), {
+            "existing_file_id": nc_file.id, "variable": "reflectivity", "time_idx": i % steps,
+        })
+        _clear_caches()
+        _request(samples["slice_api"], client.get, slice_url, {"time": i % steps, "max_size": DISPLAY_MAX_SIZE})
+
+    return {stage: summarise(values) for stage, values in samples.items()}
+
+
+def run_benchmarks(cases, repeat=5, progress=None):
+    """Run every case and return the results document (JSON-ready).
+
+    Needs a database to write to; the management command sets up a
+    throwaway one. Uploaded files go to a temporary MEDIA_ROOT.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir, override_settings(
+        MEDIA_ROOT=workdir, THUMBNAIL_ROOT=os.path.join(workdir, "thumbnails"),
+        NETCDF_INGEST_ASYNC=False, THUMBNAIL_WORKERS=0,
+    ):
+        for case in cases:
+            if progress:
+                progress(case["name"])
+            results[case["name"]] = run_case(case, repeat, workdir)
+    return {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "repeat": repeat,
+        "cases": results,
+    }
+
+
+def compare_results(current, baseline, tolerance=0.2, min_ms=1.0, statistic="p50"):
+    """Stages that got slower than the baseline allows.
+
+    A stage regresses when its statistic exceeds the baseline's by more
+    than tolerance (a fraction) and by more than min_ms milliseconds, so
+    tiny timings do not trip on noise. Returns a list of
+    (case, stage, baseline ms, current ms) tuples.
+    """
+    regressions = []
+    for name, stages in current["cases"].items():
+        for stage, summary in stages.items():
+            before = baseline.get("cases", {}).get(name, {}).get(stage)
+            if before is None:
+                continue
+            old, new = before[statistic], summary[statistic]
+            if new > old * (1 + tolerance) and new - old > min_ms:
+                regressions.append((name, stage, old, new))
+    return regressions
@@ -0,0 +1,286 @@
+# uploader/bulk.py
+
+# --------------------------------------------------------------------------
+# Bulk upload and batch ingest of many files at once
+# --------------------------------------------------------------------------
+# Onboarding a campaign means thousands of files, so instead of one upload
+# (and a handful of queries) per file, files go through four stages:
+#
+#   1. inspect   Every file is hashed and its header read (the metadata
+#                ingest.py would extract, without reading any data) in a
+#                pool of worker processes. Files that are not NetCDF, or
+#                have nothing to plot, fail here.
+#   2. place     Valid files are copied into MEDIA_ROOT/netcdf/ by a small
+#                thread pool, or - for files already inside MEDIA_ROOT -
+#                registered where they are.
+#   3. save      NetCDFFile rows and their metadata are inserted with
+#                bulk_create, NETCDF_BULK_BATCH_SIZE files at a time, one
+#                transaction per batch. They are ingested straight away.
+#   4. ingest    When statistics are enabled (NETCDF_INGEST_STATISTICS),
+#                the stored files' data is scanned for them on the same
+#                worker processes, after every file has been inspected.
+#                A file whose scan fails is kept, without statistics.
+#                The upload API skips this stage and schedules each
+#                file's statistics in the background instead (see
+#                ingest.submit_statistics), so the request returns once
+#                the files are saved.
+#
+# Contents already stored (same SHA-256, with the file still in storage,
+# see uploads.find_duplicates) are reported as duplicates and not stored
+# again. A file that fails is recorded in the
+# report with its error; the rest of the batch carries on.
+#
+# Used by the multi-file upload API (views.bulk_upload) and by
+# "python manage.py ingest_netcdf <dir>".
+
+import hashlib
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+import django
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from .ingest import (
+    extract_metadata_from_path, save_statistics, statistics_enabled, statistics_from_path,
+)
+from .models import NetCDFDimension, NetCDFFile, NetCDFTimeStep, NetCDFVariable
+from .uploads import CHUNK_SIZE, find_duplicates
+
+logger = logging.getLogger(__name__)
+
+
+def bulk_workers():
+    """Number of worker processes inspecting files."""
+    return getattr(settings, "NETCDF_BULK_WORKERS", 4)
+
+
+def bulk_options():
+    return {
+        "copy_workers": getattr(settings, "NETCDF_BULK_COPY_WORKERS", 4),
+        "batch_size": getattr(settings, "NETCDF_BULK_BATCH_SIZE", 500),
+    }
+
+
+class BulkReport:
+    """What happened to each file of a bulk ingest, and how fast it went."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.created = []
+        self.duplicates = []
+        self.failed = []
+        self.bytes = 0
+
+    @property
+    def seconds(self):
+        return time.perf_counter() - self.start
+
+    def as_dict(self):
+        seconds = self.seconds
+        files = len(self.created) + len(self.duplicates)
+        return {
+            "created": [{"id": nc_file.id, "name": nc_file.file.name} for nc_file in self.created],
+            "duplicates": [{"id": file_id, "name": label} for label, file_id in self.duplicates],
+            "failed": [{"name": label, "error": error} for label, error in self.failed],
+            "seconds": round(seconds, 3),
+            "files_per_second": round(files / seconds, 2) if seconds else None,
+            "megabytes_per_second": round(self.bytes / 1e6 / seconds, 2) if seconds else None,
+        }
+
+    def summary(self):
+        report = self.as_dict()
+        return (
+            f"{len(self.created)} stored, {len(self.duplicates)} duplicate(s), "
+            f"{len(self.failed)} failed in {report['seconds']:.1f} s "
+            f"({report['files_per_second']} files/s, {report['megabytes_per_second']} MB/s)"
+        )
+
+
+# --------------------------------------------------------------------------
+# Stage 1: inspecting files (runs in the worker processes)
+# --------------------------------------------------------------------------
+def inspect_file(path, sha256=None):
+    """Hash a file and read its header metadata; raises if it cannot be viewed.
+
+    sha256 can be passed when it is already known (uploads are hashed as
+    they arrive).
+    """
+    if sha256 is None:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+        sha256 = digest.hexdigest()
+    metadata = extract_metadata_from_path(path)
+    if not any(var["is_plottable"] for var in metadata["variables"]):
+        raise ValueError("No variable with two or more dimensions to plot")
+    return {"sha256": sha256, "size": os.path.getsize(path), "metadata": metadata}
+
+
+# --------------------------------------------------------------------------
+# Stage 2: placing files in storage (runs on threads)
+# --------------------------------------------------------------------------
+def copy_into_storage(path, name):
+    """Copy a file into MEDIA_ROOT/netcdf/ as name; returns the storage name."""
+    field = NetCDFFile._meta.get_field("file")
+    with open(path, "rb") as f:
+        # Storage picks a free name itself, so parallel copies never clash
+        return default_storage.save(field.generate_filename(None, name), File(f))
+
+
+def register_in_place(path, name=None):
+    """Storage name of a file already inside MEDIA_ROOT."""
+    relative = os.path.relpath(os.path.abspath(path), os.path.abspath(settings.MEDIA_ROOT))
+    if relative.startswith(os.pardir + os.sep) or os.path.isabs(relative):
+        raise SuspiciousFileOperation("Only files inside MEDIA_ROOT can be registered in place")
+    return relative.replace(os.sep, "/")
+
+
+# --------------------------------------------------------------------------
+# Stage 3: saving rows
+# --------------------------------------------------------------------------
+def _save_batch(entries):
+    """Insert NetCDFFile rows and their metadata for (name, info) entries."""
+    now = timezone.now()
+    with transaction.atomic():
+        rows = NetCDFFile.objects.bulk_create([
+            NetCDFFile(
+                file=name, sha256=info["sha256"], size=info["size"],
+                ingest_status=NetCDFFile.INGEST_DONE, ingested_at=now,
+            )
+            for name, info in entries
+        ])
+        pairs = [(row, info["metadata"]) for row, (_, info) in zip(rows, entries)]
+        NetCDFDimension.objects.bulk_create(
+            (NetCDFDimension(file=row, **dim) for row, metadata in pairs for dim in metadata["dimensions"]),
+            batch_size=5000,
+        )
+        NetCDFVariable.objects.bulk_create(
+            (NetCDFVariable(file=row, **var) for row, metadata in pairs for var in metadata["variables"]),
+            batch_size=5000,
+        )
+        NetCDFTimeStep.objects.bulk_create(
+            (NetCDFTimeStep(file=row, **step) for row, metadata in pairs for step in metadata["times"]),
+            batch_size=5000,
+        )
+    return rows
+
+
+# --------------------------------------------------------------------------
+# The whole pipeline
+# --------------------------------------------------------------------------
+def bulk_ingest(files, pool, place=copy_into_storage, copy_workers=4, batch_size=500,
+                progress=None, statistics=True):
+    """Inspect, place and save many files; returns a BulkReport.
+
+    files      -- (path, name, sha256 or None) for every file; name is what
+                  the file is stored as and reported under
+    pool       -- process pool the files are inspected in
+    place      -- copy_into_storage or register_in_place
+    progress   -- optional callable given the report after every batch
+    statistics -- False skips stage 4; the caller schedules it instead
+    """
+    report = BulkReport()
+    futures = {pool.submit(inspect_file, path, sha256): (path, name) for path, name, sha256 in files}
+
+    pending = []
+    seen = set()
+    repeats = []
+    with ThreadPoolExecutor(max_workers=copy_workers, thread_name_prefix="netcdf-bulk-copy") as copier:
+        for future in as_completed(futures):
+            path, name = futures[future]
+            try:
+                info = future.result()
+            except Exception as exc:
+                report.failed.append((name, str(exc)))
+                continue
+            # The same contents twice in one run are stored once
+            if info["sha256"] in seen:
+                repeats.append((name, info["sha256"]))
+                continue
+            seen.add(info["sha256"])
+            pending.append((path, name, info))
+            if len(pending) >= batch_size:
+                _flush(pending, place, copier, report)
+                pending = []
+                if progress is not None:
+                    progress(report)
+        if pending:
+            _flush(pending, place, copier, report)
+            if progress is not None:
+                progress(report)
+
+    if repeats:
+        stored = _stored_ids([sha256 for _, sha256 in repeats])
+        report.duplicates.extend((name, stored.get(sha256)) for name, sha256 in repeats)
+    if statistics and statistics_enabled():
+        _compute_statistics(report.created, pool)
+    return report
+
+
+def _compute_statistics(rows, pool):
+    """Stage 4: scan the stored files for their statistics on the pool."""
+    futures = {pool.submit(statistics_from_path, row.file.path): row for row in rows}
+    for future in as_completed(futures):
+        row = futures[future]
+        try:
+            save_statistics(row, future.result())
+        except Exception:
+            logger.exception("Statistics of %s failed", row)
+
+
+def _stored_ids(hashes):
+    """{sha256: id of the stored file with those contents}, as uploads.py finds it."""
+    return {sha256: nc_file.id for sha256, nc_file in find_duplicates(hashes).items()}
+
+
+def _flush(pending, place, copier, report):
+    """Place and save one batch of inspected files."""
+    known = _stored_ids([info["sha256"] for _, _, info in pending])
+    new = []
+    for path, name, info in pending:
+        if info["sha256"] in known:
+            report.duplicates.append((name, known[info["sha256"]]))
+        else:
+            new.append((path, name, info))
+
+    placed = []
+    futures = {copier.submit(place, path, name): (name, info) for path, name, info in new}
+    for future in as_completed(futures):
+        name, info = futures[future]
+        try:
+            placed.append((future.result(), name, info))
+        except Exception as exc:
+            report.failed.append((name, str(exc)))
+
+    try:
+        report.created.extend(_save_batch([(stored, info) for stored, _, info in placed]))
+    except Exception as exc:
+        # Copies of a batch that could not be saved are removed again
+        for stored, name, _ in placed:
+            if place is copy_into_storage:
+                default_storage.delete(stored)
+            report.failed.append((name, str(exc)))
+        return
+    report.bytes += sum(info["size"] for _, _, info in placed)
+
+
+# --------------------------------------------------------------------------
+# The process pool used by the upload API
+# --------------------------------------------------------------------------
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        # Workers started with "spawn" (Windows) must set Django up first
+        _executor = ProcessPoolExecutor(max_workers=bulk_workers(), initializer=django.setup)
+    return _executor
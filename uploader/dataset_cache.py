@@ -0,0 +1,150 @@
+# uploader/dataset_cache.py
+
+# --------------------------------------------------------------------------
+# A small per-process cache of open Dataset handles
+# --------------------------------------------------------------------------
+# Opening a NetCDF/HDF5 file means parsing all of its metadata again, which
+# for multi-GB files is far slower than reading a single 2D slice. The viewer
+# therefore keeps recently used files open and hands the same handle to the
+# next request that asks for the same file.
+#
+# Entries are keyed by (file id, path, modification time) so a file that is
+# replaced on disk, or by an optimised copy (see optimize.py), is reopened
+# automatically. Files are opened with their storage backend (backends.py).
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+
+from django.conf import settings
+
+from .backends import backend_for
+from .instrumentation import span
+
+
+class _CacheEntry:
+    """One open Dataset plus the bookkeeping needed to share it safely."""
+
+    def __init__(self, dataset, thread_safe=False):
+        self.dataset = dataset
+        # netCDF4 handles are not thread-safe, so only one request may use a
+        # given handle at a time. Zarr handles are shared freely.
+        self.lock = nullcontext() if thread_safe else threading.RLock()
+        self.users = 0
+        self.last_used = time.monotonic()
+        self.evicted = False
+
+
+class DatasetCache:
+    """Bounded, thread-safe LRU cache of open Dataset handles.
+
+    max_open     -- maximum number of files kept open at once
+    idle_timeout -- seconds after which an unused handle is closed
+    """
+
+    def __init__(self, max_open=8, idle_timeout=300):
+        self.max_open = max_open
+        self.idle_timeout = idle_timeout
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    # ----------------------------------------------------------------------
+    # Public API
+    # ----------------------------------------------------------------------
+    @contextmanager
+    def open(self, nc_file):
+        """Yield an open Dataset for a NetCDFFile, reusing a cached handle."""
+        path = nc_file.data_path
+        key = (nc_file.pk, path, os.path.getmtime(path))
+        with span("open"):
+            entry = self._acquire(key, path)
+        try:
+            with entry.lock:
+                yield entry.dataset
+        finally:
+            self._release(entry)
+
+    def stats(self):
+        """Return the hit/miss counters and the number of open handles."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "open": len(self._entries),
+            }
+
+    def clear(self):
+        """Close every idle handle and forget all entries."""
+        with self._lock:
+            for key in list(self._entries):
+                self._evict(key)
+
+    # ----------------------------------------------------------------------
+    # Internal helpers (always called with self._lock held unless noted)
+    # ----------------------------------------------------------------------
+    def _acquire(self, key, path):
+        with self._lock:
+            self._expire_idle()
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                entry.users += 1
+                return entry
+            self.misses += 1
+
+        # Open outside the lock so a slow open does not block other files
+        backend = backend_for(path)
+        dataset = backend.open(path)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                # Another request opened the same file while we were busy
+                dataset.close()
+            else:
+                # Drop handles for older versions of the same file
+                for stale in [k for k in self._entries if k[0] == key[0]]:
+                    self._evict(stale)
+                entry = _CacheEntry(dataset, backend.thread_safe)
+                self._entries[key] = entry
+                while len(self._entries) > self.max_open:
+                    self._evict(next(iter(self._entries)))
+            entry.users += 1
+            return entry
+
+    def _release(self, entry):
+        with self._lock:
+            entry.users -= 1
+            entry.last_used = time.monotonic()
+            if entry.evicted and entry.users == 0:
+                entry.dataset.close()
+
+    def _evict(self, key):
+        entry = self._entries.pop(key)
+        entry.evicted = True
+        self.evictions += 1
+        # Handles still in use are closed by the last request to release them
+        if entry.users == 0:
+            entry.dataset.close()
+
+    def _expire_idle(self):
+        cutoff = time.monotonic() - self.idle_timeout
+        for key, entry in list(self._entries.items()):
+            if entry.users == 0 and entry.last_used < cutoff:
+                self._evict(key)
+
+
+# --------------------------------------------------------------------------
+# The shared cache used by the viewer
+# --------------------------------------------------------------------------
+dataset_cache = DatasetCache(
+    max_open=getattr(settings, "NETCDF_CACHE_MAX_OPEN", 8),
+    idle_timeout=getattr(settings, "NETCDF_CACHE_IDLE_TIMEOUT", 300),
+)
@@ -0,0 +1,103 @@
+# uploader/encoding.py
+
+# --------------------------------------------------------------------------
+# Compact binary encoding of 2D slices for the slice API
+# --------------------------------------------------------------------------
+# Sending a slice as JSON text costs roughly 10-20 bytes per value. The API
+# instead sends raw little-endian numbers after a fixed 32-byte header,
+# which the browser can wrap in a typed array without any parsing.
+#
+# Header layout (little-endian, 32 bytes):
+#
+#   offset  size  field
+#   0       4     magic  b"NCS1"
+#   4       1     dtype  0 = float32, 1 = float16, 2 = uint8 (quantised)
+#   5       1     ndim   always 2
+#   6       2     frames number of slices that follow (1 for a single slice)
+#   8       4     rows
+#   12      4     cols
+#   16      8     scale  (uint8 only) value = offset + q * scale
+#   24      8     offset (uint8 only)
+#
+# For uint8, the code 255 marks a missing (NaN) value.
+
+import struct
+
+import numpy as np
+
+from .instrumentation import span
+
+MAGIC = b"NCS1"
+HEADER = struct.Struct("<4sBBHIIdd")
+
+ENCODINGS = {
+    "float32": 0,
+    "float16": 1,
+    "uint8": 2,
+}
+
+# Quantised values use 0..254; 255 is reserved for NaN
+UINT8_NAN = 255
+
+
+def encode_frames(frames, encoding="float32"):
+    """Encode a 3D array (frames, rows, cols) as header + payload bytes."""
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unknown encoding {encoding!r}")
+    with span("encode"):
+        return _encode(frames, encoding)
+
+
+def _encode(frames, encoding):
+
+    frames = np.asarray(frames, dtype=np.float32)
+    n_frames, rows, cols = frames.shape
+    scale, offset = 1.0, 0.0
+
+    if encoding == "float32":
+        payload = frames.astype("<f4", copy=False)
+    elif encoding == "float16":
+        payload = frames.astype("<f2")
+    else:
+        finite = np.isfinite(frames)
+        if finite.any():
+            lo = float(frames[finite].min())
+            hi = float(frames[finite].max())
+        else:
+            lo, hi = 0.0, 0.0
+        scale = (hi - lo) / (UINT8_NAN - 1) or 1.0
+        offset = lo
+        quantised = np.rint((np.where(finite, frames, lo) - lo) / scale)
+        payload = np.where(finite, quantised, UINT8_NAN).astype(np.uint8)
+
+    header = HEADER.pack(
+        MAGIC, ENCODINGS[encoding], 2, n_frames, rows, cols, scale, offset
+    )
+    return header + payload.tobytes()
+
+
+def encode_slice(data2d, encoding="float32"):
+    """Encode a single 2D slice."""
+    return encode_frames(np.asarray(data2d)[np.newaxis, ...], encoding)
+
+
+def decode_frames(payload):
+    """Decode bytes produced by encode_frames back into a float32 array.
+
+    Used by the tests and by Python clients of the API.
+    """
+    magic, dtype, _, n_frames, rows, cols, scale, offset = HEADER.unpack_from(payload)
+    if magic != MAGIC:
+        raise ValueError("Not a slice payload")
+    body = payload[HEADER.size:]
+    shape = (n_frames, rows, cols)
+
+    if dtype == ENCODINGS["float32"]:
+        return np.frombuffer(body, dtype="<f4").reshape(shape)
+    if dtype == ENCODINGS["float16"]:
+        return np.frombuffer(body, dtype="<f2").astype(np.float32).reshape(shape)
+
+    codes = np.frombuffer(body, dtype=np.uint8).reshape(shape)
+    values = (offset + codes * scale).astype(np.float32)
+    values[codes == UINT8_NAN] = np.nan
+    return values
@@ -0,0 +1,428 @@
+# uploader/export.py
+
+# --------------------------------------------------------------------------
+# Streaming export of a subset: variables x time range x lat/lon box
+# --------------------------------------------------------------------------
+# Instead of downloading a whole upload, users can ask for just the part
+# they need, as NetCDF4, CSV or a zipped Zarr store. The subset is written
+# in blocks of a few time steps (whole HDF5 chunks, at most
+# NETCDF_EXPORT_BLOCK_BYTES) and each block is handed to the client before
+# the next one is read, so memory use stays the same however large the
+# subset is.
+#
+#   - CSV rows and Zarr chunks go straight into the response as they are
+#     made. The Zarr store is zipped on the fly; its chunks are
+#     zlib-compressed Zarr v2 chunks, readable by zarr and xarray.
+#   - netCDF4 can only write to real files, so NetCDF exports are NOT
+#     streamed: the whole subset is written block by block to a temporary
+#     file (memory still stays bounded) and only then sent and deleted. The
+#     client waits for the whole file to be written and the server needs
+#     the disk space for it, so NetCDF subsets larger than
+#     NETCDF_EXPORT_NETCDF_MAX_BYTES are refused before anything is written
+#     (see check_export_size). CSV and Zarr have no such limit.
+#
+# An export opens its own handle on the file rather than borrowing one from
+# dataset_cache: a handle is locked while in use, and holding a shared one
+# for the length of a download would stall every other request for that
+# file. At most NETCDF_EXPORT_MAX_CONCURRENT exports run at once.
+
+import csv
+import io
+import json
+import os
+import tempfile
+import threading
+import zipfile
+import zlib
+
+import numpy as np
+from django.conf import settings
+from netCDF4 import Dataset
+
+from .backends import open_dataset
+from .ingest import decode_times
+from .slicing import hyperslab, read_values, time_dimension, tune_chunk_cache
+
+# Output formats: content type and file name suffix
+FORMATS = {
+    "nc": ("application/x-netcdf", ".nc"),
+    "csv": ("text/csv", ".csv"),
+    "zarr": ("application/zip", ".zarr.zip"),
+}
+
+# Slots for exports running at the same time, shared by this process
+export_slots = threading.BoundedSemaphore(getattr(settings, "NETCDF_EXPORT_MAX_CONCURRENT", 4))
+
+# Attributes that describe how values are packed in the source file; the
+# exported values are already unpacked float32 with NaN gaps
+_PACKING_ATTRIBUTES = {
+    "_FillValue", "missing_value", "scale_factor", "add_offset",
+    "valid_min", "valid_max", "valid_range",
+}
+
+
+class ExportError(ValueError):
+    """Raised when a requested subset does not fit the file."""
+
+
+class ExportTooLarge(ExportError):
+    """Raised when a subset is too large for the chosen format."""
+
+
+# --------------------------------------------------------------------------
+# Planning
+# --------------------------------------------------------------------------
+def _coordinates(ds, dim):
+    """Values of a dimension's coordinate variable, or its indices."""
+    if dim in ds.variables and ds.variables[dim].dimensions == (dim,):
+        return np.ma.filled(np.ma.asarray(ds.variables[dim][:], dtype=float), np.nan)
+    return np.arange(len(ds.dimensions[dim]), dtype=float)
+
+
+def _box_range(values, low, high, name):
+    """Index range (start, stop) of the coordinate values inside [low, high]."""
+    if low is None and high is None:
+        return 0, len(values)
+    inside = np.flatnonzero(
+        (values >= (-np.inf if low is None else low)) & (values <= (np.inf if high is None else high))
+    )
+    if not len(inside):
+        raise ExportError(f"The box contains no {name} values")
+    return int(inside[0]), int(inside[-1]) + 1
+
+
+def plan_export(ds, var_names, start=None, stop=None, bbox=None, selection=None):
+    """Work out which part of the file an export covers.
+
+    var_names must share their dimensions. start/stop limit the time axis
+    (steps start..stop-1), bbox gives optional lat_min/lat_max/lon_min/
+    lon_max bounds on the last two dimensions, and selection fixes any
+    other dimension. Returns plain data describing the subset; raises
+    ExportError (or IndexError for selections) when it does not fit.
+    """
+    if not var_names:
+        raise ExportError("Choose at least one variable")
+    for name in var_names:
+        if name not in ds.variables or len(ds.variables[name].dimensions) < 2:
+            raise ExportError(f"No plottable variable {name!r}")
+    dims = ds.variables[var_names[0]].dimensions
+    if any(ds.variables[name].dimensions != dims for name in var_names):
+        raise ExportError("The variables must have the same dimensions")
+
+    var = ds.variables[var_names[0]]
+    time_dim = time_dimension(dims)
+    steps = var.shape[dims.index(time_dim)] if time_dim else 1
+    start = 0 if start is None else start
+    stop = steps if stop is None else min(stop, steps)
+    if not 0 <= start < stop:
+        raise ExportError(f"time range {start}:{stop} outside 0:{steps}")
+
+    # Check the selection now, before any response has started
+    selection = {d: i for d, i in (selection or {}).items() if d in dims and d != time_dim}
+    hyperslab(var, selection)
+
+    bbox = bbox or {}
+    y_dim, x_dim = dims[-2:]
+    y_values, x_values = _coordinates(ds, y_dim), _coordinates(ds, x_dim)
+    y0, y1 = _box_range(y_values, bbox.get("lat_min"), bbox.get("lat_max"), y_dim)
+    x0, x1 = _box_range(x_values, bbox.get("lon_min"), bbox.get("lon_max"), x_dim)
+
+    times = []
+    if time_dim is not None:
+        time_values = _coordinates(ds, time_dim)[start:stop]
+        stamps = [None] * len(time_values)
+        if time_dim in ds.variables and ds.variables[time_dim].dimensions == (time_dim,):
+            stamps = decode_times(ds.variables[time_dim])[start:stop]
+        times = [
+            stamp.isoformat() if stamp is not None else value
+            for stamp, value in zip(stamps, time_values.tolist())
+        ]
+
+    return {
+        "variables": list(var_names),
+        "dimensions": list(dims),
+        "time_dim": time_dim,
+        "start": start,
+        "stop": stop,
+        "times": times,
+        "selection": selection,
+        "box": (y0, y1, x0, x1),
+        "y": y_values[y0:y1].tolist(),
+        "x": x_values[x0:x1].tolist(),
+        "attributes": {name: _attributes(ds.variables[name]) for name in var_names},
+        "coordinate_attributes": {
+            dim: _attributes(ds.variables[dim])
+            for dim in (time_dim, y_dim, x_dim) if dim in ds.variables
+        },
+        "block": _block_length(var, time_dim, y1 - y0, x1 - x0, len(var_names)),
+    }
+
+
+def export_bytes(plan):
+    """Size of the subset's values as exported (float32)."""
+    steps = plan["stop"] - plan["start"] if plan["time_dim"] else 1
+    return steps * len(plan["y"]) * len(plan["x"]) * 4 * len(plan["variables"])
+
+
+def check_export_size(fmt, plan):
+    """Raise ExportTooLarge for NetCDF subsets over NETCDF_EXPORT_NETCDF_MAX_BYTES."""
+    limit = getattr(settings, "NETCDF_EXPORT_NETCDF_MAX_BYTES", 2 * 1024 ** 3)
+    if fmt == "nc" and export_bytes(plan) > limit:
+        raise ExportTooLarge(
+            f"The subset is {export_bytes(plan)} bytes; NetCDF exports are limited to "
+            f"{limit} bytes. Choose a smaller subset or the csv or zarr format."
+        )
+
+
+def _attributes(var):
+    return {
+        key: var.getncattr(key) for key in var.ncattrs() if key not in _PACKING_ATTRIBUTES
+    }
+
+
+def _block_length(var, time_dim, rows, cols, count):
+    """Time steps per block: whole chunks, within the block byte budget."""
+    if time_dim is None:
+        return 1
+    chunking = var.chunking()
+    chunk = 1 if chunking == "contiguous" else chunking[var.dimensions.index(time_dim)]
+    budget = getattr(settings, "NETCDF_EXPORT_BLOCK_BYTES", 32 * 1024 * 1024)
+    return max(chunk, budget // max(1, rows * cols * 4 * count) // chunk * chunk)
+
+
+def time_blocks(plan):
+    """(start, stop) of each block of time steps, aligned to whole blocks."""
+    if plan["time_dim"] is None:
+        return [(0, 1)]
+    block = plan["block"]
+    edges = list(range(plan["start"] - plan["start"] % block + block, plan["stop"], block))
+    bounds = [plan["start"], *edges, plan["stop"]]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def read_block(ds, plan, name, t0, t1):
+    """Steps t0..t1-1 of a variable inside the box, as (steps, rows, cols) float32."""
+    var = ds.variables[name]
+    tune_chunk_cache(var)
+    time_range = (t0, t1) if plan["time_dim"] is not None else None
+    index = list(hyperslab(var, plan["selection"], time_range))
+    y0, y1, x0, x1 = plan["box"]
+    index[-2:] = [slice(y0, y1), slice(x0, x1)]
+    data = read_values(var, tuple(index))
+    return data.reshape(-1, y1 - y0, x1 - x0)
+
+
+# --------------------------------------------------------------------------
+# Writers (generators of response chunks)
+# --------------------------------------------------------------------------
+def stream_csv(path, plan):
+    """One row per time step and cell: time, y, x and each variable."""
+    y_dim, x_dim = plan["dimensions"][-2:]
+    ys = np.repeat(plan["y"], len(plan["x"])).tolist()
+    xs = np.tile(plan["x"], len(plan["y"])).tolist()
+
+    text = io.StringIO()
+    writer = csv.writer(text)
+    writer.writerow([plan["time_dim"] or "time", y_dim, x_dim, *plan["variables"]])
+    yield text.getvalue().encode()
+
+    with open_dataset(path) as ds:
+        for t0, t1 in time_blocks(plan):
+            blocks = [read_block(ds, plan, name, t0, t1) for name in plan["variables"]]
+            for step in range(len(blocks[0])):
+                text.seek(0)
+                text.truncate()
+                label = plan["times"][t0 + step - plan["start"]] if plan["times"] else ""
+                columns = [
+                    [None if v != v else v for v in block[step].ravel().tolist()]
+                    for block in blocks
+                ]
+                writer.writerows(zip([label] * len(ys), ys, xs, *columns))
+                yield text.getvalue().encode()
+
+
+def stream_netcdf(path, plan, piece_size=1024 * 1024):
+    """Write the subset to a temporary NetCDF4 file, then stream that file.
+
+    Nothing is sent until the whole file is written; check_export_size
+    must have accepted the plan first.
+    """
+    fd, tmp = tempfile.mkstemp(suffix=".nc")
+    os.close(fd)
+    try:
+        with open_dataset(path) as ds, Dataset(tmp, "w", format="NETCDF4") as out:
+            _write_netcdf(ds, out, plan)
+        with open(tmp, "rb") as f:
+            while True:
+                piece = f.read(piece_size)
+                if not piece:
+                    break
+                yield piece
+    finally:
+        os.unlink(tmp)
+
+
+def _write_netcdf(ds, out, plan):
+    time_dim = plan["time_dim"]
+    y_dim, x_dim = plan["dimensions"][-2:]
+    dims = (time_dim, y_dim, x_dim) if time_dim else (y_dim, x_dim)
+    sizes = {time_dim: plan["stop"] - plan["start"], y_dim: len(plan["y"]), x_dim: len(plan["x"])}
+    for dim in dims:
+        out.createDimension(dim, sizes[dim])
+
+    # Coordinates, then the variables themselves, one block at a time
+    coordinates = {y_dim: plan["y"], x_dim: plan["x"]}
+    if time_dim:
+        coordinates[time_dim] = _coordinates(ds, time_dim)[plan["start"]:plan["stop"]]
+    for dim, values in coordinates.items():
+        coord = out.createVariable(dim, "f8", (dim,))
+        coord.setncatts(plan["coordinate_attributes"].get(dim, {}))
+        coord[:] = values
+
+    chunks = (min(plan["block"], sizes[time_dim]),) if time_dim else ()
+    for name in plan["variables"]:
+        var = out.createVariable(
+            name, "f4", dims, zlib=True, complevel=1, fill_value=np.float32(np.nan),
+            chunksizes=chunks + (sizes[y_dim], sizes[x_dim]),
+        )
+        var.setncatts(plan["attributes"][name])
+
+    for t0, t1 in time_blocks(plan):
+        for name in plan["variables"]:
+            data = read_block(ds, plan, name, t0, t1)
+            if time_dim:
+                out.variables[name][t0 - plan["start"]:t1 - plan["start"]] = data
+            else:
+                out.variables[name][:] = data[0]
+
+
+class _Drain:
+    """Write-only stream whose contents are collected and handed on."""
+
+    def __init__(self):
+        self.pieces = []
+
+    def write(self, data):
+        self.pieces.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data, self.pieces = b"".join(self.pieces), []
+        return data
+
+
+def _zarr_array(shape, chunks, dimensions, attributes):
+    """.zarray and .zattrs documents of a Zarr v2 float array."""
+    zarray = {
+        "zarr_format": 2,
+        "shape": list(shape),
+        "chunks": list(chunks),
+        "dtype": "<f4" if len(shape) > 1 else "<f8",
+        "compressor": {"id": "zlib", "level": 1},
+        "fill_value": "NaN",
+        "order": "C",
+        "filters": None,
+    }
+    # _ARRAY_DIMENSIONS is how xarray finds dimension names in Zarr
+    zattrs = dict(_jsonable_attributes(attributes), _ARRAY_DIMENSIONS=list(dimensions))
+    return json.dumps(zarray), json.dumps(zattrs)
+
+
+def _jsonable_attributes(attributes):
+    result = {}
+    for key, value in attributes.items():
+        if isinstance(value, np.ndarray):
+            value = value.tolist()
+        elif isinstance(value, np.generic):
+            value = value.item()
+        result[key] = value
+    return result
+
+
+def stream_zarr(path, plan):
+    """A Zarr v2 store in a zip, written and sent one chunk at a time."""
+    drain = _Drain()
+    time_dim = plan["time_dim"]
+    y_dim, x_dim = plan["dimensions"][-2:]
+    rows, cols = len(plan["y"]), len(plan["x"])
+    steps = plan["stop"] - plan["start"]
+    block = plan["block"]
+
+    # Chunks are already compressed, so the zip only stores them
+    with zipfile.ZipFile(drain, "w", compression=zipfile.ZIP_STORED) as store:
+        store.writestr(".zgroup", json.dumps({"zarr_format": 2}))
+        store.writestr(".zattrs", json.dumps({}))
+
+        coordinates = {y_dim: np.asarray(plan["y"]), x_dim: np.asarray(plan["x"])}
+        if time_dim:
+            with open_dataset(path) as ds:
+                coordinates[time_dim] = _coordinates(ds, time_dim)[plan["start"]:plan["stop"]]
+        for dim, values in coordinates.items():
+            zarray, zattrs = _zarr_array(
+                values.shape, values.shape, [dim], plan["coordinate_attributes"].get(dim, {})
+            )
+            store.writestr(f"{dim}/.zarray", zarray)
+            store.writestr(f"{dim}/.zattrs", zattrs)
+            store.writestr(f"{dim}/0", zlib.compress(values.astype("<f8").tobytes(), 1))
+        yield drain.take()
+
+        shape = (steps, rows, cols) if time_dim else (rows, cols)
+        chunks = (block, rows, cols) if time_dim else (rows, cols)
+        dims = [time_dim, y_dim, x_dim] if time_dim else [y_dim, x_dim]
+        for name in plan["variables"]:
+            zarray, zattrs = _zarr_array(shape, chunks, dims, plan["attributes"][name])
+            store.writestr(f"{name}/.zarray", zarray)
+            store.writestr(f"{name}/.zattrs", zattrs)
+
+        # Zarr chunk i holds exported steps i*block .. (i+1)*block-1, so the
+        # blocks are counted from the first exported step here
+        with open_dataset(path) as ds:
+            for number, c0 in enumerate(range(0, steps, block)):
+                t0 = plan["start"] + c0
+                t1 = min(t0 + block, plan["stop"])
+                for name in plan["variables"]:
+                    data = read_block(ds, plan, name, t0, t1)
+                    if time_dim:
+                        # Edge chunks are stored at full size, padded with NaN
+                        padded = np.full(chunks, np.nan, dtype="<f4")
+                        padded[:len(data)] = data
+                        key = f"{name}/{number}.0.0"
+                    else:
+                        padded, key = data[0].astype("<f4"), f"{name}/0.0"
+                    store.writestr(key, zlib.compress(padded.tobytes(), 1))
+                yield drain.take()
+    yield drain.take()
+
+
+WRITERS = {"nc": stream_netcdf, "csv": stream_csv, "zarr": stream_zarr}
+
+
+class ExportStream:
+    """Response body for an export that frees its slot once it is closed.
+
+    Django closes the response when the download finishes or the client
+    goes away, even if the body was never iterated.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.released = False
+
+    def __iter__(self):
+        return self.chunks
+
+    def close(self):
+        self.chunks.close()
+        if not self.released:
+            self.released = True
+            export_slots.release()
+
+
+def start_export(fmt, path, plan):
+    """An ExportStream for the subset, or None when all slots are busy."""
+    if not export_slots.acquire(blocking=False):
+        return None
+    return ExportStream(WRITERS[fmt](path, plan))
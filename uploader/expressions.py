@@ -0,0 +1,283 @@
+# uploader/expressions.py
+
+# --------------------------------------------------------------------------
+# Derived variables: small arithmetic expressions over a file's variables
+# --------------------------------------------------------------------------
+# Lets the viewer plot quantities that are not stored in the file, e.g.
+#
+#     sqrt(u**2 + v**2)                         wind speed
+#     reflectivity - mean(reflectivity, time)   anomaly from the time mean
+#     where(rain > 0.1, rain, 0)
+#
+# Expressions are parsed with Python's own parser, but only the node types
+# listed below are accepted - names, numbers, arithmetic, comparisons and
+# the functions in FUNCTIONS/REDUCTIONS. Anything else (attribute access,
+# subscripts, lambdas, imports, ...) is rejected before anything runs, so
+# an expression can never reach Python objects outside this module.
+#
+# Each expression is parsed and compiled once into a tree of NumPy calls.
+# Evaluating it reads only the 2D slab being displayed from each variable
+# it names. Reductions like mean(var, time) cannot come from one slab; they
+# stream through the variable in chunk-aligned blocks and their result is
+# cached; a reduction along time is then reused for every time step.
+
+import ast
+import functools
+
+import numpy as np
+from django.conf import settings
+
+from .response_cache import slice_cache
+from .slicing import (
+    hyperslab, read_time_slice, read_values, selector_dimensions, time_dimension, tune_chunk_cache,
+)
+
+# Longest expression accepted, in characters and in parsed nodes
+MAX_LENGTH = 500
+MAX_NODES = 100
+
+FUNCTIONS = {
+    "abs": np.abs,
+    "sqrt": np.sqrt,
+    "exp": np.exp,
+    "log": np.log,
+    "log10": np.log10,
+    "sin": np.sin,
+    "cos": np.cos,
+    "tan": np.tan,
+    "arctan2": np.arctan2,
+    "hypot": np.hypot,
+    "minimum": np.fmin,
+    "maximum": np.fmax,
+    "where": np.where,
+}
+
+# Reductions along a dimension, written e.g. mean(var, time)
+REDUCTIONS = ("mean", "min", "max", "sum", "std")
+
+_BINARY = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: np.true_divide,
+    ast.Pow: np.power,
+    ast.Mod: np.mod,
+}
+_UNARY = {ast.USub: np.negative, ast.UAdd: np.positive}
+_COMPARE = {
+    ast.Lt: np.less,
+    ast.LtE: np.less_equal,
+    ast.Gt: np.greater,
+    ast.GtE: np.greater_equal,
+    ast.Eq: np.equal,
+    ast.NotEq: np.not_equal,
+}
+
+
+class ExpressionError(ValueError):
+    """Raised for expressions that are invalid or do not fit the file."""
+
+
+# --------------------------------------------------------------------------
+# Compiling
+# --------------------------------------------------------------------------
+class Expression:
+    """A parsed expression, ready to be evaluated against open files.
+
+    text is the expression in a normalised spelling (used in cache keys),
+    variables the names it reads and reductions its (how, variable, dim)
+    reductions. base_variable, the first variable named, decides the time
+    axis and the other dimensions the result is plotted along.
+    """
+
+    def __init__(self, source):
+        if len(source) > MAX_LENGTH:
+            raise ExpressionError(f"Expressions are limited to {MAX_LENGTH} characters")
+        try:
+            tree = ast.parse(source.strip(), mode="eval")
+        except SyntaxError as exc:
+            raise ExpressionError(f"Invalid expression: {exc.msg}")
+        if sum(1 for _ in ast.walk(tree)) > MAX_NODES:
+            raise ExpressionError("Expression is too long")
+
+        self.text = ast.unparse(tree)
+        self.variables = []
+        self.reductions = []
+        self._evaluate = self._compile(tree.body)
+        if not self.variables:
+            raise ExpressionError("An expression must use at least one variable")
+        self.base_variable = self.variables[0]
+
+    def _use(self, name):
+        if name not in self.variables:
+            self.variables.append(name)
+
+    def _compile(self, node):
+        """Turn an AST node into a function of an _Inputs object."""
+        if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+            # Always float, so powers of large numbers cannot run away
+            value = np.float64(node.value)
+            return lambda inputs: value
+
+        if isinstance(node, ast.Name):
+            name = node.id
+            self._use(name)
+            return lambda inputs: inputs.load(name)
+
+        if isinstance(node, ast.BinOp) and type(node.op) in _BINARY:
+            op = _BINARY[type(node.op)]
+            left, right = self._compile(node.left), self._compile(node.right)
+            return lambda inputs: op(left(inputs), right(inputs))
+
+        if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY:
+            op = _UNARY[type(node.op)]
+            operand = self._compile(node.operand)
+            return lambda inputs: op(operand(inputs))
+
+        if isinstance(node, ast.Compare) and len(node.ops) == 1 and type(node.ops[0]) in _COMPARE:
+            op = _COMPARE[type(node.ops[0])]
+            left, right = self._compile(node.left), self._compile(node.comparators[0])
+            return lambda inputs: op(left(inputs), right(inputs))
+
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+            name = node.func.id
+            if name in REDUCTIONS:
+                return self._compile_reduction(name, node.args)
+            if name in FUNCTIONS:
+                function = FUNCTIONS[name]
+                args = [self._compile(arg) for arg in node.args]
+                return lambda inputs: function(*(arg(inputs) for arg in args))
+            raise ExpressionError(f"Unknown function {name!r}")
+
+        raise ExpressionError(f"Not allowed in expressions: {ast.unparse(node)!r}")
+
+    def _compile_reduction(self, how, args):
+        # The variable and dimension must be plain names, e.g. mean(t2m, time)
+        if len(args) != 2 or not all(isinstance(arg, ast.Name) for arg in args):
+            raise ExpressionError(f"Use {how}(<variable>, <dimension>)")
+        name, dim = args[0].id, args[1].id
+        self._use(name)
+        self.reductions.append((how, name, dim))
+        return lambda inputs: inputs.reduce(how, name, dim)
+
+    def check(self, variables):
+        """Check the expression against a file's catalogue variables.
+
+        Every name must be a plottable variable, the variables must share
+        their spatial shape and reductions must be along a non-spatial
+        dimension of their variable.
+        """
+        plottable = {v["name"]: v for v in variables if v["is_plottable"]}
+        for name in self.variables:
+            if name not in plottable:
+                raise ExpressionError(f"No plottable variable {name!r}")
+        shapes = {tuple(plottable[name]["shape"][-2:]) for name in self.variables}
+        if len(shapes) > 1:
+            raise ExpressionError("The variables do not share one spatial grid")
+        for how, name, dim in self.reductions:
+            if dim not in selector_dimensions(plottable[name]["dimensions"]):
+                raise ExpressionError(f"{name} has no dimension {dim!r} to take the {how} along")
+
+    def evaluate(self, ds, time_idx, selection=None, cache_key=None):
+        """The expression's 2D result at one time step, as float32 with NaN gaps.
+
+        cache_key identifies the file version so reductions can be reused
+        across time steps; without it they are recomputed.
+        """
+        inputs = _Inputs(ds, time_idx, selection or {}, cache_key)
+        try:
+            with np.errstate(all="ignore"):
+                result = self._evaluate(inputs)
+            shape = inputs.load(self.base_variable).shape
+            return np.array(np.broadcast_to(result, shape), dtype=np.float32)
+        except (KeyError, TypeError, ValueError) as exc:
+            raise ExpressionError(f"Could not evaluate {self.text!r}: {exc}")
+
+
+@functools.lru_cache(maxsize=256)
+def compile_expression(source):
+    """Parse and compile an expression once; raises ExpressionError."""
+    return Expression(source)
+
+
+# --------------------------------------------------------------------------
+# Evaluating
+# --------------------------------------------------------------------------
+class _Inputs:
+    """Reads the slabs and reductions one evaluation needs, each at most once."""
+
+    def __init__(self, ds, time_idx, selection, cache_key):
+        self.ds = ds
+        self.time_idx = time_idx
+        self.selection = selection
+        self.cache_key = cache_key
+        self.slabs = {}
+
+    def load(self, name):
+        if name not in self.slabs:
+            self.slabs[name] = read_time_slice(self.ds, name, self.time_idx, self.selection)
+        return self.slabs[name]
+
+    def reduce(self, how, name, dim):
+        # Along any dimension but time, the reduction is taken at this step
+        fixed = dict(self.selection)
+        time_dim = time_dimension(self.ds.variables[name].dimensions)
+        if time_dim is not None:
+            fixed[time_dim] = self.time_idx
+        fixed.pop(dim, None)
+        if self.cache_key is None:
+            return reduce_along(self.ds, name, dim, how, fixed)
+        key = f"{self.cache_key}:reduce:{how}:{name}:{dim}:{sorted(fixed.items())}"
+        return slice_cache.get_or_compute(key, lambda: reduce_along(self.ds, name, dim, how, fixed))
+
+
+def reduce_along(ds, var_name, dim, how, selection=None):
+    """Reduce a variable along one dimension, reading it in blocks.
+
+    selection fixes the other non-spatial dimensions. Blocks are whole
+    chunks along dim, as many as fit in NETCDF_DERIVED_BLOCK_BYTES, so each
+    chunk is decompressed once. NaN cells are skipped; cells that are NaN
+    at every step give NaN. Returns a read-only float32 (rows, cols) array.
+    """
+    var = ds.variables[var_name]
+    axis = list(var.dimensions).index(dim)
+    size = var.shape[axis]
+    rows, cols = var.shape[-2:]
+    chunking = var.chunking()
+    chunk = 1 if chunking == "contiguous" else chunking[axis]
+    budget = getattr(settings, "NETCDF_DERIVED_BLOCK_BYTES", 64 * 1024 * 1024)
+    block = max(chunk, budget // (rows * cols * 4) // chunk * chunk)
+
+    index = list(hyperslab(var, {d: i for d, i in (selection or {}).items() if d != dim}))
+    tune_chunk_cache(var)
+    count = np.zeros((rows, cols), dtype=np.int64)
+    total = np.zeros((rows, cols), dtype=np.float64)
+    squares = np.zeros((rows, cols), dtype=np.float64)
+    low = np.full((rows, cols), np.nan)
+    high = np.full((rows, cols), np.nan)
+    for start in range(0, size, block):
+        index[axis] = slice(start, min(start + block, size))
+        data = read_values(var, tuple(index)).astype(np.float64)
+        valid = np.isfinite(data)
+        values = np.where(valid, data, 0.0)
+        count += valid.sum(axis=0)
+        total += values.sum(axis=0)
+        if how == "std":
+            squares += (values * values).sum(axis=0)
+        elif how == "min":
+            low = np.fmin(low, np.fmin.reduce(data, axis=0))
+        elif how == "max":
+            high = np.fmax(high, np.fmax.reduce(data, axis=0))
+
+    with np.errstate(all="ignore"):
+        mean = total / count
+        result = {
+            "mean": mean,
+            "sum": np.where(count > 0, total, np.nan),
+            "min": low,
+            "max": high,
+            "std": np.sqrt(np.maximum(squares / count - mean * mean, 0)),
+        }[how]
+    result = result.astype(np.float32)
+    result.setflags(write=False)
+    return result
@@ -5,7 +5,7 @@ from django import forms
 
 # Import the NetCDFFile model that we defined in models.py
 # This model represents the NetCDF files stored in the database
-from .models import NetCDFFile
+from .models import NetCDFCollection, NetCDFFile
 
 # --------------------------------------------------------------------------
 # Define a form class for uploading NetCDF files
@@ -24,6 +24,22 @@ class NetCDFUploadForm(forms.ModelForm):
         # In this case, we only want the 'file' field so the user can upload a NetCDF file
         fields = ['file']
 
+
+# --------------------------------------------------------------------------
+# Form for combining uploaded files into a collection
+# --------------------------------------------------------------------------
+# The member files are ticked from the uploaded files; their order in the
+# collection comes from their time axes, not from the order ticked.
+class NetCDFCollectionForm(forms.ModelForm):
+    files = forms.ModelMultipleChoiceField(
+        queryset=NetCDFFile.objects.order_by('-uploaded_at'),
+        widget=forms.CheckboxSelectMultiple,
+    )
+
+    class Meta:
+        model = NetCDFCollection
+        fields = ['name']
+
 # --------------------------------------------------------------------------
 # How this works:
 # --------------------------------------------------------------------------
@@ -0,0 +1,307 @@
+# uploader/ingest.py
+
+# --------------------------------------------------------------------------
+# Metadata ingest: read a NetCDF file's structure once and store it
+# --------------------------------------------------------------------------
+# Without this, every page view re-reads the variable list, dimensions and
+# the whole time axis from the file. The ingest stage reads them once, right
+# after upload, and saves them in the NetCDFDimension / NetCDFVariable /
+# NetCDFTimeStep tables, together with per-variable statistics
+# (NetCDFVariableStatistics, see stats.py).
+#
+# Uploads are ingested on a small background thread pool so the upload
+# request does not wait. The backfill_metadata management command uses the
+# same functions to ingest files that were uploaded before this existed.
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .backends import open_dataset
+from .dataset_cache import dataset_cache
+from .models import (
+    NetCDFDimension, NetCDFFile, NetCDFTimeStep, NetCDFVariable, NetCDFVariableStatistics,
+)
+from .optimize import finish_waiting_optimize
+from .stats import compute_file_statistics
+from .time_axis import decode_epochs, epochs_to_datetimes
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, "NETCDF_INGEST_WORKERS", 2),
+    thread_name_prefix="netcdf-ingest",
+)
+
+
+# --------------------------------------------------------------------------
+# Reading metadata from an open file
+# --------------------------------------------------------------------------
+def _jsonable(value):
+    """Convert NetCDF attribute values (often NumPy types) to JSON types."""
+    if isinstance(value, np.ndarray):
+        return [_jsonable(v) for v in value.tolist()]
+    if isinstance(value, np.generic):
+        return _jsonable(value.item())
+    if isinstance(value, bytes):
+        return value.decode("utf-8", "replace")
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    return value
+
+
+def decode_times(time_var):
+    """Return a list of timezone-aware datetimes (or None) for a time variable.
+
+    Times can only be decoded when the variable has CF-style units such as
+    "days since 2025-12-06" and a real-world calendar.
+    """
+    epochs = decode_epochs(
+        time_var[:], getattr(time_var, "units", None), getattr(time_var, "calendar", "standard")
+    )
+    return epochs_to_datetimes(epochs)
+
+
+def extract_metadata(ds, include_statistics=False, include_times=True):
+    """Describe an open Dataset as plain Python data (no database access).
+
+    With include_statistics the plottable variables are also scanned once
+    to compute their statistics (see stats.py).
+    """
+    dimensions = [
+        {"name": name, "size": len(dim), "is_unlimited": dim.isunlimited()}
+        for name, dim in ds.dimensions.items()
+    ]
+
+    variables = []
+    for name, var in ds.variables.items():
+        chunking = var.chunking()
+        is_coordinate = var.dimensions == (name,)
+        info = {
+            "name": name,
+            "dimensions": list(var.dimensions),
+            "shape": list(var.shape),
+            "dtype": str(var.dtype),
+            "chunking": None if chunking == "contiguous" else list(chunking),
+            "attributes": {k: _jsonable(var.getncattr(k)) for k in var.ncattrs()},
+            "is_plottable": len(var.dimensions) >= 2,
+            "is_coordinate": is_coordinate,
+            "min_value": None,
+            "max_value": None,
+        }
+        if is_coordinate and var.size and np.issubdtype(var.dtype, np.number):
+            values = np.ma.filled(np.ma.asarray(var[:], dtype=float), np.nan)
+            if np.isfinite(values).any():
+                info["min_value"] = float(np.nanmin(values))
+                info["max_value"] = float(np.nanmax(values))
+        variables.append(info)
+
+    times = []
+    if include_times and "time" in ds.variables:
+        time_var = ds.variables["time"]
+        values = np.ma.filled(np.ma.asarray(time_var[:], dtype=float), np.nan)
+        for index, (value, stamp) in enumerate(zip(values.tolist(), decode_times(time_var))):
+            times.append({"index": index, "value": value, "timestamp": stamp})
+
+    metadata = {"dimensions": dimensions, "variables": variables, "times": times}
+    if include_statistics:
+        metadata["statistics"] = compute_file_statistics(ds)
+    return metadata
+
+
+def extract_metadata_from_path(path, include_statistics=False):
+    """Open a file just long enough to extract its metadata.
+
+    Kept at module level so it can be sent to a process pool.
+    """
+    with open_dataset(path) as ds:
+        return extract_metadata(ds, include_statistics)
+
+
+def statistics_from_path(path):
+    """Statistics of every plottable variable of a file (see stats.py).
+
+    Kept at module level so it can be sent to a process pool.
+    """
+    with open_dataset(path) as ds:
+        return compute_file_statistics(ds)
+
+
+def statistics_enabled():
+    """Whether ingest should also compute variable statistics."""
+    return getattr(settings, "NETCDF_INGEST_STATISTICS", True)
+
+
+# --------------------------------------------------------------------------
+# Saving metadata
+# --------------------------------------------------------------------------
+def save_metadata(nc_file, metadata):
+    """Replace the stored metadata of nc_file with freshly extracted values."""
+    with transaction.atomic():
+        nc_file.dimensions.all().delete()
+        nc_file.variables.all().delete()
+        nc_file.time_steps.all().delete()
+
+        NetCDFDimension.objects.bulk_create(
+            NetCDFDimension(file=nc_file, **dim) for dim in metadata["dimensions"]
+        )
+        NetCDFVariable.objects.bulk_create(
+            NetCDFVariable(file=nc_file, **var) for var in metadata["variables"]
+        )
+        NetCDFTimeStep.objects.bulk_create(
+            (NetCDFTimeStep(file=nc_file, **step) for step in metadata["times"]),
+            batch_size=5000,
+        )
+        if "statistics" in metadata:
+            save_statistics(nc_file, metadata["statistics"])
+
+        nc_file.ingest_status = NetCDFFile.INGEST_DONE
+        nc_file.ingest_error = ""
+        nc_file.ingested_at = timezone.now()
+        nc_file.save(update_fields=["ingest_status", "ingest_error", "ingested_at"])
+
+
+def save_statistics(nc_file, statistics):
+    """Store the output of compute_file_statistics for nc_file's variables."""
+    variables = {v.name: v for v in nc_file.variables.filter(name__in=statistics)}
+    rows = []
+    for name, var_stats in statistics.items():
+        rows.append(NetCDFVariableStatistics(variable=variables[name], **var_stats["global"]))
+        rows.extend(
+            NetCDFVariableStatistics(variable=variables[name], time_index=index, **step)
+            for index, step in enumerate(var_stats["steps"])
+        )
+    NetCDFVariableStatistics.objects.bulk_create(rows, batch_size=5000)
+
+
+def mark_failed(nc_file, error):
+    nc_file.ingest_status = NetCDFFile.INGEST_FAILED
+    nc_file.ingest_error = str(error)
+    nc_file.save(update_fields=["ingest_status", "ingest_error"])
+
+
+def ingest_file(nc_file):
+    """Extract and store the metadata of one NetCDFFile.
+
+    Failures are recorded on the row rather than raised, so one bad file
+    never stops a batch.
+    """
+    nc_file.ingest_status = NetCDFFile.INGEST_RUNNING
+    nc_file.save(update_fields=["ingest_status"])
+    try:
+        # A private handle: the statistics pass reads every value, and doing
+        # that on the shared cached handle would block the viewer's reads
+        # of this file until it finished
+        metadata = extract_metadata_from_path(nc_file.data_path, statistics_enabled())
+        save_metadata(nc_file, metadata)
+    except Exception as exc:
+        logger.exception("Ingest of %s failed", nc_file)
+        mark_failed(nc_file, exc)
+    # An optimised copy finished during the ingest takes over now
+    return finish_waiting_optimize(nc_file)
+
+
+def add_statistics(nc_file):
+    """Compute and store the statistics of an already ingested NetCDFFile.
+
+    Used for files whose metadata was saved without them (bulk uploads).
+    Failures are logged; the file stays usable without statistics.
+    """
+    try:
+        save_statistics(nc_file, statistics_from_path(nc_file.data_path))
+    except Exception:
+        logger.exception("Statistics of %s failed", nc_file)
+    return nc_file
+
+
+def _statistics_in_background(file_id):
+    try:
+        nc_file = NetCDFFile.objects.filter(id=file_id).first()
+        if nc_file is not None:
+            add_statistics(nc_file)
+    finally:
+        connection.close()
+
+
+def submit_statistics(nc_file):
+    """Schedule add_statistics the same way submit_ingest schedules ingest."""
+    if getattr(settings, "NETCDF_INGEST_ASYNC", True):
+        transaction.on_commit(lambda: _executor.submit(_statistics_in_background, nc_file.id))
+    else:
+        add_statistics(nc_file)
+
+
+def _ingest_in_background(file_id):
+    try:
+        nc_file = NetCDFFile.objects.filter(id=file_id).first()
+        if nc_file is not None:
+            ingest_file(nc_file)
+    finally:
+        # Worker threads get their own database connection; release it
+        connection.close()
+
+
+def submit_ingest(nc_file):
+    """Schedule ingest of a newly uploaded file.
+
+    With NETCDF_INGEST_ASYNC the work runs on a background thread once the
+    current transaction commits; otherwise it runs immediately.
+    """
+    if getattr(settings, "NETCDF_INGEST_ASYNC", True):
+        transaction.on_commit(lambda: _executor.submit(_ingest_in_background, nc_file.id))
+    else:
+        ingest_file(nc_file)
+
+
+# --------------------------------------------------------------------------
+# Reading metadata back for the viewer
+# --------------------------------------------------------------------------
+def get_catalogue(nc_file, ds=None, include_times=True):
+    """Return the file's metadata, from the database when it was ingested.
+
+    Files that have not been ingested yet (or failed) are read directly,
+    using ds if the caller already has the file open. Without
+    include_times "times" is left empty; callers that need the time axis
+    of a long file should use time_axis.py instead.
+    """
+    if nc_file.is_ingested:
+        return {
+            "dimensions": list(nc_file.dimensions.values(
+                "name", "size", "is_unlimited")),
+            "variables": list(nc_file.variables.values(
+                "name", "dimensions", "shape", "dtype", "chunking", "attributes",
+                "is_plottable", "is_coordinate", "min_value", "max_value")),
+            "times": list(nc_file.time_steps.values("index", "value", "timestamp"))
+            if include_times else [],
+        }
+    if ds is not None:
+        return extract_metadata(ds, include_times=include_times)
+    with dataset_cache.open(nc_file) as ds:
+        return extract_metadata(ds, include_times=include_times)
+
+
+def get_statistics(nc_file, var_name, time_idx=None):
+    """Return stored statistics for a variable, or None if not ingested.
+
+    The result has a "global" entry and, when time_idx is given and the
+    variable has per-step statistics, a "step" entry for that time step.
+    """
+    if not nc_file.is_ingested:
+        return None
+    fields = ("time_index", "count", "nan_count", "min", "max", "mean", "std", "quantiles")
+    rows = NetCDFVariableStatistics.objects.filter(
+        variable__file=nc_file, variable__name=var_name
+    )
+    summary = rows.filter(time_index__isnull=True).values(*fields).first()
+    if summary is None:
+        return None
+    result = {"global": summary, "step": None}
+    if time_idx is not None:
+        result["step"] = rows.filter(time_index=time_idx).values(*fields).first()
+    return result
@@ -0,0 +1,299 @@
+# uploader/instrumentation.py
+
+# --------------------------------------------------------------------------
+# Per-request timings, Prometheus metrics and sampled profiles
+# --------------------------------------------------------------------------
+# With NETCDF_INSTRUMENTATION = True, InstrumentationMiddleware times every
+# request and the viewer's hot paths report what they spent their time on:
+#
+#   db         database queries
+#   open       getting an open Dataset handle (dataset_cache.py)
+#   read       reading slabs out of the file (slicing.py)
+#   downsample reducing slices to display resolution (lod.py)
+#   encode     packing slices for the binary API (encoding.py)
+#   figure     building the Plotly figure
+#   to_html    serialising the figure to HTML
+#   template   rendering the page template
+#
+# Each response gets a Server-Timing header with these durations (browser
+# dev tools show it in the network tab), and the totals are kept in memory
+# for the Prometheus endpoint at /metrics. Every server process keeps its
+# own numbers, so with several workers each one has to be scraped.
+#
+# NETCDF_PROFILE_SAMPLE_RATE > 0 additionally runs that fraction of requests
+# under cProfile (one at a time) and saves the profile to
+# NETCDF_PROFILE_DIR when the request took longer than
+# NETCDF_PROFILE_SLOW_SECONDS. Open the files with pstats or snakeviz.
+# Only sync views are profiled: async views do their work on other threads.
+#
+# When instrumentation is off the middleware removes itself, and a span is
+# a single context variable lookup.
+
+import cProfile
+import contextvars
+import datetime
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.db.backends.signals import connection_created
+
+# Upper bounds (seconds) of the Prometheus histogram buckets
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# The timings of the request being handled in this context (None outside
+# an instrumented request). Context variables follow the request into
+# sync_to_async threads and the read pool of async_reads.py.
+_current = contextvars.ContextVar("netcdf_request_timings", default=None)
+
+
+class RequestTimings:
+    """Durations per stage and bytes read by one request."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.bytes_read = 0
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        # Work for one request can run on several threads at once
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def add_bytes(self, count):
+        with self._lock:
+            self.bytes_read += count
+
+    def server_timing(self, total):
+        """The Server-Timing header value (durations in milliseconds)."""
+        parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.stages.items()]
+        parts.append(f"total;dur={total * 1000:.1f}")
+        if self.bytes_read:
+            parts.append(f'bytes_read;desc="{self.bytes_read}"')
+        return ", ".join(parts)
+
+
+@contextmanager
+def span(stage):
+    """Time the enclosed block as part of the current request's stage."""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(stage, time.perf_counter() - start)
+
+
+def record_bytes_read(count):
+    """Count bytes read from files by the current request."""
+    timings = _current.get()
+    if timings is not None:
+        timings.add_bytes(count)
+
+
+# --------------------------------------------------------------------------
+# Prometheus metrics
+# --------------------------------------------------------------------------
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.buckets[i] += 1
+
+
+def _labels(**labels):
+    text = ",".join(f'{name}="{value}"' for name, value in labels.items())
+    return "{" + text + "}"
+
+
+class MetricsRegistry:
+    """Request counts, durations and bytes, rendered in Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}
+        self.request_seconds = {}
+        self.stage_seconds = {}
+        self.bytes_read = {}
+        self.bytes_sent = {}
+
+    def observe(self, view, method, status, seconds, timings, bytes_sent):
+        with self._lock:
+            key = (view, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.request_seconds.setdefault(view, Histogram()).observe(seconds)
+            for stage, stage_seconds in timings.stages.items():
+                self.stage_seconds.setdefault((view, stage), Histogram()).observe(stage_seconds)
+            self.bytes_read[view] = self.bytes_read.get(view, 0) + timings.bytes_read
+            self.bytes_sent[view] = self.bytes_sent.get(view, 0) + bytes_sent
+
+    def render(self):
+        lines = []
+        with self._lock:
+            lines.append("# HELP netcdf_viewer_requests_total Requests handled.")
+            lines.append("# TYPE netcdf_viewer_requests_total counter")
+            for (view, method, status), count in sorted(self.requests.items()):
+                lines.append(
+                    f"netcdf_viewer_requests_total{_labels(view=view, method=method, status=status)} {count}"
+                )
+            self._render_histograms(
+                lines, "netcdf_viewer_request_duration_seconds", "Request duration.",
+                {(view,): h for view, h in self.request_seconds.items()}, ("view",),
+            )
+            self._render_histograms(
+                lines, "netcdf_viewer_stage_duration_seconds", "Time per request spent in a stage.",
+                self.stage_seconds, ("view", "stage"),
+            )
+            for name, values, text in (
+                ("netcdf_viewer_bytes_read_total", self.bytes_read, "Bytes of slice data read from files."),
+                ("netcdf_viewer_bytes_sent_total", self.bytes_sent, "Bytes of response bodies sent."),
+            ):
+                lines.append(f"# HELP {name} {text}")
+                lines.append(f"# TYPE {name} counter")
+                for view, count in sorted(values.items()):
+                    lines.append(f"{name}{_labels(view=view)} {count}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _render_histograms(lines, name, text, histograms, label_names):
+        lines.append(f"# HELP {name} {text}")
+        lines.append(f"# TYPE {name} histogram")
+        for key, histogram in sorted(histograms.items()):
+            labels = dict(zip(label_names, key))
+            for bound, count in zip(BUCKETS, histogram.buckets):
+                lines.append(f"{name}_bucket{_labels(**labels, le=bound)} {count}")
+            lines.append(f'{name}_bucket{_labels(**labels, le="+Inf")} {histogram.count}')
+            lines.append(f"{name}_sum{_labels(**labels)} {histogram.sum:.6f}")
+            lines.append(f"{name}_count{_labels(**labels)} {histogram.count}")
+
+    def clear(self):
+        with self._lock:
+            for values in (self.requests, self.request_seconds, self.stage_seconds,
+                           self.bytes_read, self.bytes_sent):
+                values.clear()
+
+
+metrics = MetricsRegistry()
+
+
+def instrumentation_enabled():
+    return getattr(settings, "NETCDF_INSTRUMENTATION", False)
+
+
+# --------------------------------------------------------------------------
+# Database query timing
+# --------------------------------------------------------------------------
+def _time_query(execute, sql, params, many, context):
+    with span("db"):
+        return execute(sql, params, many, context)
+
+
+def _install_query_timer(sender=None, connection=connection, **kwargs):
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+# --------------------------------------------------------------------------
+# Sampled profiling
+# --------------------------------------------------------------------------
+# Only one profiler can be active at a time
+_profile_lock = threading.Lock()
+
+
+def _start_profile():
+    rate = getattr(settings, "NETCDF_PROFILE_SAMPLE_RATE", 0)
+    if not rate or random.random() >= rate or not _profile_lock.acquire(blocking=False):
+        return None
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def _finish_profile(profiler, view, seconds):
+    profiler.disable()
+    try:
+        if seconds >= getattr(settings, "NETCDF_PROFILE_SLOW_SECONDS", 1.0):
+            folder = getattr(settings, "NETCDF_PROFILE_DIR", os.path.join(settings.BASE_DIR, "profiles"))
+            os.makedirs(folder, exist_ok=True)
+            stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+            profiler.dump_stats(os.path.join(folder, f"{stamp}-{view}-{seconds * 1000:.0f}ms.prof"))
+    finally:
+        _profile_lock.release()
+
+
+# --------------------------------------------------------------------------
+# Middleware
+# --------------------------------------------------------------------------
+class InstrumentationMiddleware:
+    """Times requests; add it first in MIDDLEWARE so it covers the others."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not instrumentation_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        # Connections opened from now on time their queries
+        connection_created.connect(_install_query_timer, dispatch_uid="netcdf_query_timer")
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        _install_query_timer()
+        timings = RequestTimings()
+        token = _current.set(timings)
+        profiler = _start_profile()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+            seconds = time.perf_counter() - timings.start
+            if profiler is not None:
+                _finish_profile(profiler, _view_name(request), seconds)
+        return self._finish(request, response, timings, seconds)
+
+    async def __acall__(self, request):
+        timings = RequestTimings()
+        token = _current.set(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, timings, time.perf_counter() - timings.start)
+
+    def _finish(self, request, response, timings, seconds):
+        response["Server-Timing"] = timings.server_timing(seconds)
+        # Streamed bodies (exports) have no length up front and are not counted
+        bytes_sent = 0 if response.streaming else len(response.content)
+        metrics.observe(
+            _view_name(request), request.method, response.status_code, seconds, timings, bytes_sent,
+        )
+        return response
+
+
+def _view_name(request):
+    # URL names keep the number of label values small; anything that did
+    # not resolve (404s for random paths) shares one label
+    match = getattr(request, "resolver_match", None)
+    return match.url_name if match is not None and match.url_name else "unmatched"
@@ -0,0 +1,158 @@
+# uploader/lod.py
+
+# --------------------------------------------------------------------------
+# Level-of-detail (LOD) helpers for large 2D slices
+# --------------------------------------------------------------------------
+# A browser cannot usefully draw more cells than it has pixels, so large
+# slices are reduced on the server before they are sent. Reduction works on
+# whole blocks of cells at once with NumPy (no Python loops over cells).
+#
+# For zoomed views a multi-resolution "pyramid" is built per slice:
+# level 0 is full resolution and every following level halves both axes.
+# Each level is cut into square tiles so a client only fetches the tiles it
+# can see, at the level that matches its zoom.
+
+import math
+import threading
+import warnings
+from concurrent.futures import Future
+
+import numpy as np
+
+from .instrumentation import span
+from .response_cache import ByteBudgetLRU
+
+METHODS = ("mean", "max", "nearest")
+
+
+def block_reduce(data, factor_y, factor_x, method="mean"):
+    """Reduce a 2D array by combining factor_y x factor_x blocks of cells.
+
+    method is one of "mean", "max" (both ignore NaN) or "nearest", which
+    simply keeps the centre cell of every block.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown downsampling method {method!r}")
+    if factor_y == 1 and factor_x == 1:
+        return data
+
+    if method == "nearest":
+        return data[factor_y // 2::factor_y, factor_x // 2::factor_x]
+
+    # Pad with NaN so both axes divide evenly into blocks
+    rows, cols = data.shape
+    out_rows = math.ceil(rows / factor_y)
+    out_cols = math.ceil(cols / factor_x)
+    padded = np.full((out_rows * factor_y, out_cols * factor_x), np.nan, dtype=np.float32)
+    padded[:rows, :cols] = data
+    blocks = padded.reshape(out_rows, factor_y, out_cols, factor_x)
+
+    # Blocks that are entirely NaN legitimately produce NaN; hide the warning
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        if method == "mean":
+            return np.nanmean(blocks, axis=(1, 3))
+        return np.nanmax(blocks, axis=(1, 3))
+
+
+def downsample_factors(shape, max_rows, max_cols):
+    """Return the smallest whole-number factors that fit shape in the limits."""
+    rows, cols = shape
+    return max(1, math.ceil(rows / max_rows)), max(1, math.ceil(cols / max_cols))
+
+
+def downsample_to(data, max_rows, max_cols, method="mean"):
+    """Reduce a 2D array to at most max_rows x max_cols cells.
+
+    Returns (reduced array, (factor_y, factor_x)).
+    """
+    factors = downsample_factors(data.shape, max_rows, max_cols)
+    with span("downsample"):
+        return block_reduce(data, *factors, method=method), factors
+
+
+def block_centres(length, factor):
+    """Index-space coordinates of the centre of each block along one axis.
+
+    Used as heatmap x/y values so axes keep their full-resolution meaning.
+    """
+    count = math.ceil(length / factor)
+    return np.arange(count) * factor + (factor - 1) / 2
+
+
+# --------------------------------------------------------------------------
+# Multi-resolution pyramid
+# --------------------------------------------------------------------------
+class Pyramid:
+    """All reduced levels of one 2D slice, addressable as square tiles."""
+
+    def __init__(self, data, method="mean", tile_size=256):
+        self.method = method
+        self.tile_size = tile_size
+        self.levels = [np.asarray(data, dtype=np.float32)]
+        while max(self.levels[-1].shape) > tile_size:
+            self.levels.append(block_reduce(self.levels[-1], 2, 2, method))
+
+    @property
+    def nbytes(self):
+        return sum(level.nbytes for level in self.levels)
+
+    def tile_counts(self, level):
+        """Return (tiles down, tiles across) for a level."""
+        rows, cols = self.levels[level].shape
+        return math.ceil(rows / self.tile_size), math.ceil(cols / self.tile_size)
+
+    def tile(self, level, tile_y, tile_x):
+        """Return one tile; edge tiles may be smaller than tile_size."""
+        if not 0 <= level < len(self.levels):
+            raise IndexError(f"level {level} out of range")
+        tiles_y, tiles_x = self.tile_counts(level)
+        if not (0 <= tile_y < tiles_y and 0 <= tile_x < tiles_x):
+            raise IndexError(f"tile ({tile_y}, {tile_x}) out of range")
+        size = self.tile_size
+        return self.levels[level][
+            tile_y * size:(tile_y + 1) * size,
+            tile_x * size:(tile_x + 1) * size,
+        ]
+
+
+class PyramidCache:
+    """Thread-safe LRU of built pyramids, bounded by the bytes of their levels.
+
+    A map client asks for many tiles of a new slice at once. Only the first
+    of those requests builds the pyramid; the others wait for that build
+    (as thumbnails.py does for renders) instead of reading the slab again.
+    """
+
+    def __init__(self, max_bytes):
+        self._pyramids = ByteBudgetLRU(max_bytes)
+        self._lock = threading.Lock()
+        self._in_flight = {}
+
+    def get_or_build(self, key, build):
+        """Return the cached pyramid for key, calling build() on a miss.
+
+        Errors raised by build() are raised in every waiting request.
+        """
+        with self._lock:
+            pyramid = self._pyramids.get(key)
+            if pyramid is not None:
+                return pyramid
+            future = self._in_flight.get(key)
+            building = future is None
+            if building:
+                future = self._in_flight[key] = Future()
+        if not building:
+            return future.result()
+
+        try:
+            pyramid = build()
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+        self._pyramids.set(key, pyramid)
+        future.set_result(pyramid)
+        return pyramid
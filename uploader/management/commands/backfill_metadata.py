@@ -0,0 +1,63 @@
+# uploader/management/commands/backfill_metadata.py
+
+# --------------------------------------------------------------------------
+# python manage.py backfill_metadata [--all] [--workers N]
+# --------------------------------------------------------------------------
+# Ingests the metadata of files that were uploaded before the ingest stage
+# existed (or whose ingest failed). Headers are read in parallel in a pool
+# of worker processes; the results are saved from this process.
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand
+
+from uploader.ingest import (
+    extract_metadata_from_path, mark_failed, save_metadata, statistics_enabled,
+)
+from uploader.models import NetCDFFile
+
+
+class Command(BaseCommand):
+    help = "Extract and store metadata for NetCDF files that have not been ingested."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all", action="store_true",
+            help="Re-ingest every file, including ones already ingested.",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=4,
+            help="Number of worker processes reading file headers (default 4).",
+        )
+
+    def handle(self, *args, **options):
+        files = NetCDFFile.objects.all()
+        if not options["all"]:
+            files = files.exclude(ingest_status=NetCDFFile.INGEST_DONE)
+        files = list(files)
+
+        if not files:
+            self.stdout.write("Nothing to ingest.")
+            return
+
+        done = failed = 0
+        with_statistics = statistics_enabled()
+        # Worker processes started with "spawn" (the default on Windows)
+        # must set Django up before they can import the uploader app
+        with ProcessPoolExecutor(max_workers=options["workers"], initializer=django.setup) as pool:
+            futures = {
+                pool.submit(extract_metadata_from_path, nc_file.file.path, with_statistics): nc_file
+                for nc_file in files
+            }
+            for future in as_completed(futures):
+                nc_file = futures[future]
+                try:
+                    save_metadata(nc_file, future.result())
+                    done += 1
+                except Exception as exc:
+                    mark_failed(nc_file, exc)
+                    failed += 1
+                    self.stderr.write(f"{nc_file}: {exc}")
+
+        self.stdout.write(self.style.SUCCESS(f"Ingested {done} file(s), {failed} failed."))
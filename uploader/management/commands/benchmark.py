@@ -0,0 +1,113 @@
+# uploader/management/commands/benchmark.py
+
+# --------------------------------------------------------------------------
+# python manage.py benchmark [--sizes small,medium] [--save FILE] [--baseline FILE]
+# --------------------------------------------------------------------------
+# Times the viewer's hot paths on synthetic files (see uploader/benchmarks.py)
+# and prints the percentiles. Typical use:
+#
+#   python manage.py benchmark --save benchmarks/baseline.json   # once
+#   python manage.py benchmark --baseline benchmarks/baseline.json
+#
+# The second form fails (exit status 1) when a stage got slower than the
+# baseline by more than --tolerance, so it can run in CI.
+#
+# Everything runs against a throwaway test database and a temporary media
+# folder; the real uploads are never touched.
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from uploader.benchmarks import (
+    CHUNKINGS, DTYPES, SIZES, benchmark_cases, compare_results, run_benchmarks,
+)
+
+
+def _list(choices, cast=str):
+    def parse(value):
+        items = [cast(item) for item in value.split(",") if item]
+        for item in items:
+            if choices is not None and item not in choices:
+                raise ValueError(item)
+        return items
+    return parse
+
+
+class Command(BaseCommand):
+    help = "Benchmark upload, reading and rendering on synthetic NetCDF files."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes", type=_list(SIZES), default=["small"],
+            help=f"Comma separated file sizes out of {', '.join(SIZES)} (default small).",
+        )
+        parser.add_argument(
+            "--chunkings", type=_list(CHUNKINGS), default=["step", "block"],
+            help=f"Comma separated layouts out of {', '.join(CHUNKINGS)} (default step,block).",
+        )
+        parser.add_argument(
+            "--compression", type=_list(None, int), default=[0, 4],
+            help="Comma separated zlib levels, 0 for none (default 0,4).",
+        )
+        parser.add_argument(
+            "--dtypes", type=_list(DTYPES), default=["f4"],
+            help=f"Comma separated data types out of {', '.join(DTYPES)} (default f4).",
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=5,
+            help="How often every stage is timed (default 5).",
+        )
+        parser.add_argument("--save", help="Write the results to this JSON file.")
+        parser.add_argument("--baseline", help="Compare the results with this JSON file.")
+        parser.add_argument(
+            "--tolerance", type=float, default=0.2,
+            help="Allowed slowdown against the baseline as a fraction (default 0.2).",
+        )
+
+    def handle(self, *args, **options):
+        cases = benchmark_cases(
+            options["sizes"], options["chunkings"], options["compression"], options["dtypes"]
+        )
+        if not cases:
+            raise CommandError("No benchmark cases for these options.")
+        baseline = None
+        if options["baseline"]:
+            with open(options["baseline"]) as f:
+                baseline = json.load(f)
+
+        # A fresh test database, like "manage.py test" uses
+        setup_test_environment()
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            results = run_benchmarks(
+                cases, options["repeat"],
+                progress=lambda name: self.stdout.write(f"Running {name} ..."),
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        for name, stages in results["cases"].items():
+            self.stdout.write(f"\n{name}")
+            for stage, summary in stages.items():
+                self.stdout.write(
+                    f"  {stage:<12} p50 {summary['p50']:>10.2f} ms   "
+                    f"p90 {summary['p90']:>10.2f} ms   p99 {summary['p99']:>10.2f} ms"
+                )
+
+        if options["save"]:
+            with open(options["save"], "w") as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"\nSaved results to {options['save']}.")
+
+        if baseline is not None:
+            regressions = compare_results(results, baseline, options["tolerance"])
+            if regressions:
+                for name, stage, old, new in regressions:
+                    self.stderr.write(f"Regression: {name} {stage} p50 {old:.2f} ms -> {new:.2f} ms")
+                raise CommandError(f"{len(regressions)} stage(s) slower than the baseline.")
+            self.stdout.write(self.style.SUCCESS("\nNo regressions against the baseline."))
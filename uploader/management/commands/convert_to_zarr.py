@@ -0,0 +1,69 @@
+# uploader/management/commands/convert_to_zarr.py
+
+# --------------------------------------------------------------------------
+# python manage.py convert_to_zarr [--all] [--workers N]
+# --------------------------------------------------------------------------
+# Writes a Zarr store (see uploader/backends.py) for every file that does
+# not have one yet and switches the file over to it. Stores are written
+# from the NetCDF data the viewer used so far (the optimised copy if there
+# is one) in a pool of worker processes; the originals are kept.
+
+import shutil
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from uploader.models import NetCDFFile
+from uploader.optimize import optimize_options, use_zarr_store, write_zarr, zarr, zarr_store_name
+
+
+class Command(BaseCommand):
+    help = "Convert uploaded NetCDF files to Zarr stores and read them from there."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all", action="store_true",
+            help="Rewrite every file, including ones already converted.",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=2,
+            help="Number of worker processes writing stores (default 2).",
+        )
+
+    def handle(self, *args, **options):
+        if zarr is None:
+            raise CommandError("Converting to Zarr needs the zarr package (pip install zarr).")
+        files = NetCDFFile.objects.all()
+        if not options["all"]:
+            files = files.exclude(storage_format=NetCDFFile.STORAGE_ZARR)
+        files = list(files)
+
+        if not files:
+            self.stdout.write("Nothing to convert.")
+            return
+
+        done = failed = 0
+        job_options = optimize_options()
+        # Worker processes started with "spawn" must set Django up first
+        with ProcessPoolExecutor(max_workers=options["workers"], initializer=django.setup) as pool:
+            futures = {}
+            for nc_file in files:
+                name = zarr_store_name(nc_file)
+                future = pool.submit(
+                    write_zarr, nc_file.netcdf_path, default_storage.path(name), **job_options
+                )
+                futures[future] = (nc_file, name)
+            for future in as_completed(futures):
+                nc_file, name = futures[future]
+                try:
+                    use_zarr_store(nc_file, name, future.result())
+                    done += 1
+                except Exception as exc:
+                    # Give back the reserved name; the file keeps its old storage
+                    shutil.rmtree(default_storage.path(name), ignore_errors=True)
+                    failed += 1
+                    self.stderr.write(f"{nc_file}: {exc}")
+
+        self.stdout.write(self.style.SUCCESS(f"Converted {done} file(s), {failed} failed."))
@@ -0,0 +1,61 @@
+# uploader/management/commands/dedupe_uploads.py
+
+# --------------------------------------------------------------------------
+# python manage.py dedupe_uploads [--dry-run]
+# --------------------------------------------------------------------------
+# Files uploaded before content hashing existed may be stored several times
+# (e.g. sample_4d.nc, sample_4d_hHEmAYG.nc, ...). This command fills in the
+# missing SHA-256 hashes and points every duplicate row at the first stored
+# copy, deleting the redundant copies from disk. Rows are kept, so links to
+# existing file ids keep working.
+
+from django.core.management.base import BaseCommand
+
+from uploader.models import NetCDFFile
+from uploader.uploads import sha256_of_file
+
+
+class Command(BaseCommand):
+    help = "Hash stored NetCDF files and remove duplicate copies from disk."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run", action="store_true",
+            help="Report what would change without touching files or rows.",
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options["dry_run"]
+
+        # Hash files that predate content hashing
+        for nc_file in NetCDFFile.objects.filter(sha256=""):
+            if not nc_file.file.storage.exists(nc_file.file.name):
+                self.stderr.write(f"Missing on disk: {nc_file.file.name}")
+                continue
+            with nc_file.file.open("rb") as f:
+                nc_file.sha256 = sha256_of_file(f)
+            nc_file.size = nc_file.file.size
+            if not dry_run:
+                nc_file.save(update_fields=["sha256", "size"])
+
+        # Keep the first copy of each hash; repoint the others at it
+        keepers = {}
+        freed = 0
+        for nc_file in NetCDFFile.objects.exclude(sha256="").order_by("id"):
+            keeper = keepers.setdefault(nc_file.sha256, nc_file)
+            if keeper is nc_file or nc_file.file.name == keeper.file.name:
+                continue
+
+            duplicate_name = nc_file.file.name
+            self.stdout.write(f"{duplicate_name} -> {keeper.file.name}")
+            freed += nc_file.size or 0
+            if dry_run:
+                continue
+
+            nc_file.file.name = keeper.file.name
+            nc_file.save(update_fields=["file"])
+            if not NetCDFFile.objects.filter(file=duplicate_name).exists():
+                nc_file.file.storage.delete(duplicate_name)
+
+        verb = "Would free" if dry_run else "Freed"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {freed} bytes."))
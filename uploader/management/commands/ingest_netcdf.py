@@ -0,0 +1,74 @@
+# uploader/management/commands/ingest_netcdf.py
+
+# --------------------------------------------------------------------------
+# python manage.py ingest_netcdf <dir> [--pattern "*.nc"] [--in-place]
+# --------------------------------------------------------------------------
+# Stores every matching file below a directory (see uploader/bulk.py).
+# Files are copied into MEDIA_ROOT/netcdf/, or with --in-place registered
+# where they are, which needs the directory to be inside MEDIA_ROOT.
+#
+# Files that fail are listed with their error and skipped; the run carries
+# on and ends with the throughput. Running the command again on the same
+# directory only stores files that are new (by contents).
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+
+from uploader.bulk import bulk_ingest, bulk_options, bulk_workers, copy_into_storage, register_in_place
+
+
+class Command(BaseCommand):
+    help = "Store and ingest every NetCDF file below a directory."
+
+    def add_arguments(self, parser):
+        options = bulk_options()
+        parser.add_argument("directory", help="Directory searched (recursively) for files.")
+        parser.add_argument(
+            "--pattern", default="*.nc",
+            help='File name pattern (default "*.nc").',
+        )
+        parser.add_argument(
+            "--in-place", action="store_true",
+            help="Register files where they are instead of copying them (inside MEDIA_ROOT only).",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=bulk_workers(),
+            help=f"Number of worker processes checking files (default {bulk_workers()}).",
+        )
+        parser.add_argument(
+            "--copy-workers", type=int, default=options["copy_workers"],
+            help=f"Number of threads copying files (default {options['copy_workers']}).",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=options["batch_size"],
+            help=f"Files inserted per database transaction (default {options['batch_size']}).",
+        )
+
+    def handle(self, *args, **options):
+        directory = Path(options["directory"])
+        if not directory.is_dir():
+            raise CommandError(f"{directory} is not a directory.")
+        paths = sorted(p for p in directory.rglob(options["pattern"]) if p.is_file())
+        if not paths:
+            self.stdout.write("No files found.")
+            return
+
+        self.stdout.write(f"Found {len(paths)} file(s).")
+        files = [(str(p), os.path.basename(p), None) for p in paths]
+        place = register_in_place if options["in_place"] else copy_into_storage
+
+        # Worker processes started with "spawn" must set Django up first
+        with ProcessPoolExecutor(max_workers=options["workers"], initializer=django.setup) as pool:
+            report = bulk_ingest(
+                files, pool, place=place,
+                copy_workers=options["copy_workers"], batch_size=options["batch_size"],
+                progress=lambda report: self.stdout.write(f"  {report.summary()}"),
+            )
+
+        for name, error in report.failed:
+            self.stderr.write(f"{name}: {error}")
+        self.stdout.write(self.style.SUCCESS(report.summary()))
@@ -0,0 +1,62 @@
+# uploader/management/commands/optimize_uploads.py
+
+# --------------------------------------------------------------------------
+# python manage.py optimize_uploads [--all] [--workers N]
+# --------------------------------------------------------------------------
+# Writes the optimised copy (see uploader/optimize.py) of files that do not
+# have one yet, e.g. files uploaded before NETCDF_OPTIMIZE_UPLOADS was
+# switched on. Copies are written in parallel in a pool of worker
+# processes; the results are saved from this process.
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand
+
+from uploader.models import NetCDFFile
+from uploader.optimize import begin_optimize, finish_optimize, optimize_netcdf, optimize_options
+
+
+class Command(BaseCommand):
+    help = "Write optimised, rechunked copies of uploaded NetCDF files."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all", action="store_true",
+            help="Rewrite every file, including ones already optimised.",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=2,
+            help="Number of worker processes writing copies (default 2).",
+        )
+
+    def handle(self, *args, **options):
+        files = NetCDFFile.objects.all()
+        if not options["all"]:
+            files = files.exclude(optimize_status=NetCDFFile.OPTIMIZE_DONE)
+        files = list(files)
+
+        if not files:
+            self.stdout.write("Nothing to optimise.")
+            return
+
+        done = failed = 0
+        job_options = optimize_options()
+        # Worker processes started with "spawn" must set Django up first
+        with ProcessPoolExecutor(max_workers=options["workers"], initializer=django.setup) as pool:
+            futures = {}
+            for nc_file in files:
+                name, path = begin_optimize(nc_file)
+                future = pool.submit(optimize_netcdf, nc_file.file.path, path, **job_options)
+                futures[future] = (nc_file, name)
+            for future in as_completed(futures):
+                nc_file, name = futures[future]
+                try:
+                    finish_optimize(nc_file, name, future.result())
+                    done += 1
+                except Exception as exc:
+                    finish_optimize(nc_file, name, error=exc)
+                    failed += 1
+                    self.stderr.write(f"{nc_file}: {exc}")
+
+        self.stdout.write(self.style.SUCCESS(f"Optimised {done} file(s), {failed} failed."))
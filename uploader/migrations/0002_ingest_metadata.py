@@ -0,0 +1,80 @@
+# Generated by Django 6.0 on 2026-10-18 11:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploader', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='netcdffile',
+            name='ingest_error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='netcdffile',
+            name='ingest_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], db_index=True, default='pending', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='netcdffile',
+            name='ingested_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='NetCDFDimension',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('size', models.BigIntegerField()),
+                ('is_unlimited', models.BooleanField(default=False)),
+                ('file', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dimensions', to='uploader.netcdffile')),
+            ],
+            options={
+                'ordering': ['id'],
+                'constraints': [models.UniqueConstraint(fields=('file', 'name'), name='unique_dimension_per_file')],
+            },
+        ),
+        migrations.CreateModel(
+            name='NetCDFTimeStep',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.IntegerField()),
+                ('value', models.FloatField()),
+                ('timestamp', models.DateTimeField(blank=True, null=True)),
+                ('file', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='time_steps', to='uploader.netcdffile')),
+            ],
+            options={
+                'ordering': ['index'],
+                'indexes': [models.Index(fields=['file', 'timestamp'], name='uploader_ne_file_id_72ce27_idx')],
+                'constraints': [models.UniqueConstraint(fields=('file', 'index'), name='unique_time_step_per_file')],
+            },
+        ),
+        migrations.CreateModel(
+            name='NetCDFVariable',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('dimensions', models.JSONField(default=list)),
+                ('shape', models.JSONField(default=list)),
+                ('dtype', models.CharField(max_length=32)),
+                ('chunking', models.JSONField(blank=True, null=True)),
+                ('attributes', models.JSONField(default=dict)),
+                ('is_plottable', models.BooleanField(default=False)),
+                ('is_coordinate', models.BooleanField(default=False)),
+                ('min_value', models.FloatField(blank=True, null=True)),
+                ('max_value', models.FloatField(blank=True, null=True)),
+                ('file', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='variables', to='uploader.netcdffile')),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['file', 'is_plottable'], name='uploader_ne_file_id_82bdeb_idx')],
+                'constraints': [models.UniqueConstraint(fields=('file', 'name'), name='unique_variable_per_file')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 6.0 on 2026-10-18 12:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploader', '0003_content_hash_and_chunked_uploads'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NetCDFVariableStatistics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('time_index', models.IntegerField(blank=True, null=True)),
+                ('count', models.BigIntegerField()),
+                ('nan_count', models.BigIntegerField()),
+                ('min', models.FloatField(blank=True, null=True)),
+                ('max', models.FloatField(blank=True, null=True)),
+                ('mean', models.FloatField(blank=True, null=True)),
+                ('std', models.FloatField(blank=True, null=True)),
+                ('quantiles', models.JSONField(default=dict)),
+                ('sketch', models.JSONField(blank=True, null=True)),
+                ('variable', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='statistics', to='uploader.netcdfvariable')),
+            ],
+            options={
+                'ordering': ['variable', 'time_index'],
+                'constraints': [models.UniqueConstraint(fields=('variable', 'time_index'), name='unique_statistics_per_step')],
+            },
+        ),
+    ]
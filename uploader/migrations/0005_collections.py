@@ -0,0 +1,45 @@
+# Generated by Django 6.0 on 2026-10-18 14:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploader', '0004_variable_statistics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NetCDFCollection',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('built_at', models.DateTimeField(blank=True, null=True)),
+                ('time_count', models.BigIntegerField(default=0)),
+                ('variables', models.JSONField(default=list)),
+                ('times', models.JSONField(default=list)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='NetCDFCollectionMember',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.IntegerField()),
+                ('time_offset', models.BigIntegerField()),
+                ('time_count', models.IntegerField()),
+                ('collection', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='members', to='uploader.netcdfcollection')),
+                ('file', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='collection_members', to='uploader.netcdffile')),
+            ],
+            options={
+                'ordering': ['position'],
+                'indexes': [models.Index(fields=['collection', 'time_offset'], name='uploader_ne_collect_f6aef5_idx')],
+                'constraints': [models.UniqueConstraint(fields=('collection', 'position'), name='unique_member_position')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 6.0 on 2026-10-18 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploader', '0005_collections'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='netcdffile',
+            name='optimize_error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='netcdffile',
+            name='optimize_status',
+            field=models.CharField(choices=[('none', 'Not optimised'), ('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='none', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='netcdffile',
+            name='optimized_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='netcdffile',
+            name='optimized_file',
+            field=models.FileField(blank=True, upload_to='netcdf/optimized/'),
+        ),
+    ]
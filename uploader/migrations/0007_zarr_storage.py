@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-18 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploader', '0006_optimized_copies'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='netcdffile',
+            name='storage_format',
+            field=models.CharField(choices=[('netcdf4', 'NetCDF4 file'), ('zarr', 'Zarr store')], default='netcdf4', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='netcdffile',
+            name='zarr_store',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
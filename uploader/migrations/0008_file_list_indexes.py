@@ -0,0 +1,21 @@
+# Generated by Django 6.0 on 2026-10-18 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploader', '0007_zarr_storage'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='netcdffile',
+            index=models.Index(fields=['-uploaded_at', '-id'], name='netcdf_file_recent'),
+        ),
+        migrations.AddIndex(
+            model_name='netcdffile',
+            index=models.Index(fields=['ingest_status', '-uploaded_at', '-id'], name='netcdf_file_status_recent'),
+        ),
+    ]
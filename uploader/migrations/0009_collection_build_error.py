@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 16:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploader', '0008_file_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='netcdfcollection',
+            name='build_error',
+            field=models.TextField(blank=True),
+        ),
+    ]
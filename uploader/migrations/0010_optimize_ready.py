@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 16:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploader', '0009_collection_build_error'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='netcdffile',
+            name='optimize_status',
+            field=models.CharField(choices=[('none', 'Not optimised'), ('pending', 'Pending'), ('running', 'Running'), ('ready', 'Waiting for ingest'), ('done', 'Done'), ('failed', 'Failed')], default='none', max_length=10),
+        ),
+    ]
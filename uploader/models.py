@@ -1,5 +1,8 @@
 # uploader/models.py
 
+import uuid
+
+from django.core.files.storage import default_storage
 # Import Django's models module, which allows us to define database tables as Python classes
 from django.db import models
 
@@ -10,6 +13,42 @@ from django.db import models
 # Each attribute of the class represents a column in the table.
 
 class NetCDFFile(models.Model):
+    # Possible states of the background metadata ingest (see ingest.py)
+    INGEST_PENDING = "pending"
+    INGEST_RUNNING = "running"
+    INGEST_DONE = "done"
+    INGEST_FAILED = "failed"
+    INGEST_CHOICES = [
+        (INGEST_PENDING, "Pending"),
+        (INGEST_RUNNING, "Running"),
+        (INGEST_DONE, "Done"),
+        (INGEST_FAILED, "Failed"),
+    ]
+
+    # States of the optional rechunking job (see optimize.py)
+    OPTIMIZE_NONE = "none"
+    OPTIMIZE_PENDING = "pending"
+    OPTIMIZE_RUNNING = "running"
+    OPTIMIZE_READY = "ready"
+    OPTIMIZE_DONE = "done"
+    OPTIMIZE_FAILED = "failed"
+    OPTIMIZE_CHOICES = [
+        (OPTIMIZE_NONE, "Not optimised"),
+        (OPTIMIZE_PENDING, "Pending"),
+        (OPTIMIZE_RUNNING, "Running"),
+        (OPTIMIZE_READY, "Waiting for ingest"),
+        (OPTIMIZE_DONE, "Done"),
+        (OPTIMIZE_FAILED, "Failed"),
+    ]
+
+    # Where the viewer reads the data from (see backends.py)
+    STORAGE_NETCDF4 = "netcdf4"
+    STORAGE_ZARR = "zarr"
+    STORAGE_CHOICES = [
+        (STORAGE_NETCDF4, "NetCDF4 file"),
+        (STORAGE_ZARR, "Zarr store"),
+    ]
+
     # 'file' is a column that stores the uploaded NetCDF file
     # FileField tells Django this is a file upload field
     # 'upload_to' specifies the folder inside MEDIA_ROOT where files will be saved
@@ -19,6 +58,50 @@ class NetCDFFile(models.Model):
     # auto_now_add=True means Django will automatically set this value when a new record is created
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
+    # Progress of the metadata ingest. Once it is "done" the viewer reads
+    # dimensions, variables and times from the tables below instead of
+    # opening the file.
+    ingest_status = models.CharField(
+        max_length=10, choices=INGEST_CHOICES, default=INGEST_PENDING, db_index=True
+    )
+    ingest_error = models.TextField(blank=True)
+    ingested_at = models.DateTimeField(null=True, blank=True)
+
+    # SHA-256 of the file contents, used to spot repeated uploads, and the
+    # file size in bytes
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True)
+    size = models.BigIntegerField(null=True, blank=True)
+
+    # A rewritten copy with a viewer-friendly chunk layout. The original
+    # upload is kept; once the copy is done the viewer reads the copy
+    # instead (see data_path).
+    optimized_file = models.FileField(upload_to='netcdf/optimized/', blank=True)
+    optimize_status = models.CharField(
+        max_length=10, choices=OPTIMIZE_CHOICES, default=OPTIMIZE_NONE
+    )
+    optimize_error = models.TextField(blank=True)
+    optimized_at = models.DateTimeField(null=True, blank=True)
+
+    # A Zarr copy written by "manage.py convert_to_zarr". zarr_store is the
+    # store's directory relative to MEDIA_ROOT; a FileField cannot hold it
+    # because a store is a folder of files.
+    storage_format = models.CharField(
+        max_length=10, choices=STORAGE_CHOICES, default=STORAGE_NETCDF4
+    )
+    zarr_store = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        # The file list (views.file_list) pages through files newest first,
+        # optionally for one ingest status. These indexes hold rows in that
+        # order, so each page is read straight from the index however many
+        # files there are, instead of sorting the whole table.
+        indexes = [
+            models.Index(fields=["-uploaded_at", "-id"], name="netcdf_file_recent"),
+            models.Index(
+                fields=["ingest_status", "-uploaded_at", "-id"], name="netcdf_file_status_recent"
+            ),
+        ]
+
     # ----------------------------------------------------------------------
     # This method defines how the object will appear as a string
     # Useful in the Django admin and when printing the object
@@ -27,6 +110,212 @@ class NetCDFFile(models.Model):
         # Return the filename as the string representation of this object
         return str(self.file)
 
+    @property
+    def is_ingested(self):
+        return self.ingest_status == self.INGEST_DONE
+
+    @property
+    def netcdf_path(self):
+        """Path of the NetCDF data: the optimised copy if there is one."""
+        if self.optimize_status == self.OPTIMIZE_DONE and self.optimized_file:
+            return self.optimized_file.path
+        return self.file.path
+
+    @property
+    def data_path(self):
+        """Path the viewer reads the data from: the Zarr store once converted."""
+        if self.storage_format == self.STORAGE_ZARR and self.zarr_store:
+            return default_storage.path(self.zarr_store)
+        return self.netcdf_path
+
+
+# --------------------------------------------------------------------------
+# Metadata extracted from each file at upload time
+# --------------------------------------------------------------------------
+# These tables are filled by uploader/ingest.py. Each row belongs to one
+# NetCDFFile and is deleted with it.
+
+class NetCDFDimension(models.Model):
+    file = models.ForeignKey(NetCDFFile, on_delete=models.CASCADE, related_name="dimensions")
+    name = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    is_unlimited = models.BooleanField(default=False)
+
+    class Meta:
+        ordering = ["id"]
+        constraints = [
+            models.UniqueConstraint(fields=["file", "name"], name="unique_dimension_per_file"),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.size})"
+
+
+class NetCDFVariable(models.Model):
+    file = models.ForeignKey(NetCDFFile, on_delete=models.CASCADE, related_name="variables")
+    name = models.CharField(max_length=255)
+
+    # Dimension names and sizes, e.g. ["time", "lat", "lon"] and [3, 20, 20]
+    dimensions = models.JSONField(default=list)
+    shape = models.JSONField(default=list)
+    dtype = models.CharField(max_length=32)
+
+    # HDF5 chunk shape, or null for contiguous storage
+    chunking = models.JSONField(null=True, blank=True)
+    attributes = models.JSONField(default=dict)
+
+    # Variables with two or more dimensions can be drawn as a heatmap
+    is_plottable = models.BooleanField(default=False)
+
+    # 1D variables named after their dimension (time, lat, lon, ...) are
+    # coordinates; their value range is stored for quick lookups.
+    is_coordinate = models.BooleanField(default=False)
+    min_value = models.FloatField(null=True, blank=True)
+    max_value = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["id"]
+        constraints = [
+            models.UniqueConstraint(fields=["file", "name"], name="unique_variable_per_file"),
+        ]
+        indexes = [
+            models.Index(fields=["file", "is_plottable"]),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class NetCDFTimeStep(models.Model):
+    file = models.ForeignKey(NetCDFFile, on_delete=models.CASCADE, related_name="time_steps")
+    index = models.IntegerField()
+
+    # Raw value from the file's time variable and, when its CF units could
+    # be decoded, the matching date and time
+    value = models.FloatField()
+    timestamp = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["index"]
+        constraints = [
+            models.UniqueConstraint(fields=["file", "index"], name="unique_time_step_per_file"),
+        ]
+        indexes = [
+            models.Index(fields=["file", "timestamp"]),
+        ]
+
+    def __str__(self):
+        return f"{self.index}: {self.timestamp or self.value}"
+
+
+class NetCDFVariableStatistics(models.Model):
+    # Summary statistics of one variable, computed in a single streaming
+    # pass at ingest time (see stats.py). The row with time_index = null
+    # covers the whole variable; the others cover one time step each.
+    variable = models.ForeignKey(NetCDFVariable, on_delete=models.CASCADE, related_name="statistics")
+    time_index = models.IntegerField(null=True, blank=True)
+
+    count = models.BigIntegerField()
+    nan_count = models.BigIntegerField()
+    min = models.FloatField(null=True, blank=True)
+    max = models.FloatField(null=True, blank=True)
+    mean = models.FloatField(null=True, blank=True)
+    std = models.FloatField(null=True, blank=True)
+
+    # Percentiles keyed by percent, e.g. {"2": 0.4, "98": 49.1}. The global
+    # row also keeps the mergeable quantile sketch they were computed from.
+    quantiles = models.JSONField(default=dict)
+    sketch = models.JSONField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["variable", "time_index"]
+        constraints = [
+            models.UniqueConstraint(fields=["variable", "time_index"], name="unique_statistics_per_step"),
+        ]
+
+    def __str__(self):
+        where = "all times" if self.time_index is None else f"time {self.time_index}"
+        return f"{self.variable} ({where})"
+
+
+# --------------------------------------------------------------------------
+# Resumable chunked uploads
+# --------------------------------------------------------------------------
+# Tracks a large upload that the browser sends in pieces. The bytes received
+# so far live in MEDIA_ROOT/uploads/partial/<id>.part (see uploads.py), and
+# 'offset' says where the next piece must start, so an interrupted upload
+# can carry on from there.
+
+class ChunkedUpload(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    filename = models.CharField(max_length=255)
+    total_size = models.BigIntegerField(null=True, blank=True)
+    offset = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.total_size or '?'} bytes)"
+
+
+# --------------------------------------------------------------------------
+# Collections: many files viewed as one dataset along time
+# --------------------------------------------------------------------------
+# Radars write one file per scan. A collection strings such files together
+# along their "time" dimension, so one time slider spans all of them. Each
+# member records where its steps start in the collection's global time
+# axis (time_offset); see aggregation.py for how a global step is mapped
+# back to one file and a local index.
+
+class NetCDFCollection(models.Model):
+    name = models.CharField(max_length=200, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    # When the members were last read; null until the first build. A
+    # build that failed leaves its error here instead (see aggregation.py)
+    built_at = models.DateTimeField(null=True, blank=True)
+    build_error = models.TextField(blank=True)
+
+    # Total number of time steps over all members
+    time_count = models.BigIntegerField(default=0)
+
+    # Plottable variables that every member has with the same dimensions
+    # and spatial shape, as [{"name", "dimensions", "shape", "chunking"}]
+    # taken from the first member
+    variables = models.JSONField(default=list)
+
+    # Label of every global time step: ISO timestamp, raw value or null
+    times = models.JSONField(default=list)
+
+    class Meta:
+        ordering = ["name"]
+
+    def __str__(self):
+        return self.name
+
+
+class NetCDFCollectionMember(models.Model):
+    collection = models.ForeignKey(NetCDFCollection, on_delete=models.CASCADE, related_name="members")
+    file = models.ForeignKey(NetCDFFile, on_delete=models.CASCADE, related_name="collection_members")
+
+    # Order within the collection (by first time step) and the global index
+    # of this file's first step
+    position = models.IntegerField()
+    time_offset = models.BigIntegerField()
+    time_count = models.IntegerField()
+
+    class Meta:
+        ordering = ["position"]
+        constraints = [
+            models.UniqueConstraint(fields=["collection", "position"], name="unique_member_position"),
+        ]
+        indexes = [
+            models.Index(fields=["collection", "time_offset"]),
+        ]
+
+    def __str__(self):
+        return f"{self.collection} #{self.position}: {self.file}"
+
+
 # --------------------------------------------------------------------------
 # How this works:
 # --------------------------------------------------------------------------
@@ -35,3 +324,7 @@ class NetCDFFile(models.Model):
 # 3. 'file' stores the file itself (in the MEDIA_ROOT/netcdf/ folder) and the database stores the path.
 # 4. 'uploaded_at' automatically records when the file was uploaded.
 # 5. You can see these files and timestamps in the Django admin panel.
+# 6. NetCDFDimension, NetCDFVariable and NetCDFTimeStep hold the file's metadata
+#    so pages can be drawn without opening the file again.
+# 7. NetCDFVariableStatistics keeps min/max/mean/percentiles per variable and time step.
+# 8. 'sha256' lets a repeated upload reuse the existing row and file on disk.
@@ -0,0 +1,414 @@
+# uploader/optimize.py
+
+# --------------------------------------------------------------------------
+# Rewriting uploads into a viewer-friendly layout
+# --------------------------------------------------------------------------
+# Files arrive with whatever chunking their producer chose - often
+# contiguous, or one chunk per variable - so reading one time step can
+# decompress the whole variable. With NETCDF_OPTIMIZE_UPLOADS = True every
+# new upload is copied in the background into a new file where each
+# variable of two or more dimensions is
+#
+#   - chunked NETCDF_OPTIMIZE_TIME_CHUNK time steps deep and in square
+#     spatial tiles of about NETCDF_OPTIMIZE_CHUNK_BYTES, so a time slice
+#     and a point time series each read only a modest number of chunks
+#     (neighbouring steps then come from the chunk cache, see slicing.py);
+#   - compressed with NETCDF_OPTIMIZE_COMPRESSION: "zlib", or "lz4"
+#     (Blosc LZ4 with byte shuffle) when the netCDF library has the Blosc
+#     filter - otherwise zlib is used instead.
+#
+# Every dimension, variable and attribute is defined before any data is
+# written, so all of the file's metadata sits together in the header and
+# opening the copy reads it in one go.
+#
+# The original upload is kept. Once the copy is finished the file's
+# data_path points at it and every reader (dataset_cache.py, exports,
+# thumbnails) uses it from then on. A copy that is finished before the
+# file's metadata ingest waits in the "ready" state, and ingest_file
+# switches over to it when the ingest ends (see finish_waiting_optimize). The copy is written in a separate
+# process so a large rewrite does not compete with requests for the GIL.
+# "python manage.py optimize_uploads" optimises files uploaded earlier.
+#
+# The same layout can also be written as a Zarr store instead (see
+# backends.py): "python manage.py convert_to_zarr" converts existing files
+# and switches them over to the store.
+
+import logging
+import math
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import django
+import numpy as np
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+from netCDF4 import Dataset
+
+from .backends import VARIABLE_ORDER_ATTRIBUTE
+from .models import NetCDFFile, NetCDFVariable
+from .slicing import time_dimension
+
+# Only needed to write Zarr stores
+try:
+    import numcodecs
+    import zarr
+except ImportError:
+    numcodecs = zarr = None
+
+logger = logging.getLogger(__name__)
+
+
+def optimize_options():
+    return {
+        "compression": getattr(settings, "NETCDF_OPTIMIZE_COMPRESSION", "zlib"),
+        "complevel": getattr(settings, "NETCDF_OPTIMIZE_COMPLEVEL", 4),
+        "chunk_bytes": getattr(settings, "NETCDF_OPTIMIZE_CHUNK_BYTES", 1024 * 1024),
+        "time_chunk": getattr(settings, "NETCDF_OPTIMIZE_TIME_CHUNK", 8),
+        "block_bytes": getattr(settings, "NETCDF_OPTIMIZE_BLOCK_BYTES", 64 * 1024 * 1024),
+    }
+
+
+# --------------------------------------------------------------------------
+# Writing the optimised copy (runs in a worker process)
+# --------------------------------------------------------------------------
+def chunk_shape(dimensions, shape, itemsize, chunk_bytes, time_chunk):
+    """Chunk shape for a variable of two or more dimensions.
+
+    The time dimension gets time_chunk steps, other non-spatial dimensions
+    (levels, ...) one index, and the last two a square-ish tile that makes
+    the chunk about chunk_bytes.
+    """
+    time_dim = time_dimension(dimensions)
+    chunks = []
+    for dim, size in zip(dimensions[:-2], shape[:-2]):
+        chunks.append(max(1, min(size, time_chunk)) if dim == time_dim else 1)
+    rows, cols = shape[-2:]
+    cells = max(1, chunk_bytes // itemsize // max(1, math.prod(chunks)))
+    side = max(1, math.isqrt(cells))
+    tile_rows = max(1, min(rows, side))
+    tile_cols = max(1, min(cols, cells // tile_rows))
+    return chunks + [tile_rows, tile_cols]
+
+
+def _compression(ds, name):
+    """netCDF4 createVariable arguments for a compression name."""
+    if name == "lz4" and ds.has_blosc_filter():
+        return {"compression": "blosc_lz4", "blosc_shuffle": 1}
+    return {"compression": "zlib", "shuffle": True}
+
+
+def _copy_data(source, target, block_bytes):
+    """Copy a variable's raw values in blocks along its first dimension."""
+    if not source.shape:
+        target.assignValue(source.getValue())
+        return
+    if 0 in source.shape:
+        return
+    per_index = source.dtype.itemsize * math.prod(source.shape[1:]) if source.dtype != str else 1
+    step = max(1, block_bytes // max(1, per_index))
+    for start in range(0, source.shape[0], step):
+        block = slice(start, min(start + step, source.shape[0]))
+        target[block] = source[block]
+
+
+def optimize_netcdf(source_path, target_path, compression="zlib", complevel=4,
+                    chunk_bytes=1024 * 1024, time_chunk=8, block_bytes=64 * 1024 * 1024):
+    """Write a rechunked, compressed copy of a NetCDF file.
+
+    Only the root group is copied (the viewer never reads others). The copy
+    is written under a temporary name and renamed when complete. Returns
+    {variable: chunk shape or None} for the copy.
+    """
+    partial = target_path + ".partial"
+    chunking = {}
+    try:
+        with Dataset(source_path, "r") as src, Dataset(partial, "w", format="NETCDF4") as dst:
+            # Define everything first, so the header is written in one piece
+            dst.setncatts({name: src.getncattr(name) for name in src.ncattrs()})
+            for name, dim in src.dimensions.items():
+                dst.createDimension(name, None if dim.isunlimited() else len(dim))
+
+            pairs = []
+            for name, var in src.variables.items():
+                var.set_auto_maskandscale(False)
+                options = {}
+                if "_FillValue" in var.ncattrs():
+                    options["fill_value"] = var.getncattr("_FillValue")
+                numeric = var.dtype != str and var.dtype.kind in "iuf"
+                if numeric and len(var.dimensions) >= 2:
+                    chunks = chunk_shape(
+                        var.dimensions, var.shape, var.dtype.itemsize, chunk_bytes, time_chunk
+                    )
+                    options.update(_compression(dst, compression), complevel=complevel, chunksizes=chunks)
+                    chunking[name] = chunks
+                else:
+                    chunking[name] = None
+                out = dst.createVariable(name, var.datatype, var.dimensions, **options)
+                out.setncatts({a: var.getncattr(a) for a in var.ncattrs() if a != "_FillValue"})
+                out.set_auto_maskandscale(False)
+                pairs.append((var, out))
+
+            for var, out in pairs:
+                _copy_data(var, out, block_bytes)
+        os.replace(partial, target_path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    return chunking
+
+
+# --------------------------------------------------------------------------
+# Writing a Zarr store (runs in a worker process)
+# --------------------------------------------------------------------------
+def _zarr_compressor(name, complevel):
+    """numcodecs compressor for a compression name."""
+    if name == "lz4":
+        return numcodecs.Blosc(cname="lz4", clevel=complevel, shuffle=numcodecs.Blosc.SHUFFLE)
+    return numcodecs.Zlib(level=complevel)
+
+
+def _zarr_attribute(value):
+    """An attribute value as plain JSON data."""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def write_zarr(source_path, target_path, compression="zlib", complevel=4,
+               chunk_bytes=1024 * 1024, time_chunk=8, block_bytes=64 * 1024 * 1024):
+    """Write the numeric variables of a NetCDF file as a Zarr v2 store.
+
+    Variables are chunked like optimize_netcdf does and hold the raw
+    (packed) values with all their attributes, so the store reads back
+    exactly like the file. The store is written under a temporary name,
+    its metadata consolidated into one document and then renamed. Returns
+    {variable: chunk shape}.
+    """
+    if zarr is None:
+        raise ImproperlyConfigured("Writing Zarr stores needs the zarr package.")
+    partial = target_path + ".partial"
+    shutil.rmtree(partial, ignore_errors=True)
+    chunking = {}
+    try:
+        root = zarr.open_group(partial, mode="w")
+        with Dataset(source_path, "r") as src:
+            root.attrs.update({name: _zarr_attribute(src.getncattr(name)) for name in src.ncattrs()})
+            for name, var in src.variables.items():
+                # Strings and compound types have no place in the viewer
+                if var.dtype == str or var.dtype.kind not in "iuf":
+                    continue
+                var.set_auto_maskandscale(False)
+                if len(var.dimensions) >= 2:
+                    chunks = chunk_shape(
+                        var.dimensions, var.shape, var.dtype.itemsize, chunk_bytes, time_chunk
+                    )
+                else:
+                    chunks = var.shape or True
+                out = root.create(
+                    name, shape=var.shape, chunks=chunks, dtype=var.dtype,
+                    compressor=_zarr_compressor(compression, complevel),
+                    fill_value=var.getncattr("_FillValue") if "_FillValue" in var.ncattrs() else None,
+                )
+                attributes = {a: _zarr_attribute(var.getncattr(a)) for a in var.ncattrs()}
+                # _ARRAY_DIMENSIONS is how xarray (and backends.py) find dimension names
+                attributes["_ARRAY_DIMENSIONS"] = list(var.dimensions)
+                out.attrs.update(attributes)
+                if var.shape:
+                    _copy_data(var, out, block_bytes)
+                else:
+                    out[...] = var.getValue()
+                chunking[name] = list(out.chunks)
+            # Zarr lists arrays by name; keep the file's order for the viewer
+            root.attrs[VARIABLE_ORDER_ATTRIBUTE] = list(chunking)
+        zarr.consolidate_metadata(partial)
+        shutil.rmtree(target_path, ignore_errors=True)
+        os.replace(partial, target_path)
+    finally:
+        shutil.rmtree(partial, ignore_errors=True)
+    return chunking
+
+
+def zarr_store_name(nc_file):
+    """A free store name under MEDIA_ROOT/netcdf/zarr/, reserved on disk."""
+    stem = os.path.splitext(os.path.basename(nc_file.file.name))[0]
+    name = default_storage.get_available_name(f"netcdf/zarr/{stem}.zarr")
+    os.makedirs(default_storage.path(name))
+    return name
+
+
+def use_zarr_store(nc_file, name, chunking):
+    """Switch a file over to a finished Zarr store."""
+    with transaction.atomic():
+        old = nc_file.zarr_store
+        nc_file.zarr_store = name
+        nc_file.storage_format = NetCDFFile.STORAGE_ZARR
+        nc_file.save(update_fields=["zarr_store", "storage_format"])
+        for var_name, chunks in chunking.items():
+            NetCDFVariable.objects.filter(file=nc_file, name=var_name).update(chunking=chunks)
+    if old and old != name:
+        shutil.rmtree(default_storage.path(old), ignore_errors=True)
+    return nc_file
+
+
+# --------------------------------------------------------------------------
+# Scheduling
+# --------------------------------------------------------------------------
+# Jobs are queued on a thread, which hands the rewrite itself to a worker
+# process and records the outcome in the database.
+_jobs = ThreadPoolExecutor(
+    max_workers=getattr(settings, "NETCDF_OPTIMIZE_WORKERS", 1),
+    thread_name_prefix="netcdf-optimize",
+)
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        # Workers started with "spawn" (Windows) must set Django up first
+        _executor = ProcessPoolExecutor(
+            max_workers=getattr(settings, "NETCDF_OPTIMIZE_WORKERS", 1), initializer=django.setup,
+        )
+    return _executor
+
+
+def optimization_enabled():
+    return getattr(settings, "NETCDF_OPTIMIZE_UPLOADS", False)
+
+
+def _target_name(nc_file):
+    field = NetCDFFile._meta.get_field("optimized_file")
+    name = field.generate_filename(nc_file, os.path.basename(nc_file.file.name))
+    return default_storage.get_available_name(name)
+
+
+def begin_optimize(nc_file):
+    """Mark the file running; returns (target name, target path)."""
+    name = _target_name(nc_file)
+    path = default_storage.path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Reserve the name so a concurrent job cannot pick it as well
+    open(path, "wb").close()
+    nc_file.optimize_status = NetCDFFile.OPTIMIZE_RUNNING
+    nc_file.optimize_error = ""
+    nc_file.save(update_fields=["optimize_status", "optimize_error"])
+    return name, path
+
+
+def finish_optimize(nc_file, name, chunking=None, error=None):
+    """Record the outcome of a job; a finished copy becomes the data path."""
+    if error is not None:
+        logger.error("Optimising %s failed: %s", nc_file, error)
+        default_storage.delete(name)
+        nc_file.optimize_status = NetCDFFile.OPTIMIZE_FAILED
+        nc_file.optimize_error = str(error)
+        nc_file.save(update_fields=["optimize_status", "optimize_error"])
+        return nc_file
+
+    with transaction.atomic():
+        old = nc_file.optimized_file.name
+        nc_file.optimized_file.name = name
+        nc_file.optimize_status = NetCDFFile.OPTIMIZE_DONE
+        nc_file.optimized_at = timezone.now()
+        nc_file.save(update_fields=["optimized_file", "optimize_status", "optimized_at"])
+        # The ingested catalogue records chunking (used for playback batches)
+        for var_name, chunks in chunking.items():
+            NetCDFVariable.objects.filter(file=nc_file, name=var_name).update(chunking=chunks)
+    if old and old != name:
+        default_storage.delete(old)
+    return nc_file
+
+
+def _finish_or_wait(nc_file, name, chunking):
+    """Switch over to a finished copy, or leave it for the ingest to do so.
+
+    The ingest records the original's chunking; switching over before it
+    ends would leave that chunking in the catalogue. The row is locked so
+    this and finish_waiting_optimize cannot both miss the other.
+    """
+    with transaction.atomic():
+        locked = NetCDFFile.objects.select_for_update().get(id=nc_file.id)
+        if locked.ingest_status not in (NetCDFFile.INGEST_PENDING, NetCDFFile.INGEST_RUNNING):
+            return finish_optimize(nc_file, name, chunking)
+        old = locked.optimized_file.name
+        locked.optimized_file.name = name
+        locked.optimize_status = NetCDFFile.OPTIMIZE_READY
+        locked.save(update_fields=["optimized_file", "optimize_status"])
+    if old and old != name:
+        default_storage.delete(old)
+    return locked
+
+
+def finish_waiting_optimize(nc_file):
+    """Switch over to a copy that was waiting for this file's ingest.
+
+    Called by ingest_file once the ingest has ended, whatever its outcome.
+    """
+    with transaction.atomic():
+        locked = NetCDFFile.objects.select_for_update().get(id=nc_file.id)
+        if locked.optimize_status != NetCDFFile.OPTIMIZE_READY:
+            return nc_file
+        name = locked.optimized_file.name
+        # Chunking in the form the ingest records it
+        with Dataset(default_storage.path(name)) as ds:
+            chunking = {
+                var_name: None if var.chunking() == "contiguous" else list(var.chunking())
+                for var_name, var in ds.variables.items()
+            }
+        finish_optimize(locked, name, chunking)
+    nc_file.refresh_from_db(fields=["optimized_file", "optimize_status", "optimized_at"])
+    return nc_file
+
+
+def optimize_file(nc_file):
+    """Write the optimised copy of one NetCDFFile in this process.
+
+    Failures are recorded on the row (the original stays in use).
+    """
+    name, path = begin_optimize(nc_file)
+    try:
+        chunking = optimize_netcdf(nc_file.file.path, path, **optimize_options())
+    except Exception as exc:
+        return finish_optimize(nc_file, name, error=exc)
+    return finish_optimize(nc_file, name, chunking)
+
+
+def _optimize_in_background(file_id):
+    try:
+        nc_file = NetCDFFile.objects.filter(id=file_id).first()
+        if nc_file is None:
+            return
+        name, path = begin_optimize(nc_file)
+        future = _get_executor().submit(optimize_netcdf, nc_file.file.path, path, **optimize_options())
+        try:
+            chunking = future.result()
+        except Exception as exc:
+            finish_optimize(nc_file, name, error=exc)
+            return
+        _finish_or_wait(nc_file, name, chunking)
+    finally:
+        # Worker threads get their own database connection; release it
+        connection.close()
+
+
+def submit_optimize(nc_file):
+    """Schedule the optimised copy of a new upload, if enabled.
+
+    With NETCDF_INGEST_ASYNC the job is started after the current
+    transaction commits and the copy is written in a worker process;
+    otherwise it is written immediately.
+    """
+    if not optimization_enabled():
+        return
+    nc_file.optimize_status = NetCDFFile.OPTIMIZE_PENDING
+    nc_file.save(update_fields=["optimize_status"])
+    if getattr(settings, "NETCDF_INGEST_ASYNC", True):
+        transaction.on_commit(lambda: _jobs.submit(_optimize_in_background, nc_file.id))
+    else:
+        optimize_file(nc_file)
@@ -0,0 +1,143 @@
+# uploader/response_cache.py
+
+# --------------------------------------------------------------------------
+# Two-tier cache for slice arrays and rendered responses
+# --------------------------------------------------------------------------
+# Flipping back and forth between the same variable and time step should
+# not read, encode or render the same thing again. Results are kept in:
+#
+#   1. an in-process LRU with a byte budget (fast, per worker), and
+#   2. optionally a shared Django cache backend (NETCDF_SHARED_CACHE names
+#      an entry of settings.CACHES), so other workers can reuse them too.
+#
+# Keys start with the file's content version (SHA-256 plus modification
+# time), so a changed file can never be served from an old entry.
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+
+
+def content_version(nc_file):
+    """A string that changes whenever the file's contents change."""
+    mtime = os.path.getmtime(nc_file.data_path)
+    return f"{nc_file.sha256 or nc_file.pk}:{mtime:.6f}"
+
+
+def make_key(nc_file, *parts):
+    """Cache key for something derived from nc_file and the given parts."""
+    return ":".join([content_version(nc_file), *(str(p) for p in parts)])
+
+
+def _sizeof(value):
+    # NumPy arrays, and objects made of them such as lod.Pyramid
+    if hasattr(value, "nbytes"):
+        return value.nbytes
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, tuple):
+        return sum(_sizeof(v) for v in value)
+    return len(value)
+
+
+class ByteBudgetLRU:
+    """Thread-safe LRU that evicts once its values exceed max_bytes."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        size = _sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= _sizeof(self._entries.pop(key))
+            self._entries[key] = value
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= _sizeof(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+
+class TwoTierCache:
+    """In-process ByteBudgetLRU backed by an optional shared Django cache."""
+
+    def __init__(self, name, max_bytes, shared_alias=None, timeout=3600):
+        self.name = name
+        self.local = ByteBudgetLRU(max_bytes)
+        self.shared_alias = shared_alias
+        self.timeout = timeout
+
+    def _shared(self):
+        return caches[self.shared_alias] if self.shared_alias else None
+
+    def _shared_key(self, key):
+        # Backends such as memcached limit key length and characters
+        return f"netcdf:{self.name}:" + hashlib.sha256(key.encode()).hexdigest()
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        shared = self._shared()
+        if shared is not None:
+            value = shared.get(self._shared_key(key))
+            if value is not None:
+                self.local.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self.local.set(key, value)
+        shared = self._shared()
+        if shared is not None:
+            shared.set(self._shared_key(key), value, self.timeout)
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        self.local.clear()
+
+
+# --------------------------------------------------------------------------
+# The caches used by the viewer
+# --------------------------------------------------------------------------
+# slice_cache holds float32 slices read from files; payload_cache holds
+# finished response bodies (encoded binary slices, rendered plot HTML).
+_shared_alias = getattr(settings, "NETCDF_SHARED_CACHE", None)
+
+slice_cache = TwoTierCache(
+    "slice", getattr(settings, "NETCDF_SLICE_CACHE_BYTES", 256 * 1024 * 1024), _shared_alias
+)
+payload_cache = TwoTierCache(
+    "payload", getattr(settings, "NETCDF_PAYLOAD_CACHE_BYTES", 64 * 1024 * 1024), _shared_alias
+)
@@ -0,0 +1,312 @@
+# uploader/slicing.py
+
+# --------------------------------------------------------------------------
+# Helpers for reading 2D slices out of N-dimensional NetCDF variables
+# --------------------------------------------------------------------------
+# Both the HTML viewer and the JSON/binary API need the same slice for a
+# given variable and time step, so the reading logic lives here.
+#
+# A variable's last two dimensions are the spatial ones that get drawn
+# (e.g. lat, lon). Every other dimension - time, level, ensemble member -
+# needs one index chosen, given as a "selection" dict such as
+# {"time": 3, "level": 0}. Dimensions left out of the selection use 0.
+# Only that exact 2D hyperslab is read from the file, so a 4D
+# (time, level, lat, lon) variable never loads a whole 3D cube.
+#
+# Even one 2D slab of a very large grid can take gigabytes, so reads for
+# display go through a memory governor (bottom of this file): slabs larger
+# than NETCDF_READ_BUDGET_BYTES are read in row bands and reduced band by
+# band, and never exist at full resolution in memory.
+
+import math
+
+import numpy as np
+from django.conf import settings
+from netCDF4 import default_fillvals
+
+from .instrumentation import record_bytes_read, span
+from .lod import block_reduce, downsample_factors
+
+
+def plottable_variables(ds):
+    """Return the names of variables with at least two dimensions."""
+    return [
+        name for name, var in ds.variables.items()
+        if len(var.dimensions) >= 2
+    ]
+
+
+def selector_dimensions(dimensions):
+    """The dimensions of a variable that need an index chosen (all but the last two)."""
+    return list(dimensions[:-2])
+
+
+def time_dimension(dimensions):
+    """The dimension the time slider moves along, or None.
+
+    That is "time" when the variable has it, otherwise its first
+    non-spatial dimension.
+    """
+    selectors = selector_dimensions(dimensions)
+    if not selectors:
+        return None
+    return "time" if "time" in selectors else selectors[0]
+
+
+def hyperslab(var, selection, time_range=None):
+    """Index tuple that reads one 2D slab of var.
+
+    With time_range=(start, stop) the time dimension becomes a slice
+    instead, for reading several steps at once. Raises IndexError for
+    indices outside the variable.
+    """
+    time_dim = time_dimension(var.dimensions) if time_range else None
+    index = []
+    for dim, size in zip(var.dimensions[:-2], var.shape[:-2]):
+        if dim == time_dim:
+            start, stop = time_range
+            if not 0 <= start < stop <= size:
+                raise IndexError(f"{dim} range {start}:{stop} outside 0:{size}")
+            index.append(slice(start, stop))
+            continue
+        i = int(selection.get(dim, 0))
+        if not 0 <= i < size:
+            raise IndexError(f"{dim} index {i} outside 0:{size}")
+        index.append(i)
+    return tuple(index) + (slice(None),) * min(2, len(var.dimensions))
+
+
+def tune_chunk_cache(var):
+    """Size the variable's HDF5 chunk cache to hold one slab's worth of chunks.
+
+    Reading a slab decompresses every chunk it touches, and a chunk usually
+    spans several time steps or levels. Keeping those chunks cached means
+    the neighbouring slabs (the next time step, the next level) are served
+    from memory instead of being decompressed again.
+    """
+    chunking = var.chunking()
+    if chunking == "contiguous" or len(var.shape) < 2:
+        return
+    rows, cols = var.shape[-2:]
+    chunk_rows, chunk_cols = chunking[-2:]
+    chunks_per_slab = math.ceil(rows / chunk_rows) * math.ceil(cols / chunk_cols)
+    chunk_bytes = int(np.prod(chunking)) * var.dtype.itemsize
+    wanted = min(
+        chunks_per_slab * chunk_bytes,
+        getattr(settings, "NETCDF_CHUNK_CACHE_MAX_BYTES", 64 * 1024 * 1024),
+    )
+    size, nelems, preemption = var.get_var_chunk_cache()
+    if size < wanted:
+        # HDF5 wants a hash table several times larger than the chunk count
+        var.set_var_chunk_cache(wanted, max(nelems, 10 * chunks_per_slab + 1), preemption)
+
+
+def _filled(data):
+    return np.ma.filled(np.ma.asarray(data, dtype=np.float32), np.nan)
+
+
+def read_values(var, index):
+    """Read var[index] as float32 with NaN gaps, timed as a "read" span.
+
+    Every data read goes through here (series, exports and derived
+    variables too), so each one is counted in the request's bytes read and
+    skips building netCDF4's masked arrays.
+    """
+    with span("read"):
+        if var.dtype.kind in "iuf" and "_Unsigned" not in var.ncattrs():
+            data = _read_plain(var, index)
+        else:
+            data = _filled(var[index])
+    record_bytes_read(data.nbytes)
+    return data
+
+
+def _read_plain(var, index):
+    """var[index] as float32 with NaN gaps, without making a masked array.
+
+    netCDF4 normally returns a MaskedArray: a mask the size of the data
+    and, for packed variables, a float64 copy of it, which _filled then
+    copies once more. Instead the raw values are read, the invalid ones
+    found with netCDF4's own rules and the rest unpacked straight into
+    float32 (in place, for float32 variables).
+    """
+    mask, scale = var.mask, var.scale
+    var.set_auto_maskandscale(False)
+    try:
+        raw = np.asarray(var[index])
+    finally:
+        var.set_auto_mask(mask)
+        var.set_auto_scale(scale)
+
+    invalid = invalid_values(var, raw) if mask else None
+    data = raw.astype(np.float32, copy=False)
+    if scale:
+        factor = getattr(var, "scale_factor", None)
+        offset = getattr(var, "add_offset", None)
+        if factor is not None:
+            np.multiply(raw, np.float64(factor), out=data, casting="unsafe")
+        if offset is not None:
+            np.add(data, np.float64(offset), out=data, casting="unsafe")
+    if invalid is not None and invalid.any():
+        data[invalid] = np.nan
+    return data
+
+
+def invalid_values(var, raw):
+    """Boolean array of the raw values netCDF4 would mask, or None.
+
+    Those are the _FillValue (the netCDF default one if none is set),
+    every missing_value and values outside valid_min/valid_max/valid_range.
+    """
+    attributes = var.ncattrs()
+    values = []
+    if "missing_value" in attributes:
+        values.extend(np.atleast_1d(var.missing_value))
+    if "_FillValue" in attributes:
+        values.append(var._FillValue)
+    elif raw.dtype.str[1:] in default_fillvals:
+        values.append(default_fillvals[raw.dtype.str[1:]])
+
+    invalid = None
+    for value in values:
+        # Values the variable's type cannot hold can never match
+        if raw.dtype.kind in "iu" and not np.iinfo(raw.dtype).min <= value <= np.iinfo(raw.dtype).max:
+            continue
+        hit = raw == raw.dtype.type(value)
+        invalid = hit if invalid is None else invalid | hit
+
+    low = high = None
+    if "valid_range" in attributes:
+        low, high = var.valid_range
+    if "valid_min" in attributes:
+        low = var.valid_min
+    if "valid_max" in attributes:
+        high = var.valid_max
+    for bound, outside in ((low, np.less), (high, np.greater)):
+        if bound is not None:
+            hit = outside(raw, bound)
+            invalid = hit if invalid is None else invalid | hit
+    return invalid
+
+
+def read_slice(ds, var_name, selection=None):
+    """Read the 2D slab of a variable picked by selection.
+
+    Returns a float32 array with NaN gaps.
+    """
+    var = ds.variables[var_name]
+    tune_chunk_cache(var)
+    return read_values(var, hyperslab(var, selection or {}))
+
+
+def read_time_slice(ds, var_name, time_idx, selection=None):
+    """Read one time step of a variable as a float32 array with NaN gaps.
+
+    selection picks indices along any other non-spatial dimensions.
+    Variables without such dimensions are returned whole.
+    """
+    var = ds.variables[var_name]
+    selection = dict(selection or {})
+    time_dim = time_dimension(var.dimensions)
+    if time_dim is not None:
+        selection[time_dim] = time_idx
+    return read_slice(ds, var_name, selection)
+
+
+def read_time_range(ds, var_name, start, stop, selection=None):
+    """Read time steps start..stop-1 of a variable in a single request.
+
+    Returns a float32 (steps, rows, cols) array with NaN gaps. One
+    contiguous read lets HDF5 decompress each chunk once for all steps,
+    instead of once per step.
+    """
+    var = ds.variables[var_name]
+    if time_dimension(var.dimensions) is None:
+        raise IndexError("variable has no time axis")
+    tune_chunk_cache(var)
+    return read_values(var, hyperslab(var, selection or {}, time_range=(start, stop)))
+
+
+def time_chunk_length(dimensions, chunking):
+    """How many time steps one HDF5 chunk holds (1 when not chunked)."""
+    time_dim = time_dimension(dimensions)
+    if time_dim is None or not chunking:
+        return 1
+    return chunking[list(dimensions).index(time_dim)]
+
+
+# --------------------------------------------------------------------------
+# Memory governor
+# --------------------------------------------------------------------------
+# The size of a read is known from the variable's shape and type before
+# anything is read. Display reads of slabs that would not fit in
+# NETCDF_READ_BUDGET_BYTES are reduced while they are read:
+#
+#   - "mean" and "max" read the slab in bands of whole rows that fit the
+#     budget and block-reduce each band, which gives exactly the result of
+#     reducing the full slab (bands are whole blocks tall);
+#   - "nearest" only needs the centre cell of each block, so just those
+#     rows and columns are read (a strided read).
+#
+# The reduction always keeps the result itself within half the budget, so
+# a request for a full-resolution slice of a huge grid gets a decimated one.
+
+# Bytes per cell of a read in progress: the raw value plus the float32 result
+BYTES_PER_CELL_OVERHEAD = 4
+
+
+def read_budget():
+    return getattr(settings, "NETCDF_READ_BUDGET_BYTES", 256 * 1024 * 1024)
+
+
+def slab_bytes(var, steps=1):
+    """Estimated memory needed to read `steps` 2D slabs of var."""
+    rows, cols = var.shape[-2:]
+    return steps * rows * cols * (var.dtype.itemsize + BYTES_PER_CELL_OVERHEAD)
+
+
+def reduction_factors(shape, max_size=None):
+    """Block factors for a display slice of a grid with this (rows, cols) shape.
+
+    The result fits max_size cells along each axis (when given) and, as
+    float32, half of the read budget.
+    """
+    rows, cols = shape
+    factor_y, factor_x = downsample_factors(shape, max_size or rows, max_size or cols)
+    limit = read_budget() // 2 // 4
+    while math.ceil(rows / factor_y) * math.ceil(cols / factor_x) > limit:
+        factor_y += 1
+        factor_x += 1
+    return factor_y, factor_x
+
+
+def read_reduced_slice(ds, var_name, time_idx, selection, factor_y, factor_x, method="mean"):
+    """One time step of a variable, block-reduced as it is read.
+
+    The same as block_reduce(read_time_slice(...), factor_y, factor_x,
+    method), but the full-resolution slab is never held in memory: rows
+    are read in bands that fit the read budget.
+    """
+    var = ds.variables[var_name]
+    selection = dict(selection or {})
+    time_dim = time_dimension(var.dimensions)
+    if time_dim is not None:
+        selection[time_dim] = time_idx
+    leading = hyperslab(var, selection)[:-2]
+    tune_chunk_cache(var)
+
+    if method == "nearest":
+        return read_values(var, leading + (
+            slice(factor_y // 2, None, factor_y), slice(factor_x // 2, None, factor_x),
+        ))
+
+    rows, cols = var.shape[-2:]
+    # block_reduce copies each band once more while padding it
+    row_bytes = cols * (var.dtype.itemsize + BYTES_PER_CELL_OVERHEAD + 4)
+    band = max(factor_y, read_budget() // 2 // row_bytes // factor_y * factor_y)
+    result = np.empty((math.ceil(rows / factor_y), math.ceil(cols / factor_x)), dtype=np.float32)
+    for start in range(0, rows, band):
+        stop = min(start + band, rows)
+        data = read_values(var, leading + (slice(start, stop), slice(None)))
+        result[start // factor_y:math.ceil(stop / factor_y)] = block_reduce(data, factor_y, factor_x, method)
+    return result
@@ -0,0 +1,374 @@
+// uploader/static/uploader/viewer.js
+//
+// Client side of the NetCDF viewer. Moving the time slider fetches the new
+// slice from the binary slice API and redraws the existing heatmap in place,
+// instead of submitting the form and reloading the whole page.
+
+// --------------------------------------------------------------------------
+// Decode the binary slice format (see uploader/encoding.py)
+// --------------------------------------------------------------------------
+const SLICE_HEADER_BYTES = 32;
+const UINT8_NAN = 255;
+
+function float16ToFloat32(bits) {
+    const sign = bits & 0x8000 ? -1 : 1;
+    const exponent = (bits >> 10) & 0x1f;
+    const fraction = bits & 0x03ff;
+    if (exponent === 0) return sign * Math.pow(2, -14) * (fraction / 1024);
+    if (exponent === 0x1f) return fraction ? NaN : sign * Infinity;
+    return sign * Math.pow(2, exponent - 15) * (1 + fraction / 1024);
+}
+
+// Returns {rows, cols, frames: [[row, row, ...], ...]} with NaN mapped to
+// null so Plotly leaves those cells blank.
+function decodeSlices(buffer) {
+    const view = new DataView(buffer);
+    const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+    if (magic !== "NCS1") throw new Error("Not a slice payload");
+
+    const dtype = view.getUint8(4);
+    const nFrames = view.getUint16(6, true);
+    const rows = view.getUint32(8, true);
+    const cols = view.getUint32(12, true);
+    const scale = view.getFloat64(16, true);
+    const offset = view.getFloat64(24, true);
+
+    let values;
+    if (dtype === 0) {
+        values = new Float32Array(buffer, SLICE_HEADER_BYTES);
+    } else if (dtype === 1) {
+        const halves = new Uint16Array(buffer, SLICE_HEADER_BYTES);
+        values = Float32Array.from(halves, float16ToFloat32);
+    } else {
+        const codes = new Uint8Array(buffer, SLICE_HEADER_BYTES);
+        values = Float32Array.from(codes, (q) => (q === UINT8_NAN ? NaN : offset + q * scale));
+    }
+
+    const frames = [];
+    for (let f = 0; f < nFrames; f++) {
+        const z = [];
+        for (let r = 0; r < rows; r++) {
+            const start = (f * rows + r) * cols;
+            z.push(Array.from(values.subarray(start, start + cols), (v) => (Number.isNaN(v) ? null : v)));
+        }
+        frames.push(z);
+    }
+    return { rows, cols, frames };
+}
+
+// Fetch time steps start..stop-1 in one request (see frames_api).
+// Optional extras: maxSize/method ask the server to block-reduce frames
+// to display resolution (see uploader/lod.py); selection picks indices
+// along other dimensions, e.g. {level: 2}; expression asks for a derived
+// variable instead (see derived_frames_api).
+async function fetchFrames(framesUrl, start, stop, options = {}) {
+    const params = new URLSearchParams({ start, stop, encoding: options.encoding || "float32" });
+    if (options.maxSize) params.set("max_size", options.maxSize);
+    if (options.method) params.set("method", options.method);
+    if (options.expression) params.set("expr", options.expression);
+    for (const [dim, index] of Object.entries(options.selection || {})) {
+        params.set(`dim_${dim}`, index);
+    }
+
+    const response = await fetch(`${framesUrl}?${params}`);
+    if (!response.ok) throw new Error(`Frames request failed: ${response.status}`);
+    return decodeSlices(await response.arrayBuffer());
+}
+
+// --------------------------------------------------------------------------
+// Client-side frame buffer with prefetching
+// --------------------------------------------------------------------------
+// Keeps decoded frames by time index. prefetch() requests any missing
+// frames in the window ahead in contiguous batches, so the server reads
+// each batch with a single var[t0:t1, ...] call. Batches end on multiples
+// of the file's chunk length along time (timeChunk), so no two batches
+// need the same chunk decompressed.
+class FrameBuffer {
+    constructor(options) {
+        this.options = options;
+        this.frames = new Map();
+        this.pending = new Map();
+        this.capacity = options.bufferSize || 256;
+    }
+
+    has(timeIdx) {
+        return this.frames.has(timeIdx);
+    }
+
+    get(timeIdx) {
+        return this.frames.get(timeIdx);
+    }
+
+    async load(timeIdx) {
+        if (this.frames.has(timeIdx)) return this.frames.get(timeIdx);
+        if (this.pending.has(timeIdx)) return this.pending.get(timeIdx);
+        await this.fetchRange(timeIdx, timeIdx + 1);
+        return this.frames.get(timeIdx);
+    }
+
+    prefetch(fromIdx, count) {
+        const last = Math.min(fromIdx + count, this.options.timeCount);
+        const chunk = this.options.timeChunk || 1;
+        const batchSize = Math.ceil(this.options.batchSize / chunk) * chunk;
+        let start = null;
+        for (let t = fromIdx; t <= last; t++) {
+            const missing = t < last && !this.frames.has(t) && !this.pending.has(t);
+            if (missing && start === null) start = t;
+            const batchFull = start !== null && t > start && (t - start >= batchSize || t % batchSize === 0);
+            if (start !== null && (!missing || batchFull)) {
+                this.fetchRange(start, t);
+                start = missing ? t : null;
+            }
+        }
+        this.evictBefore(fromIdx);
+    }
+
+    fetchRange(start, stop) {
+        const request = fetchFrames(this.options.framesUrl, start, stop, this.options).then((result) => {
+            result.frames.forEach((z, i) => this.frames.set(start + i, z));
+        });
+        for (let t = start; t < stop; t++) this.pending.set(t, request);
+        return request.finally(() => {
+            for (let t = start; t < stop; t++) this.pending.delete(t);
+        });
+    }
+
+    // Drop frames furthest behind the play position once over capacity
+    evictBefore(timeIdx) {
+        for (const t of this.frames.keys()) {
+            if (this.frames.size <= this.capacity) break;
+            if (t < timeIdx) this.frames.delete(t);
+        }
+    }
+}
+
+// --------------------------------------------------------------------------
+// Wire the time slider and the play button to the heatmap
+// --------------------------------------------------------------------------
+function initTimeSlider(options) {
+    const slider = document.getElementById("timeSlider");
+    if (!slider) return;
+
+    const buffer = new FrameBuffer({
+        batchSize: 16,
+        prefetchAhead: 48,
+        ...options,
+        timeCount: Number(slider.max) + 1,
+    });
+
+    function draw(timeIdx, z) {
+        Plotly.restyle(options.plotId, { z: [z] });
+        Plotly.relayout(options.plotId, { "title.text": `${options.variable} — Time step ${timeIdx}` });
+    }
+
+    let latestRequest = 0;
+    async function show(timeIdx) {
+        const requestId = ++latestRequest;
+        const z = await buffer.load(timeIdx);
+        // Ignore answers that arrive after a newer slider move
+        if (requestId !== latestRequest) return;
+        draw(timeIdx, z);
+        if (options.statsUrl) updateStepStatistics(options.statsUrl, timeIdx);
+    }
+
+    slider.addEventListener("change", () => show(Number(slider.value)));
+
+    // Playback: advance one frame per tick, but only once that frame has
+    // arrived, while keeping the window ahead of the play head full.
+    const playButton = document.getElementById(options.playButtonId);
+    const fpsSelect = document.getElementById(options.fpsSelectId);
+    let timer = null;
+
+    function tick() {
+        const next = (Number(slider.value) + 1) % buffer.options.timeCount;
+        buffer.prefetch(next, buffer.options.prefetchAhead);
+        if (!buffer.has(next)) return; // still loading; try again next tick
+        slider.value = next;
+        if (typeof updateTimeLabel === "function") updateTimeLabel(next);
+        draw(next, buffer.get(next));
+    }
+
+    function stop() {
+        clearInterval(timer);
+        timer = null;
+        if (playButton) playButton.textContent = "▶ Play";
+        // Bring the statistics row up to date with the frame left on screen
+        if (options.statsUrl) updateStepStatistics(options.statsUrl, Number(slider.value));
+    }
+
+    function start() {
+        const fps = Number(fpsSelect ? fpsSelect.value : 5);
+        buffer.prefetch(Number(slider.value), buffer.options.prefetchAhead);
+        timer = setInterval(tick, 1000 / fps);
+        if (playButton) playButton.textContent = "❚❚ Pause";
+    }
+
+    if (playButton) playButton.addEventListener("click", () => (timer ? stop() : start()));
+    if (fpsSelect) fpsSelect.addEventListener("change", () => { if (timer) { stop(); start(); } });
+    slider.addEventListener("input", () => { if (timer) stop(); });
+}
+
+// --------------------------------------------------------------------------
+// Click a heatmap cell to plot it over time (see series_api)
+// --------------------------------------------------------------------------
+// When the heatmap is downsampled one displayed cell covers a block of
+// grid cells; the whole block is requested and its mean plotted, with
+// its min and max as thin lines.
+function initSeriesPanel(options) {
+    const heatmap = document.getElementById(options.plotId);
+    if (!heatmap || !heatmap.on) return;
+
+    // Size of one displayed cell in grid cells, from the heatmap's x/y
+    function step(values) {
+        return values && values.length > 1 ? Math.round(values[1] - values[0]) : 1;
+    }
+
+    heatmap.on("plotly_click", async (event) => {
+        const point = event.points[0];
+        const fy = step(point.data.y);
+        const fx = step(point.data.x);
+        const y = Math.round(point.y - (fy - 1) / 2);
+        const x = Math.round(point.x - (fx - 1) / 2);
+
+        const params = new URLSearchParams({ y, x, y1: y + fy, x1: x + fx });
+        for (const [dim, index] of Object.entries(options.selection || {})) {
+            params.set(`dim_${dim}`, index);
+        }
+        const response = await fetch(`${options.seriesUrl}?${params}`);
+        if (!response.ok) return;
+        const series = await response.json();
+
+        const traces = [{ x: series.coordinates, y: series.values, mode: "lines+markers", name: "mean" }];
+        if (series.min) {
+            const thin = { mode: "lines", line: { width: 1, dash: "dot" } };
+            traces.push({ x: series.coordinates, y: series.min, name: "min", ...thin });
+            traces.push({ x: series.coordinates, y: series.max, name: "max", ...thin });
+        }
+        const where = fy * fx > 1 ? `rows ${y}–${y + fy - 1}, cols ${x}–${x + fx - 1}` : `row ${y}, col ${x}`;
+        Plotly.react(options.seriesPlotId, traces, {
+            title: { text: `${options.variable} at ${where}` },
+            xaxis: { title: { text: series.along } },
+            height: 320,
+            showlegend: traces.length > 1,
+        });
+    });
+}
+
+// --------------------------------------------------------------------------
+// Refresh the per-time-step row of the statistics table
+// --------------------------------------------------------------------------
+async function updateStepStatistics(statsUrl, timeIdx) {
+    const row = document.getElementById("stepStatistics");
+    if (!row) return;
+    const response = await fetch(`${statsUrl}?time=${timeIdx}`);
+    if (!response.ok) return;
+    const step = (await response.json()).step;
+    if (!step) return;
+
+    const format = (v) => (v === null || v === undefined ? "" : Number(v).toFixed(3));
+    const values = {
+        time_index: step.time_index,
+        min: format(step.min),
+        max: format(step.max),
+        mean: format(step.mean),
+        std: format(step.std),
+        q2: format(step.quantiles["2"]),
+        q98: format(step.quantiles["98"]),
+        nan_count: step.nan_count,
+    };
+    row.querySelectorAll("[data-stat]").forEach((cell) => {
+        cell.textContent = values[cell.dataset.stat];
+    });
+}
+
+// --------------------------------------------------------------------------
+// Resumable chunked uploads for large files
+// --------------------------------------------------------------------------
+// Files bigger than options.threshold are sent in pieces through the
+// chunked upload API. The upload id is remembered in localStorage, so if the
+// page is reloaded or the connection drops, choosing the same file again
+// carries on from the last piece the server received. If something fails,
+// the error is shown in the progress element and the id is kept, so
+// submitting again resumes the same upload.
+function initChunkedUpload(options) {
+    const form = document.getElementById(options.formId);
+    if (!form) return;
+    const fileInput = form.querySelector("input[type=file]");
+    const progress = document.getElementById(options.progressId);
+    const headers = { "X-CSRFToken": options.csrfToken };
+
+    // The JSON answer of an API call; errors that are not JSON (a proxy's
+    // error page, say) become { error: "<status text>" }
+    async function answerOf(response) {
+        try {
+            return await response.json();
+        } catch (error) {
+            return { error: `${response.status} ${response.statusText}` };
+        }
+    }
+
+    async function resumeOrStart(file) {
+        const key = `chunked-upload:${file.name}:${file.size}:${file.lastModified}`;
+        const saved = localStorage.getItem(key);
+        if (saved) {
+            const response = await fetch(`${options.apiUrl}/${saved}`);
+            if (response.ok) return { key, status: await response.json() };
+        }
+        const body = new FormData();
+        body.append("filename", file.name);
+        body.append("size", file.size);
+        const response = await fetch(options.apiUrl, { method: "POST", headers, body });
+        const status = await answerOf(response);
+        if (!response.ok) throw new Error(status.error);
+        localStorage.setItem(key, status.upload_id);
+        return { key, status };
+    }
+
+    // Send the file and return the id of the stored NetCDFFile
+    async function upload(file) {
+        const { key, status } = await resumeOrStart(file);
+        const uploadUrl = `${options.apiUrl}/${status.upload_id}`;
+        let offset = status.offset;
+
+        while (offset < file.size) {
+            const piece = file.slice(offset, offset + options.chunkSize);
+            const response = await fetch(`${uploadUrl}?offset=${offset}`, { method: "PUT", headers, body: piece });
+            const answer = await answerOf(response);
+            if (!response.ok && response.status !== 409) throw new Error(answer.error);
+            offset = answer.offset;
+            if (progress) progress.textContent = `Uploaded ${Math.round((100 * offset) / file.size)}%`;
+        }
+
+        const response = await fetch(`${uploadUrl}/complete`, { method: "POST", headers });
+        const result = await answerOf(response);
+        if (!response.ok) throw new Error(result.error);
+        localStorage.removeItem(key);
+        return result.file_id;
+    }
+
+    form.addEventListener("submit", async (event) => {
+        const file = fileInput && fileInput.files[0];
+        if (!file || file.size <= options.threshold) return;
+        event.preventDefault();
+
+        let fileId;
+        try {
+            fileId = await upload(file);
+        } catch (error) {
+            if (progress) progress.textContent = `Upload failed: ${error.message}. Submit again to resume.`;
+            return;
+        }
+
+        // Show the stored file exactly as if it had been uploaded normally
+        fileInput.value = "";
+        let existing = form.querySelector("input[name=existing_file_id]");
+        if (!existing) {
+            existing = document.createElement("input");
+            existing.type = "hidden";
+            existing.name = "existing_file_id";
+            form.appendChild(existing);
+        }
+        existing.value = fileId;
+        form.submit();
+    });
+}
@@ -0,0 +1,226 @@
+# uploader/stats.py
+
+# --------------------------------------------------------------------------
+# Per-variable statistics computed in one streaming pass
+# --------------------------------------------------------------------------
+# A variable is read one block of time steps at a time, with block edges
+# matching the variable's HDF5 chunks along the time axis, so every chunk
+# is decompressed exactly once. When a single chunk along time is larger
+# than the block size it is read in several blocks instead (the chunk cache
+# keeps it between them), so memory use is always bounded by the block size.
+# Values are read as float32 with NaN gaps (slicing.read_values).
+#
+# For every block we compute, with vectorised NumPy:
+#   * per-time-step min, max, mean, std, NaN count and a few percentiles
+#   * running global min/max/mean/std (merged with Chan's parallel formula)
+#   * a small mergeable quantile sketch for approximate global percentiles
+#
+# The results are stored with the file (see ingest.py) so the viewer can pin
+# colour scales across time steps without touching the data again.
+
+import math
+import warnings
+
+import numpy as np
+
+from .slicing import read_values, tune_chunk_cache
+
+# Percentiles reported for every time step and for the whole variable
+PERCENTILES = (1, 2, 5, 25, 50, 75, 95, 98, 99)
+
+# Upper bound on how much data is read at once when the chunking along
+# time does not already decide it
+BLOCK_BYTES = 64 * 1024 * 1024
+
+
+class QuantileSketch:
+    """Approximate quantiles that can be merged across blocks.
+
+    The sketch keeps at most `size` weighted points that summarise the
+    distribution seen so far. Adding a block contributes that block's own
+    evenly spaced quantiles; whenever the sketch grows too large it is
+    compressed back to `size` points by weighted quantile.
+    """
+
+    def __init__(self, size=256):
+        self.size = size
+        self.points = np.empty(0)
+        self.weights = np.empty(0)
+
+    def add(self, values):
+        values = values[np.isfinite(values)]
+        if not values.size:
+            return
+        k = min(self.size, values.size)
+        # Each point stands for the middle of an equal share of the block
+        points = np.quantile(values, (np.arange(k) + 0.5) / k)
+        self._merge(points, np.full(k, values.size / k))
+
+    def merge(self, other):
+        self._merge(other.points, other.weights)
+
+    def _merge(self, points, weights):
+        self.points = np.concatenate([self.points, points])
+        self.weights = np.concatenate([self.weights, weights])
+        if self.points.size > 2 * self.size:
+            self._compress()
+
+    def _compress(self):
+        order = np.argsort(self.points)
+        points, weights = self.points[order], self.weights[order]
+        positions = np.cumsum(weights) - weights / 2
+        total = weights.sum()
+        targets = (np.arange(self.size) + 0.5) * total / self.size
+        self.points = np.interp(targets, positions, points)
+        self.weights = np.full(self.size, total / self.size)
+
+    def quantile(self, q):
+        """Approximate value below which a fraction q of the data lies."""
+        if not self.points.size:
+            return None
+        order = np.argsort(self.points)
+        points, weights = self.points[order], self.weights[order]
+        positions = (np.cumsum(weights) - weights / 2) / weights.sum()
+        return float(np.interp(q, positions, points))
+
+    def to_dict(self):
+        return {"points": self.points.tolist(), "weights": self.weights.tolist()}
+
+    @classmethod
+    def from_dict(cls, data, size=256):
+        sketch = cls(size)
+        sketch.points = np.asarray(data["points"], dtype=float)
+        sketch.weights = np.asarray(data["weights"], dtype=float)
+        return sketch
+
+
+class RunningStats:
+    """Count, NaN count, min, max, mean and variance merged block by block."""
+
+    def __init__(self):
+        self.count = 0
+        self.nan_count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, values):
+        finite = values[np.isfinite(values)]
+        self.nan_count += values.size - finite.size
+        if not finite.size:
+            return
+        n = finite.size
+        # Blocks are float32; the deviations are summed in float64
+        block_mean = float(finite.mean(dtype=np.float64))
+        block_m2 = float((np.subtract(finite, block_mean, dtype=np.float64) ** 2).sum())
+
+        # Chan et al. parallel update of mean and sum of squared deviations
+        total = self.count + n
+        delta = block_mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += block_m2 + delta * delta * self.count * n / total
+        self.count = total
+        self.min = min(self.min, float(finite.min()))
+        self.max = max(self.max, float(finite.max()))
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / self.count) if self.count else None
+
+    def to_dict(self):
+        found = self.count > 0
+        return {
+            "count": self.count,
+            "nan_count": self.nan_count,
+            "min": self.min if found else None,
+            "max": self.max if found else None,
+            "mean": self.mean if found else None,
+            "std": self.std,
+        }
+
+
+def time_blocks(var, block_bytes=BLOCK_BYTES):
+    """Yield (start, stop) ranges along the first axis for a streaming pass.
+
+    Blocks are whole multiples of the chunk length along that axis so no
+    chunk is read twice, unless one chunk alone is larger than block_bytes;
+    then blocks hold as many steps as fit (at least one).
+    """
+    length = var.shape[0]
+    step_bytes = max(1, int(np.prod(var.shape[1:])) * var.dtype.itemsize)
+    chunking = var.chunking()
+    chunk_len = 1 if chunking == "contiguous" else chunking[0]
+    max_steps = max(1, block_bytes // step_bytes)
+    if max_steps >= chunk_len:
+        block_len = max_steps // chunk_len * chunk_len
+    else:
+        block_len = max_steps
+    for start in range(0, length, block_len):
+        yield start, min(start + block_len, length)
+
+
+def _step_statistics(block):
+    """Vectorised statistics of every time step in a (steps, ...) block."""
+    flat = block.reshape(block.shape[0], -1)
+    finite = np.isfinite(flat)
+    counts = finite.sum(axis=1)
+
+    with warnings.catch_warnings():
+        # Steps that are entirely NaN give NaN statistics, which is fine
+        warnings.simplefilter("ignore", RuntimeWarning)
+        mins = np.nanmin(flat, axis=1)
+        maxs = np.nanmax(flat, axis=1)
+        means = np.nanmean(flat, axis=1)
+        stds = np.nanstd(flat, axis=1)
+        percentiles = np.nanpercentile(flat, PERCENTILES, axis=1)
+
+    def clean(value):
+        return float(value) if np.isfinite(value) else None
+
+    return [
+        {
+            "count": int(counts[i]),
+            "nan_count": int(flat.shape[1] - counts[i]),
+            "min": clean(mins[i]),
+            "max": clean(maxs[i]),
+            "mean": clean(means[i]),
+            "std": clean(stds[i]),
+            "quantiles": {str(p): clean(percentiles[j, i]) for j, p in enumerate(PERCENTILES)},
+        }
+        for i in range(flat.shape[0])
+    ]
+
+
+def compute_variable_statistics(var, block_bytes=BLOCK_BYTES):
+    """Compute global and per-step statistics for one netCDF4 variable.
+
+    Per-step statistics are only produced when the first dimension is time.
+    Returns {"global": {...}, "steps": [...]}.
+    """
+    running = RunningStats()
+    sketch = QuantileSketch()
+    steps = []
+    per_step = bool(var.dimensions) and var.dimensions[0] == "time"
+
+    tune_chunk_cache(var)
+    for start, stop in time_blocks(var, block_bytes):
+        block = read_values(var, (slice(start, stop), Ellipsis))
+        running.add(block.ravel())
+        sketch.add(block.ravel())
+        if per_step:
+            steps.extend(_step_statistics(block))
+
+    summary = running.to_dict()
+    summary["quantiles"] = {str(p): sketch.quantile(p / 100) for p in PERCENTILES}
+    summary["sketch"] = sketch.to_dict()
+    return {"global": summary, "steps": steps}
+
+
+def compute_file_statistics(ds, block_bytes=BLOCK_BYTES):
+    """Statistics for every plottable numeric variable of an open Dataset."""
+    return {
+        name: compute_variable_statistics(var, block_bytes)
+        for name, var in ds.variables.items()
+        if len(var.dimensions) >= 2 and np.issubdtype(var.dtype, np.number)
+    }
@@ -1,12 +1,50 @@
 # uploader/tests.py
+import asyncio
+import datetime
+import hashlib
+import io
+import json
 import tempfile
+import time
+import unittest
 import os
-from django.test import TestCase, Client
+import zipfile
+import zlib
+from asgiref.sync import sync_to_async
+import cftime
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files import File
+from django.core.management import call_command
+from django.test import AsyncClient, TestCase, Client, override_settings
 from django.urls import reverse
 from netCDF4 import Dataset
 import numpy as np
 
-from .models import NetCDFFile
+from .models import ChunkedUpload, NetCDFCollection, NetCDFFile
+from .aggregation import CollectionError, build_collection, collection_index
+from .expressions import ExpressionError, compile_expression
+from .export import export_slots
+from .async_reads import FileLimiter, file_limiter, run_read
+from .bulk import register_in_place
+from .benchmarks import STAGES, benchmark_cases, compare_results, run_benchmarks
+from .ingest import get_catalogue, get_statistics, ingest_file
+from .optimize import (
+    _finish_or_wait, begin_optimize, chunk_shape, optimize_file, optimize_netcdf, optimize_options, zarr,
+)
+from .backends import backend_for, open_dataset
+from .instrumentation import metrics
+from .uploads import HashingUploadHandler, append_chunk, complete_upload
+from .dataset_cache import DatasetCache
+from .slicing import read_slice, read_time_range, read_time_slice
+from .encoding import decode_frames, encode_slice
+from .lod import Pyramid, PyramidCache, block_reduce, downsample_to
+from .stats import QuantileSketch, compute_variable_statistics, time_blocks
+from .response_cache import ByteBudgetLRU, payload_cache, slice_cache
+from .thumbnails import thumbnail_path
+from .timeseries import column_cache
+from .time_axis import NAT, TimeAxis, axis_cache, decode_epochs, parse_time
 
 def create_temp_netcdf_file():
     """Helper function to create a temporary NetCDF file and return its path."""
@@ -25,6 +63,7 @@ def create_temp_netcdf_file():
         lats = ds.createVariable("lat", "f4", ("lat",))
         lons = ds.createVariable("lon", "f4", ("lon",))
         reflectivity = ds.createVariable("reflectivity", "f4", ("time", "lat", "lon"))
+        times.units = "hours since 2025-12-06 00:00:00"
 
         # Fill with test data
         times[:] = [0, 1]
@@ -34,6 +73,15 @@ def create_temp_netcdf_file():
 
     return tmp_path
 
+def create_nc_instance():
+    """Helper function to store a temporary NetCDF file as a NetCDFFile row."""
+    tmp_path = create_temp_netcdf_file()
+    try:
+        with open(tmp_path, "rb") as f:
+            return NetCDFFile.objects.create(file=File(f, name="test.nc"))
+    finally:
+        os.unlink(tmp_path)
+
 class NetCDFUploadTests(TestCase):
     """Unit tests for the NetCDF file upload and view."""
 
@@ -88,3 +136,1438 @@ class NetCDFUploadTests(TestCase):
         context = response.context
         self.assertIsNotNone(context["plot_html"])
         self.assertIn("<div", context["plot_html"])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class SliceApiTests(TestCase):
+    """Tests for the binary slice API."""
+
+    def setUp(self):
+        self.nc_instance = create_nc_instance()
+        self.url = reverse("slice_api", args=[self.nc_instance.id, "reflectivity"])
+
+    def test_float32_slice_matches_file(self):
+        """The decoded float32 payload equals the slice stored in the file."""
+        response = self.client.get(self.url, {"time": 1})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/octet-stream")
+        with Dataset(self.nc_instance.file.path) as ds:
+            expected = ds.variables["reflectivity"][1, ...]
+        np.testing.assert_array_equal(decode_frames(response.content)[0], expected)
+
+    def test_quantised_encodings_are_smaller(self):
+        """float16 and uint8 payloads are smaller and approximately correct."""
+        full = decode_frames(self.client.get(self.url).content)[0]
+        for encoding, tolerance in (("float16", 0.05), ("uint8", 0.2)):
+            response = self.client.get(self.url, {"encoding": encoding})
+            np.testing.assert_allclose(decode_frames(response.content)[0], full, atol=tolerance)
+
+    def test_uint8_preserves_missing_values(self):
+        """NaN survives the uint8 round trip."""
+        data = np.array([[1.0, np.nan], [3.0, 4.0]], dtype=np.float32)
+        decoded = decode_frames(encode_slice(data, "uint8"))[0]
+        self.assertTrue(np.isnan(decoded[0, 1]))
+        np.testing.assert_allclose(decoded[1], data[1], atol=0.01)
+
+    def test_bad_requests(self):
+        """Unknown variables give 404; bad parameters give 400."""
+        missing = reverse("slice_api", args=[self.nc_instance.id, "nope"])
+        self.assertEqual(self.client.get(missing).status_code, 404)
+        self.assertEqual(self.client.get(self.url, {"time": 99}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"encoding": "png"}).status_code, 400)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class DatasetCacheTests(TestCase):
+    """Unit tests for the per-process cache of open Dataset handles."""
+
+    def make_instance(self):
+        return create_nc_instance()
+
+    def test_second_open_is_a_hit(self):
+        """Opening the same file twice reuses the cached handle."""
+        cache = DatasetCache(max_open=2)
+        nc_instance = self.make_instance()
+
+        with cache.open(nc_instance) as first:
+            pass
+        with cache.open(nc_instance) as second:
+            self.assertIs(first, second)
+            self.assertTrue(second.isopen())
+
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+        cache.clear()
+
+    def test_least_recently_used_handle_is_closed(self):
+        """Exceeding max_open closes the least recently used handle."""
+        cache = DatasetCache(max_open=1)
+        first_instance = self.make_instance()
+        second_instance = self.make_instance()
+
+        with cache.open(first_instance) as first:
+            pass
+        with cache.open(second_instance):
+            pass
+
+        self.assertFalse(first.isopen())
+        self.assertEqual(cache.stats()["open"], 1)
+        self.assertEqual(cache.stats()["evictions"], 1)
+        cache.clear()
+
+    def test_modified_file_is_reopened(self):
+        """A newer modification time invalidates the cached handle."""
+        cache = DatasetCache(max_open=2)
+        nc_instance = self.make_instance()
+
+        with cache.open(nc_instance) as first:
+            pass
+        mtime = os.path.getmtime(nc_instance.file.path)
+        os.utime(nc_instance.file.path, (mtime + 10, mtime + 10))
+        with cache.open(nc_instance) as second:
+            self.assertIsNot(first, second)
+
+        self.assertFalse(first.isopen())
+        self.assertEqual(cache.stats()["misses"], 2)
+        cache.clear()
+
+    def test_idle_handles_expire(self):
+        """Handles unused for longer than idle_timeout are closed."""
+        cache = DatasetCache(max_open=2, idle_timeout=0)
+        nc_instance = self.make_instance()
+
+        with cache.open(nc_instance) as first:
+            pass
+        with cache.open(nc_instance):
+            pass
+
+        self.assertFalse(first.isopen())
+        self.assertEqual(cache.stats()["misses"], 2)
+        cache.clear()
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), NETCDF_MAX_FRAMES_PER_REQUEST=1)
+class FramesApiTests(TestCase):
+    """Tests for batched frame reads used by playback."""
+
+    def setUp(self):
+        self.nc_instance = create_nc_instance()
+        self.url = reverse("frames_api", args=[self.nc_instance.id, "reflectivity"])
+
+    def test_frames_match_file_and_are_capped(self):
+        """Frames come back in order, limited to the per-request maximum."""
+        response = self.client.get(self.url, {"start": 0, "stop": 2})
+        self.assertEqual(response["X-Time-Range"], "0,1")
+
+        with override_settings(NETCDF_MAX_FRAMES_PER_REQUEST=32):
+            response = self.client.get(self.url, {"start": 0, "stop": 2})
+        with Dataset(self.nc_instance.file.path) as ds:
+            expected = ds.variables["reflectivity"][:]
+        np.testing.assert_array_equal(decode_frames(response.content), expected)
+
+    def test_out_of_range_is_rejected(self):
+        """A range outside the time axis gives 400."""
+        self.assertEqual(self.client.get(self.url, {"start": 5, "stop": 6}).status_code, 400)
+
+
+class LevelOfDetailTests(TestCase):
+    """Unit tests for block reduction and LOD pyramids."""
+
+    def test_block_reduce_methods(self):
+        """mean, max and nearest reduce 2x2 blocks as expected."""
+        data = np.arange(16, dtype=np.float32).reshape(4, 4)
+        np.testing.assert_array_equal(block_reduce(data, 2, 2, "mean"), [[2.5, 4.5], [10.5, 12.5]])
+        np.testing.assert_array_equal(block_reduce(data, 2, 2, "max"), [[5, 7], [13, 15]])
+        np.testing.assert_array_equal(block_reduce(data, 2, 2, "nearest"), [[5, 7], [13, 15]])
+
+    def test_uneven_shapes_and_nan_are_handled(self):
+        """Edge blocks are padded with NaN and NaN cells are ignored."""
+        data = np.ones((5, 3), dtype=np.float32)
+        data[0, 0] = np.nan
+        reduced, factors = downsample_to(data, 2, 2, "mean")
+        self.assertEqual(factors, (3, 2))
+        np.testing.assert_array_equal(reduced, np.ones((2, 2)))
+
+    def test_pyramid_levels_and_tiles(self):
+        """Each pyramid level halves the grid until it fits one tile."""
+        pyramid = Pyramid(np.random.rand(40, 24), tile_size=8)
+        self.assertEqual([level.shape for level in pyramid.levels], [(40, 24), (20, 12), (10, 6), (5, 3)])
+        self.assertEqual(pyramid.tile_counts(0), (5, 3))
+        self.assertEqual(pyramid.tile(1, 2, 1).shape, (4, 4))
+        with self.assertRaises(IndexError):
+            pyramid.tile(0, 5, 0)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class TileApiTests(TestCase):
+    """Tests for downsampled slices and the tile API."""
+
+    def setUp(self):
+        self.nc_instance = create_nc_instance()
+
+    def test_slice_api_downsamples(self):
+        """max_size reduces the slice and reports the factors used."""
+        url = reverse("slice_api", args=[self.nc_instance.id, "reflectivity"])
+        response = self.client.get(url, {"max_size": 2, "method": "max"})
+        self.assertEqual(response["X-Downsample-Factor"], "2,2")
+        self.assertEqual(decode_frames(response.content).shape, (1, 2, 2))
+
+    def test_tile_api(self):
+        """Tiles come from the cached pyramid; bad coordinates give 404."""
+        url = reverse("tile_api", args=[self.nc_instance.id, "reflectivity", 0, 0, 0])
+        response = self.client.get(url, {"time": 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Pyramid-Levels"], "1")
+        with Dataset(self.nc_instance.file.path) as ds:
+            expected = ds.variables["reflectivity"][1, ...]
+        np.testing.assert_array_equal(decode_frames(response.content)[0], expected)
+
+        missing = reverse("tile_api", args=[self.nc_instance.id, "reflectivity", 3, 0, 0])
+        self.assertEqual(self.client.get(missing).status_code, 404)
+
+    @override_settings(NETCDF_READ_BUDGET_BYTES=1)
+    def test_tile_api_refuses_slabs_over_budget(self):
+        """A slab larger than the read budget is not turned into a pyramid."""
+        url = reverse("tile_api", args=[self.nc_instance.id, "reflectivity", 0, 0, 0])
+        self.assertEqual(self.client.get(url).status_code, 413)
+
+    def test_pyramid_cache_is_bounded_by_bytes(self):
+        """Old pyramids are dropped once the levels exceed the byte budget."""
+        data = np.zeros((4, 4), dtype=np.float32)
+        cache = PyramidCache(max_bytes=Pyramid(data, "mean", 4).nbytes)
+        built = []
+
+        def build():
+            built.append(1)
+            return Pyramid(data, "mean", 4)
+
+        cache.get_or_build("a", build)
+        cache.get_or_build("a", build)
+        cache.get_or_build("b", build)
+        cache.get_or_build("a", build)
+        self.assertEqual(len(built), 3)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), NETCDF_INGEST_ASYNC=False)
+class IngestTests(TestCase):
+    """Tests for the metadata ingest stage."""
+
+    def test_ingest_stores_metadata(self):
+        """Dimensions, variables and decoded times are saved to the database."""
+        nc_instance = ingest_file(create_nc_instance())
+
+        self.assertEqual(nc_instance.ingest_status, NetCDFFile.INGEST_DONE)
+        self.assertEqual(
+            list(nc_instance.dimensions.values_list("name", "size")),
+            [("time", 2), ("lat", 3), ("lon", 3)],
+        )
+        reflectivity = nc_instance.variables.get(name="reflectivity")
+        self.assertTrue(reflectivity.is_plottable)
+        self.assertEqual(reflectivity.shape, [2, 3, 3])
+        self.assertEqual(reflectivity.dtype, "float32")
+
+        lat = nc_instance.variables.get(name="lat")
+        self.assertTrue(lat.is_coordinate)
+        self.assertEqual((lat.min_value, lat.max_value), (-10, 10))
+
+        second = nc_instance.time_steps.get(index=1)
+        self.assertEqual(second.timestamp.isoformat(), "2025-12-06T01:00:00+00:00")
+
+    def test_catalogue_from_database_matches_file(self):
+        """The ingested catalogue describes the same variables as the file."""
+        nc_instance = create_nc_instance()
+        from_file = get_catalogue(nc_instance)
+        from_db = get_catalogue(ingest_file(nc_instance))
+
+        self.assertEqual(
+            [v["name"] for v in from_file["variables"]],
+            [v["name"] for v in from_db["variables"]],
+        )
+        self.assertEqual(from_file["times"], from_db["times"])
+
+    def test_upload_triggers_ingest(self):
+        """Uploading through the view ingests the new file."""
+        tmp_path = create_temp_netcdf_file()
+        try:
+            with open(tmp_path, "rb") as f:
+                response = self.client.post(reverse("upload_netcdf"), {"file": f})
+        finally:
+            os.unlink(tmp_path)
+
+        nc_instance = response.context["nc_file_instance"]
+        nc_instance.refresh_from_db()
+        self.assertTrue(nc_instance.is_ingested)
+        self.assertEqual(nc_instance.variables.count(), 4)
+
+    def test_unreadable_file_is_marked_failed(self):
+        """A file that is not NetCDF is recorded as failed, not raised."""
+        nc_instance = NetCDFFile.objects.create(file=File(tempfile.TemporaryFile(), name="bad.nc"))
+        with self.assertLogs("uploader.ingest", level="ERROR"):
+            ingest_file(nc_instance)
+        self.assertEqual(nc_instance.ingest_status, NetCDFFile.INGEST_FAILED)
+        self.assertTrue(nc_instance.ingest_error)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), NETCDF_INGEST_ASYNC=False)
+class DeduplicationTests(TestCase):
+    """Tests for content-hash deduplication and chunked uploads."""
+
+    def setUp(self):
+        self.tmp_path = create_temp_netcdf_file()
+        with open(self.tmp_path, "rb") as f:
+            self.contents = f.read()
+
+    def tearDown(self):
+        os.unlink(self.tmp_path)
+
+    def upload(self):
+        with open(self.tmp_path, "rb") as f:
+            return self.client.post(reverse("upload_netcdf"), {"file": f})
+
+    def test_handler_hashes_while_streaming(self):
+        """The upload handler attaches the SHA-256 of the streamed file."""
+        handler = HashingUploadHandler()
+        handler.new_file("file", "test.nc", "application/octet-stream", len(self.contents))
+        for start in range(0, len(self.contents), 1000):
+            handler.receive_data_chunk(self.contents[start:start + 1000], start)
+        uploaded = handler.file_complete(len(self.contents))
+
+        self.assertEqual(uploaded.sha256, hashlib.sha256(self.contents).hexdigest())
+
+    def test_repeated_upload_reuses_existing_file(self):
+        """Uploading identical contents twice stores a single row and copy."""
+        first = self.upload().context["nc_file_instance"]
+        second = self.upload().context["nc_file_instance"]
+
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(NetCDFFile.objects.count(), 1)
+        self.assertEqual(first.sha256, hashlib.sha256(self.contents).hexdigest())
+
+    def test_chunked_upload_can_resume(self):
+        """Pieces are appended in order and a wrong offset is rejected."""
+        response = self.client.post(
+            reverse("chunked_upload_start"), {"filename": "big.nc", "size": len(self.contents)}
+        )
+        upload_id = response.json()["upload_id"]
+        detail_url = reverse("chunked_upload_detail", args=[upload_id])
+        half = len(self.contents) // 2
+
+        response = self.client.put(f"{detail_url}?offset=0", self.contents[:half],
+                                   content_type="application/octet-stream")
+        self.assertEqual(response.json()["offset"], half)
+
+        # A client that lost track of its position is told where to resume
+        response = self.client.put(f"{detail_url}?offset=0", self.contents[half:],
+                                   content_type="application/octet-stream")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.client.get(detail_url).json()["offset"], half)
+
+        # Completing early is refused
+        complete_url = reverse("chunked_upload_complete", args=[upload_id])
+        self.assertEqual(self.client.post(complete_url).status_code, 409)
+
+        self.client.put(f"{detail_url}?offset={half}", self.contents[half:],
+                        content_type="application/octet-stream")
+        result = self.client.post(complete_url).json()
+
+        nc_instance = NetCDFFile.objects.get(id=result["file_id"])
+        self.assertTrue(result["created"])
+        self.assertTrue(nc_instance.is_ingested)
+        # Hashed piece by piece as the chunks arrived
+        self.assertEqual(nc_instance.sha256, hashlib.sha256(self.contents).hexdigest())
+        with nc_instance.file.open("rb") as f:
+            self.assertEqual(f.read(), self.contents)
+        self.assertFalse(ChunkedUpload.objects.exists())
+        self.assertEqual(self.client.post(complete_url).status_code, 404)
+
+    def test_completing_twice_stores_one_file(self):
+        """A request holding a stale upload row cannot complete it again."""
+        upload = ChunkedUpload.objects.create(filename="twice.nc", total_size=len(self.contents))
+        append_chunk(upload, 0, io.BytesIO(self.contents))
+        stale = ChunkedUpload.objects.get(pk=upload.pk)
+
+        nc_file, created = complete_upload(upload)
+        self.assertTrue(created)
+        with self.assertRaises(ChunkedUpload.DoesNotExist):
+            complete_upload(stale)
+        self.assertEqual(NetCDFFile.objects.count(), 1)
+
+    def test_chunked_upload_of_known_contents_is_deduplicated(self):
+        """Completing a chunked upload of stored contents returns the stored file."""
+        existing = self.upload().context["nc_file_instance"]
+        upload_id = self.client.post(
+            reverse("chunked_upload_start"), {"filename": "again.nc"}
+        ).json()["upload_id"]
+        self.client.put(reverse("chunked_upload_detail", args=[upload_id]), self.contents,
+                        content_type="application/octet-stream")
+
+        result = self.client.post(reverse("chunked_upload_complete", args=[upload_id])).json()
+        self.assertEqual(result, {"file_id": existing.id, "created": False})
+
+
+class StatisticsTests(TestCase):
+    """Tests for the streaming statistics reducer."""
+
+    def test_streaming_matches_numpy(self):
+        """Block-by-block statistics equal a direct NumPy computation."""
+        tmp_path = create_temp_netcdf_file()
+        try:
+            with Dataset(tmp_path, "r") as ds:
+                var = ds.variables["reflectivity"]
+                data = var[:].astype(np.float64)
+                # A tiny block size forces one block per time step
+                stats = compute_variable_statistics(var, block_bytes=1)
+        finally:
+            os.unlink(tmp_path)
+
+        summary = stats["global"]
+        self.assertEqual(summary["count"], data.size)
+        self.assertAlmostEqual(summary["mean"], data.mean())
+        self.assertAlmostEqual(summary["std"], data.std())
+        self.assertAlmostEqual(summary["min"], data.min())
+        self.assertEqual(len(stats["steps"]), 2)
+        self.assertAlmostEqual(stats["steps"][1]["max"], data[1].max())
+
+    def test_sketch_quantiles_are_close(self):
+        """Merged sketches give quantiles close to the exact values."""
+        rng = np.random.default_rng(0)
+        values = rng.normal(size=200_000)
+        sketch = QuantileSketch()
+        for block in np.array_split(values, 50):
+            part = QuantileSketch()
+            part.add(block)
+            sketch.merge(part)
+
+        # Accuracy is measured in rank: the share of values below the answer
+        for q in (0.02, 0.5, 0.98):
+            rank = np.mean(values < sketch.quantile(q))
+            self.assertAlmostEqual(rank, q, delta=0.002)
+
+    def test_nan_values_are_counted(self):
+        """Missing values are counted and excluded from the statistics."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "gaps.nc")
+            with Dataset(path, "w") as ds:
+                ds.createDimension("time", 1)
+                ds.createDimension("x", 4)
+                var = ds.createVariable("v", "f4", ("time", "x"))
+                var[:] = [[1.0, np.nan, 3.0, np.nan]]
+            with Dataset(path) as ds:
+                stats = compute_variable_statistics(ds.variables["v"])
+
+        self.assertEqual(stats["global"]["nan_count"], 2)
+        self.assertEqual(stats["global"]["mean"], 2.0)
+        self.assertEqual(stats["steps"][0]["nan_count"], 2)
+
+    def test_blocks_split_chunks_larger_than_the_budget(self):
+        """A chunk spanning many time steps is still read a few steps at a time."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "chunked.nc")
+            with Dataset(path, "w") as ds:
+                ds.createDimension("time", 8)
+                ds.createDimension("x", 4)
+                ds.createVariable("v", "f4", ("time", "x"), chunksizes=(8, 4))
+            with Dataset(path) as ds:
+                # Each step is 16 bytes, so 32 bytes hold two steps
+                blocks = list(time_blocks(ds.variables["v"], block_bytes=32))
+                whole = list(time_blocks(ds.variables["v"], block_bytes=1024))
+
+        self.assertEqual(blocks, [(0, 2), (2, 4), (4, 6), (6, 8)])
+        self.assertEqual(whole, [(0, 8)])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), NETCDF_INGEST_ASYNC=False)
+class StatisticsViewTests(TestCase):
+    """Tests for stored statistics in the viewer and API."""
+
+    def test_ingest_stores_statistics_and_pins_colour_scale(self):
+        """Ingested statistics are served by the API and fix the colour limits."""
+        nc_instance = ingest_file(create_nc_instance())
+        url = reverse("stats_api", args=[nc_instance.id, "reflectivity"])
+        stats = self.client.get(url, {"time": 1}).json()
+        self.assertEqual(stats["step"]["time_index"], 1)
+        self.assertIn("98", stats["global"]["quantiles"])
+
+        response = self.client.post(reverse("upload_netcdf"), {
+            "existing_file_id": nc_instance.id,
+            "variable": "reflectivity",
+            "colour_scale": "global",
+        })
+        self.assertEqual(response.context["colour_scale"], "global")
+        self.assertIn(f'"zmax":{stats["global"]["max"]}', response.context["plot_html"])
+
+    def test_stats_api_before_ingest(self):
+        """Files that are not ingested yet have no statistics."""
+        nc_instance = create_nc_instance()
+        url = reverse("stats_api", args=[nc_instance.id, "reflectivity"])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ResponseCacheTests(TestCase):
+    """Tests for the slice/response caches and HTTP revalidation."""
+
+    def setUp(self):
+        slice_cache.clear()
+        payload_cache.clear()
+        self.nc_instance = create_nc_instance()
+        self.url = reverse("slice_api", args=[self.nc_instance.id, "reflectivity"])
+
+    def test_lru_respects_byte_budget(self):
+        """The least recently used entries are evicted once over budget."""
+        cache = ByteBudgetLRU(max_bytes=100)
+        cache.set("a", b"x" * 40)
+        cache.set("b", b"x" * 40)
+        cache.get("a")
+        cache.set("c", b"x" * 40)
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("a"))
+        self.assertEqual(cache.current_bytes, 80)
+
+    def test_repeated_request_is_served_from_cache(self):
+        """The second identical request does not rebuild the payload."""
+        first = self.client.get(self.url, {"time": 1})
+        hits = payload_cache.local.hits
+        second = self.client.get(self.url, {"time": 1})
+        self.assertEqual(payload_cache.local.hits, hits + 1)
+        self.assertEqual(first.content, second.content)
+
+    def test_matching_etag_gives_not_modified(self):
+        """A conditional request with the current ETag gets an empty 304."""
+        response = self.client.get(self.url, {"time": 1})
+        self.assertIn("no-cache", response["Cache-Control"])
+        self.assertIn("Last-Modified", response)
+
+        again = self.client.get(self.url, {"time": 1}, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.content, b"")
+
+        other_time = self.client.get(self.url, {"time": 0}, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(other_time.status_code, 200)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), THUMBNAIL_ROOT=tempfile.mkdtemp())
+class ThumbnailTests(TestCase):
+    """Tests for rendered NetCDF slice thumbnails."""
+
+    def setUp(self):
+        self.nc_instance = create_nc_instance()
+        self.url = reverse("thumbnail_api", args=[self.nc_instance.id, "reflectivity"])
+
+    def test_thumbnail_is_rendered_cached_and_long_lived(self):
+        """A process-pool render is stored by content address and served cacheably."""
+        response = self.client.get(self.url, {"time": 1, "size": 128, "format": "webp"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/webp")
+        self.assertIn("immutable", response["Cache-Control"])
+        body = b"".join(response.streaming_content)
+        self.assertEqual(body[8:12], b"WEBP")
+
+        key = response["ETag"].strip('"')
+        self.assertTrue(os.path.exists(thumbnail_path(key, "webp")))
+
+    @override_settings(THUMBNAIL_WORKERS=0)
+    def test_bad_requests(self):
+        """Unknown variables give 404; bad sizes and time steps give 400."""
+        missing = reverse("thumbnail_api", args=[self.nc_instance.id, "lat"])
+        self.assertEqual(self.client.get(missing).status_code, 404)
+        self.assertEqual(self.client.get(self.url, {"size": 100}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"time": 9}).status_code, 400)
+
+
+def create_4d_nc_instance():
+    """Store a chunked (time, level, lat, lon) file as a NetCDFFile row."""
+    tmp = tempfile.NamedTemporaryFile(suffix=".nc", delete=False)
+    tmp.close()
+    with Dataset(tmp.name, "w", format="NETCDF4") as ds:
+        for name, size in (("time", 4), ("level", 3), ("lat", 5), ("lon", 6)):
+            ds.createDimension(name, size)
+        ds.createVariable("time", "f4", ("time",))[:] = np.arange(4)
+        temp = ds.createVariable(
+            "temperature", "f4", ("time", "level", "lat", "lon"), chunksizes=(2, 1, 5, 6)
+        )
+        temp[:] = np.arange(4 * 3 * 5 * 6, dtype=np.float32).reshape(4, 3, 5, 6)
+    try:
+        with open(tmp.name, "rb") as f:
+            return NetCDFFile.objects.create(file=File(f, name="test4d.nc"))
+    finally:
+        os.unlink(tmp.name)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class NDimensionalSlicingTests(TestCase):
+    """Tests for reading 2D slabs of variables with extra dimensions."""
+
+    def setUp(self):
+        self.nc_instance = create_4d_nc_instance()
+        self.expected = np.arange(4 * 3 * 5 * 6, dtype=np.float32).reshape(4, 3, 5, 6)
+
+    def test_exact_hyperslab_is_read(self):
+        """Selections pick one 2D slab; the chunk cache is sized for it."""
+        with Dataset(self.nc_instance.file.path) as ds:
+            data = read_time_slice(ds, "temperature", 3, {"level": 2})
+            np.testing.assert_array_equal(data, self.expected[3, 2])
+            np.testing.assert_array_equal(read_slice(ds, "temperature"), self.expected[0, 0])
+            frames = read_time_range(ds, "temperature", 1, 3, {"level": 1})
+            np.testing.assert_array_equal(frames, self.expected[1:3, 1])
+            self.assertGreaterEqual(
+                ds.variables["temperature"].get_var_chunk_cache()[0], 2 * 5 * 6 * 4
+            )
+            with self.assertRaises(IndexError):
+                read_time_slice(ds, "temperature", 0, {"level": 3})
+
+    def test_api_and_viewer_use_the_selection(self):
+        """dim_<name> parameters reach the slice API and the viewer form."""
+        url = reverse("slice_api", args=[self.nc_instance.id, "temperature"])
+        response = self.client.get(url, {"time": 2, "dim_level": 1})
+        np.testing.assert_array_equal(decode_frames(response.content)[0], self.expected[2, 1])
+        self.assertEqual(self.client.get(url, {"dim_level": 7}).status_code, 400)
+
+        response = self.client.post(reverse("upload_netcdf"), {
+            "existing_file_id": self.nc_instance.id, "variable": "temperature",
+            "time_idx": 1, "dim_level": 2,
+        })
+        self.assertEqual(response.context["selection"], {"level": 2})
+        self.assertEqual(response.context["time_chunk"], 2)
+
+        # Time steps that are not integers or lie outside the axis give 400
+        for time_idx in ("later", 4, -1):
+            response = self.client.post(reverse("upload_netcdf"), {
+                "existing_file_id": self.nc_instance.id, "variable": "temperature",
+                "time_idx": time_idx,
+            })
+            self.assertEqual(response.status_code, 400)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class SeriesApiTests(TestCase):
+    """Tests for point/box time series and vertical profiles."""
+
+    def setUp(self):
+        column_cache.clear()
+        self.nc_instance = create_4d_nc_instance()
+        self.expected = np.arange(4 * 3 * 5 * 6, dtype=np.float32).reshape(4, 3, 5, 6)
+        self.url = reverse("series_api", args=[self.nc_instance.id, "temperature"])
+
+    def test_point_series_and_neighbour_from_cache(self):
+        """A click reads the whole time axis; a neighbouring click hits the cache."""
+        series = self.client.get(self.url, {"y": 2, "x": 3, "dim_level": 1}).json()
+        self.assertEqual(series["along"], "time")
+        self.assertEqual(series["values"], self.expected[:, 1, 2, 3].tolist())
+        self.assertEqual(len(series["coordinates"]), 4)
+        self.assertNotIn("min", series)
+
+        hits = column_cache.hits
+        series = self.client.get(self.url, {"y": 2, "x": 4, "dim_level": 1}).json()
+        self.assertEqual(series["values"], self.expected[:, 1, 2, 4].tolist())
+        self.assertEqual(column_cache.hits, hits + 1)
+
+    def test_box_mean_and_vertical_profile(self):
+        """Boxes give mean/min/max per step; along=level gives a profile."""
+        series = self.client.get(self.url, {"y": 0, "x": 0, "y1": 2, "x1": 2}).json()
+        box = self.expected[:, 0, 0:2, 0:2].reshape(4, -1)
+        np.testing.assert_allclose(series["values"], box.mean(axis=1))
+        self.assertEqual(series["max"], box.max(axis=1).tolist())
+
+        profile = self.client.get(self.url, {"y": 1, "x": 1, "along": "level", "dim_time": 2}).json()
+        self.assertEqual(profile["values"], self.expected[2, :, 1, 1].tolist())
+        self.assertEqual(len(profile["coordinates"]), 3)
+
+    def test_bad_requests(self):
+        """Missing or out-of-range positions give 400."""
+        self.assertEqual(self.client.get(self.url, {"y": 1}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"y": 9, "x": 0}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"y": 0, "x": 0, "along": "lat"}).status_code, 400)
+
+
+def create_scan_instance(start_hour, steps, name):
+    """Store a one-scan-per-file style NetCDF file starting at start_hour."""
+    tmp = tempfile.NamedTemporaryFile(suffix=".nc", delete=False)
+    tmp.close()
+    with Dataset(tmp.name, "w", format="NETCDF4") as ds:
+        ds.createDimension("time", steps)
+        ds.createDimension("lat", 3)
+        ds.createDimension("lon", 4)
+        times = ds.createVariable("time", "f8", ("time",))
+        times.units = "hours since 2025-12-06 00:00:00"
+        times[:] = np.arange(start_hour, start_hour + steps)
+        refl = ds.createVariable("reflectivity", "f4", ("time", "lat", "lon"))
+        refl[:] = np.arange(start_hour, start_hour + steps, dtype=np.float32)[:, None, None] \
+            + np.zeros((3, 4), dtype=np.float32)
+    try:
+        with open(tmp.name, "rb") as f:
+            return NetCDFFile.objects.create(file=File(f, name=name))
+    finally:
+        os.unlink(tmp.name)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), NETCDF_COLLECTION_WORKERS=2, NETCDF_INGEST_ASYNC=False)
+class CollectionTests(TestCase):
+    """Tests for collections of files joined along time."""
+
+    def setUp(self):
+        # Given out of time order; building sorts them by their time axes
+        self.files = [
+            create_scan_instance(3, 2, "scan_c.nc"),
+            create_scan_instance(0, 1, "scan_a.nc"),
+            create_scan_instance(1, 2, "scan_b.nc"),
+        ]
+        self.collection = NetCDFCollection.objects.create(name="radar")
+        build_collection(self.collection, self.files)
+
+    def test_build_orders_members_and_maps_global_steps(self):
+        """Members are sorted by time; each global step maps to one file."""
+        members = list(self.collection.members.all())
+        self.assertEqual([m.file for m in members], [self.files[1], self.files[2], self.files[0]])
+        self.assertEqual([m.time_offset for m in members], [0, 1, 3])
+        self.assertEqual(self.collection.time_count, 5)
+        self.assertEqual(self.collection.times[3], "2025-12-06T03:00:00+00:00")
+
+        index = collection_index(self.collection)
+        self.assertEqual(index.locate(2), (members[1], 1))
+        self.assertEqual(index.locate(4), (members[2], 1))
+        self.assertEqual(
+            index.split(1, 5), [(members[1], 0, 2), (members[2], 0, 2)]
+        )
+        with self.assertRaises(IndexError):
+            index.locate(5)
+
+    def test_frames_cross_file_boundaries(self):
+        """A batch of frames spanning several files is read from each in turn."""
+        url = reverse("collection_frames_api", args=[self.collection.id, "reflectivity"])
+        response = self.client.get(url, {"start": 0, "stop": 5})
+        frames = decode_frames(response.content)
+        self.assertEqual([float(f[0, 0]) for f in frames], [0, 1, 2, 3, 4])
+        self.assertEqual(self.client.get(url, {"start": 4, "stop": 6}).status_code, 400)
+
+    def test_views_create_and_show_a_collection(self):
+        """The list page builds a collection; its page shows the chosen step."""
+        response = self.client.post(reverse("collection_list"), {
+            "name": "all scans", "files": [f.id for f in self.files],
+        })
+        collection = NetCDFCollection.objects.get(name="all scans")
+        self.assertRedirects(response, reverse("collection_view", args=[collection.id]))
+
+        response = self.client.get(
+            reverse("collection_view", args=[collection.id]), {"time_idx": 4}
+        )
+        self.assertEqual(response.context["member"].file, self.files[0])
+        self.assertIn("Time step 4", response.context["plot_html"])
+        for time_idx in ("x", 5):
+            response = self.client.get(
+                reverse("collection_view", args=[collection.id]), {"time_idx": time_idx}
+            )
+            self.assertEqual(response.status_code, 400)
+
+    def test_files_without_shared_variables_are_rejected(self):
+        """Building fails, and nothing is saved, when no variable is common."""
+        tmp = tempfile.NamedTemporaryFile(suffix=".nc", delete=False)
+        tmp.close()
+        with Dataset(tmp.name, "w", format="NETCDF4") as ds:
+            ds.createDimension("y", 2)
+            ds.createDimension("x", 2)
+            ds.createVariable("other", "f4", ("y", "x"))[:] = 0
+        with open(tmp.name, "rb") as f:
+            odd = NetCDFFile.objects.create(file=File(f, name="odd.nc"))
+        os.unlink(tmp.name)
+
+        response = self.client.post(reverse("collection_list"), {
+            "name": "mixed", "files": [self.files[0].id, odd.id],
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("in common", str(response.context["form"].errors))
+        self.assertFalse(NetCDFCollection.objects.filter(name="mixed").exists())
+
+    def test_empty_members_are_skipped(self):
+        """A file whose time dimension is still empty adds no steps."""
+        empty = create_scan_instance(9, 0, "scan_empty.nc")
+        collection = NetCDFCollection.objects.create(name="with empty")
+        build_collection(collection, self.files + [empty])
+        self.assertEqual(collection.time_count, 5)
+        self.assertNotIn(empty, [m.file for m in collection.members.all()])
+        with self.assertRaises(CollectionError):
+            build_collection(collection, [empty])
+
+    @override_settings(NETCDF_INGEST_ASYNC=True)
+    def test_background_build_shows_progress(self):
+        """With background builds the new collection's page waits for it."""
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(reverse("collection_list"), {
+                "name": "later", "files": [f.id for f in self.files],
+            })
+        collection = NetCDFCollection.objects.get(name="later")
+        self.assertRedirects(response, reverse("collection_view", args=[collection.id]))
+        self.assertEqual(len(callbacks), 1)
+        response = self.client.get(reverse("collection_view", args=[collection.id]))
+        self.assertContains(response, "being built")
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), NETCDF_DERIVED_BLOCK_BYTES=1)
+class DerivedExpressionTests(TestCase):
+    """Tests for derived variables computed from expressions."""
+
+    def setUp(self):
+        self.nc_instance = create_4d_nc_instance()
+        self.expected = np.arange(4 * 3 * 5 * 6, dtype=np.float32).reshape(4, 3, 5, 6)
+
+    def test_unsafe_or_unknown_expressions_are_rejected(self):
+        """Only names, numbers, arithmetic and listed functions are allowed."""
+        for source in ("__import__('os')", "temperature.real", "temperature[0]",
+                       "lambda: 1", "open(temperature)", "1 +", "2 * 3"):
+            with self.assertRaises(ExpressionError):
+                compile_expression(source)
+        catalogue = get_catalogue(self.nc_instance)["variables"]
+        with self.assertRaises(ExpressionError):
+            compile_expression("nothing * 2").check(catalogue)
+        with self.assertRaises(ExpressionError):
+            compile_expression("mean(temperature, lat)").check(catalogue)
+
+    def test_vectorised_evaluation_and_streamed_reductions(self):
+        """Reductions are read in chunk-sized blocks and match NumPy."""
+        expression = compile_expression("temperature - mean(temperature, time)")
+        self.assertIs(expression, compile_expression("temperature - mean(temperature, time)"))
+        with Dataset(self.nc_instance.file.path) as ds:
+            data = expression.evaluate(ds, 1, {"level": 2})
+            np.testing.assert_allclose(data, self.expected[1, 2] - self.expected[:, 2].mean(axis=0))
+            spread = compile_expression("sqrt(std(temperature, time) ** 2) + max(temperature, level)")
+            np.testing.assert_allclose(
+                spread.evaluate(ds, 3, {"level": 0}),
+                self.expected[:, 0].std(axis=0) + self.expected[3].max(axis=0), rtol=1e-5,
+            )
+
+    def test_viewer_and_frames_api_plot_the_expression(self):
+        """The viewer and the derived frames API accept expressions."""
+        response = self.client.post(reverse("upload_netcdf"), {
+            "existing_file_id": self.nc_instance.id, "variable": "temperature",
+            "expression": "where(temperature > 100, temperature, 0)", "time_idx": 1,
+        })
+        self.assertIn("where(temperature \\u003e 100, temperature, 0) — Time step 1",
+                      response.context["plot_html"])
+        self.assertIsNone(response.context["series_along"])
+
+        url = reverse("derived_frames_api", args=[self.nc_instance.id])
+        response = self.client.get(url, {"expr": "temperature * 2", "start": 1, "stop": 3, "dim_level": 1})
+        np.testing.assert_array_equal(decode_frames(response.content), self.expected[1:3, 1] * 2)
+        self.assertEqual(self.client.get(url, {"expr": "os.system"}).status_code, 400)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), NETCDF_EXPORT_BLOCK_BYTES=1)
+class ExportTests(TestCase):
+    """Tests for streaming subset exports."""
+
+    def setUp(self):
+        self.nc_instance = create_4d_nc_instance()
+        self.expected = np.arange(4 * 3 * 5 * 6, dtype=np.float32).reshape(4, 3, 5, 6)
+        self.url = reverse("export_api", args=[self.nc_instance.id])
+        # Without coordinate variables the box is given in grid indices
+        self.params = {
+            "var": "temperature", "start": 1, "stop": 4, "dim_level": 2,
+            "lat_min": 1, "lat_max": 2, "lon_min": 3, "lon_max": 5,
+        }
+
+    def download(self, fmt):
+        response = self.client.get(self.url, dict(self.params, format=fmt))
+        self.assertTrue(response.streaming)
+        return response, b"".join(response.streaming_content)
+
+    def test_csv_rows_cover_the_subset(self):
+        """One CSV row per time step and cell of the box."""
+        response, content = self.download("csv")
+        self.assertIn("test4d", response["Content-Disposition"])
+        rows = content.decode().splitlines()
+        self.assertEqual(rows[0], "time,lat,lon,temperature")
+        self.assertEqual(len(rows), 1 + 3 * 2 * 3)
+        self.assertEqual(rows[1], f"1.0,1.0,3.0,{self.expected[1, 2, 1, 3]}")
+
+    def test_netcdf_is_written_block_by_block(self):
+        """The NetCDF export holds exactly the subset, with its coordinates."""
+        _, content = self.download("nc")
+        with Dataset("subset.nc", mode="r", memory=content) as ds:
+            np.testing.assert_array_equal(ds["temperature"][:], self.expected[1:4, 2, 1:3, 3:6])
+            self.assertEqual(ds["lon"][:].tolist(), [3, 4, 5])
+            self.assertEqual(ds["time"][:].tolist(), [1, 2, 3])
+
+    def test_zarr_zip_holds_zarr_v2_chunks(self):
+        """The zipped store has Zarr v2 metadata and zlib chunks, padded at the end."""
+        _, content = self.download("zarr")
+        with zipfile.ZipFile(io.BytesIO(content)) as store:
+            zarray = json.loads(store.read("temperature/.zarray"))
+            self.assertEqual(zarray["shape"], [3, 2, 3])
+            self.assertEqual(zarray["chunks"], [2, 2, 3])
+            self.assertEqual(
+                json.loads(store.read("temperature/.zattrs"))["_ARRAY_DIMENSIONS"],
+                ["time", "lat", "lon"],
+            )
+            chunks = [
+                np.frombuffer(zlib.decompress(store.read(f"temperature/{i}.0.0")), "<f4").reshape(2, 2, 3)
+                for i in range(2)
+            ]
+        np.testing.assert_array_equal(np.concatenate(chunks)[:3], self.expected[1:4, 2, 1:3, 3:6])
+        self.assertTrue(np.isnan(chunks[1][1]).all())
+
+    def test_bad_requests_and_busy_server(self):
+        """Invalid subsets give 400; with no free export slot the answer is 503."""
+        self.assertEqual(self.client.get(self.url, {"var": "nothing"}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, dict(self.params, lat_min=9)).status_code, 400)
+        self.assertEqual(self.client.get(self.url, dict(self.params, dim_level=5)).status_code, 400)
+
+        taken = 0
+        while export_slots.acquire(blocking=False):
+            taken += 1
+        try:
+            response = self.client.get(self.url, self.params)
+            self.assertEqual(response.status_code, 503)
+        finally:
+            for _ in range(taken):
+                export_slots.release()
+        self.assertEqual(self.download("csv")[0].status_code, 200)
+
+    @override_settings(NETCDF_EXPORT_NETCDF_MAX_BYTES=16)
+    def test_large_netcdf_subsets_are_refused_before_writing(self):
+        """NetCDF subsets over the limit get 413; CSV still streams them."""
+        # 3 steps x 2 x 3 cells x 4 bytes = 72 bytes
+        response = self.client.get(self.url, dict(self.params, format="nc"))
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(self.download("csv")[0].status_code, 200)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class AsyncReadTests(TestCase):
+    """Tests for the async read path (thread pool, per-file limits, cancellation)."""
+
+    def test_limiter_hands_slots_to_waiters_and_skips_cancelled_ones(self):
+        """With one slot per file, waiters run in turn; a cancelled waiter gives way."""
+        limiter = FileLimiter(1)
+        order = []
+
+        async def use(name):
+            await limiter.acquire("f")
+            order.append(name)
+            await asyncio.sleep(0.01)
+            limiter.release("f")
+
+        async def scenario():
+            first = asyncio.create_task(use("first"))
+            await asyncio.sleep(0)
+            cancelled = asyncio.create_task(use("cancelled"))
+            last = asyncio.create_task(use("last"))
+            await asyncio.sleep(0)
+            cancelled.cancel()
+            await asyncio.gather(first, last, return_exceptions=True)
+            await asyncio.sleep(0.01)
+            self.assertEqual(limiter.active("f"), 0)
+
+        asyncio.run(scenario())
+        self.assertEqual(order, ["first", "last"])
+
+    @override_settings(NETCDF_READ_TIMEOUT=0.05)
+    def test_cancelled_or_slow_reads_keep_their_slot_until_done(self):
+        """A read that times out still holds its file's slot until it finishes."""
+        async def scenario():
+            with self.assertRaises(TimeoutError):
+                await run_read("slow-file", time.sleep, 0.2)
+            self.assertEqual(file_limiter.active("slow-file"), 1)
+            await asyncio.sleep(0.3)
+            self.assertEqual(file_limiter.active("slow-file"), 0)
+
+        asyncio.run(scenario())
+
+    async def test_concurrent_async_requests(self):
+        """Slice, frames and metadata requests can run side by side."""
+        nc_instance = await sync_to_async(create_4d_nc_instance)()
+        expected = np.arange(4 * 3 * 5 * 6, dtype=np.float32).reshape(4, 3, 5, 6)
+        client = AsyncClient()
+        slice_url = reverse("slice_api", args=[nc_instance.id, "temperature"])
+        responses = await asyncio.gather(
+            *(client.get(slice_url, {"time": t, "dim_level": 1}) for t in range(4)),
+            client.get(reverse("frames_api", args=[nc_instance.id, "temperature"]), {"start": 0, "stop": 4}),
+            client.get(reverse("metadata_api", args=[nc_instance.id])),
+        )
+        for t in range(4):
+            np.testing.assert_array_equal(decode_frames(responses[t].content)[0], expected[t, 1])
+        self.assertEqual(len(decode_frames(responses[4].content)), 4)
+        metadata = responses[5].json()
+        self.assertIn("temperature", [v["name"] for v in metadata["variables"]])
+        self.assertEqual(metadata["ingest_status"], "pending")
+
+        missing = await client.get(reverse("metadata_api", args=[nc_instance.id + 100]))
+        self.assertEqual(missing.status_code, 404)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), NETCDF_INSTRUMENTATION=True)
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        slice_cache.clear()
+        payload_cache.clear()
+        metrics.clear()
+        self.nc_instance = create_nc_instance()
+
+    def stages(self, response):
+        return {part.split(";")[0] for part in response["Server-Timing"].split(", ")}
+
+    def test_server_timing_and_metrics(self):
+        """Page and API responses report their stages; /metrics sums them up."""
+        response = self.client.post(reverse("upload_netcdf"), {
+            "existing_file_id": self.nc_instance.id, "variable": "reflectivity", "time_idx": 1,
+        })
+        self.assertTrue({"db", "open", "read", "figure", "to_html", "template", "total", "bytes_read"}
+                        <= self.stages(response))
+
+        # The async view reads on the read pool, which keeps the request context
+        response = self.client.get(
+            reverse("slice_api", args=[self.nc_instance.id, "reflectivity"]), {"time": 0}
+        )
+        self.assertTrue({"open", "read", "encode", "total"} <= self.stages(response))
+
+        # Point series read through the same path and are counted too
+        response = self.client.get(
+            reverse("series_api", args=[self.nc_instance.id, "reflectivity"]), {"y": 0, "x": 0}
+        )
+        self.assertTrue({"read", "bytes_read"} <= self.stages(response))
+
+        # Only staff users may read the metrics
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 403)
+        staff = User.objects.create_user("ops", password="secret", is_staff=True)
+        self.client.force_login(staff)
+        text = self.client.get(reverse("metrics")).content.decode()
+        self.assertIn('netcdf_viewer_requests_total{view="upload_netcdf",method="POST",status="200"} 1', text)
+        self.assertIn('netcdf_viewer_stage_duration_seconds_count{view="slice_api",stage="read"} 1', text)
+        self.assertIn('netcdf_viewer_bytes_read_total{view="slice_api"} 36', text)
+
+    def test_sampled_profiles_of_slow_requests(self):
+        """Sampled requests slower than the threshold leave a cProfile dump."""
+        folder = tempfile.mkdtemp()
+        with self.settings(NETCDF_PROFILE_SAMPLE_RATE=1, NETCDF_PROFILE_SLOW_SECONDS=0,
+                           NETCDF_PROFILE_DIR=folder):
+            self.client.get(reverse("upload_netcdf"))
+        profiles = os.listdir(folder)
+        self.assertEqual(len(profiles), 1)
+        self.assertIn("-upload_netcdf-", profiles[0])
+
+    @override_settings(NETCDF_INSTRUMENTATION=False)
+    def test_disabled(self):
+        """Without instrumentation there are no headers and no endpoint."""
+        response = self.client.get(reverse("upload_netcdf"))
+        self.assertNotIn("Server-Timing", response)
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 404)
+
+
+def create_packed_nc_instance():
+    """A (time=3, lat=40, lon=30) int16 variable packed with scale/offset and gaps."""
+    tmp = tempfile.NamedTemporaryFile(suffix=".nc", delete=False)
+    tmp.close()
+    rng = np.random.default_rng(1)
+    with Dataset(tmp.name, "w", format="NETCDF4") as ds:
+        ds.createDimension("time", 3)
+        ds.createDimension("lat", 40)
+        ds.createDimension("lon", 30)
+        ds.createVariable("time", "f4", ("time",))[:] = [0, 1, 2]
+        var = ds.createVariable("rain", "i2", ("time", "lat", "lon"), fill_value=-1)
+        var.scale_factor = 0.1
+        var.add_offset = 5.0
+        var.missing_value = np.int16(-2)
+        var.set_auto_maskandscale(False)
+        raw = rng.integers(0, 500, (3, 40, 30)).astype(np.int16)
+        raw.flat[::7] = -1
+        raw.flat[3::11] = -2
+        var[:] = raw
+    try:
+        with open(tmp.name, "rb") as f:
+            return NetCDFFile.objects.create(file=File(f, name="packed.nc"))
+    finally:
+        os.unlink(tmp.name)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class MemoryGovernorTests(TestCase):
+    def setUp(self):
+        slice_cache.clear()
+        payload_cache.clear()
+        self.nc_instance = create_packed_nc_instance()
+        with Dataset(self.nc_instance.file.path) as ds:
+            self.full = [read_time_slice(ds, "rain", t) for t in range(3)]
+            self.masked = ds.variables["rain"][:]
+
+    def test_plain_reads_match_masked_arrays(self):
+        """Slices are plain float32 arrays with NaN where netCDF4 would mask."""
+        for t in range(3):
+            self.assertEqual(type(self.full[t]), np.ndarray)
+            self.assertEqual(self.full[t].dtype, np.float32)
+            expected = np.ma.filled(self.masked[t].astype(np.float32), np.nan)
+            np.testing.assert_allclose(self.full[t], expected, rtol=1e-6)
+
+    @override_settings(NETCDF_READ_BUDGET_BYTES=4000)
+    def test_oversize_slices_are_reduced_while_read(self):
+        """A slice over the budget comes back block-reduced, band by band."""
+        url = reverse("slice_api", args=[self.nc_instance.id, "rain"])
+        for method in ("mean", "max", "nearest"):
+            response = self.client.get(url, {"time": 1, "method": method})
+            self.assertEqual(response["X-Downsample-Factor"], "2,2")
+            np.testing.assert_allclose(
+                decode_frames(response.content)[0], block_reduce(self.full[1], 2, 2, method), rtol=1e-6,
+            )
+
+        # One oversize frame at a time
+        response = self.client.get(reverse("frames_api", args=[self.nc_instance.id, "rain"]),
+                                   {"start": 0, "stop": 3})
+        self.assertEqual(response["X-Time-Range"], "0,1")
+        self.assertEqual(decode_frames(response.content).shape, (1, 20, 15))
+
+        response = self.client.post(reverse("upload_netcdf"), {
+            "existing_file_id": self.nc_instance.id, "variable": "rain", "time_idx": 2,
+        })
+        self.assertContains(response, "heatmap")
+
+    @override_settings(NETCDF_READ_BUDGET_BYTES=15000)
+    def test_frames_are_limited_to_the_budget(self):
+        """The frames API sends only as many full frames as fit the budget."""
+        response = self.client.get(reverse("frames_api", args=[self.nc_instance.id, "rain"]),
+                                   {"start": 0, "stop": 3})
+        self.assertEqual(response["X-Time-Range"], "0,2")
+        self.assertEqual(response["X-Downsample-Factor"], "1,1")
+        np.testing.assert_array_equal(decode_frames(response.content), np.stack(self.full[:2]))
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(), NETCDF_INGEST_ASYNC=False, NETCDF_OPTIMIZE_UPLOADS=True,
+    NETCDF_OPTIMIZE_CHUNK_BYTES=16, NETCDF_OPTIMIZE_TIME_CHUNK=2,
+)
+class OptimizeTests(TestCase):
+    def test_chunk_shape(self):
+        """Chunks span a few time steps, one level and a square tile."""
+        self.assertEqual(
+            chunk_shape(("time", "level", "lat", "lon"), (100, 5, 1000, 1000), 4, 1024 * 1024, 8),
+            [8, 1, 181, 181],
+        )
+        self.assertEqual(chunk_shape(("lat", "lon"), (10, 4000), 4, 1024, 8), [10, 25])
+
+    def test_upload_is_rewritten_and_read_transparently(self):
+        """New uploads get a rechunked copy, which the viewer then reads."""
+        tmp_path = create_temp_netcdf_file()
+        try:
+            with open(tmp_path, "rb") as f:
+                self.client.post(reverse("upload_netcdf"), {"file": f})
+        finally:
+            os.unlink(tmp_path)
+
+        nc_instance = NetCDFFile.objects.get()
+        self.assertEqual(nc_instance.optimize_status, NetCDFFile.OPTIMIZE_DONE)
+        self.assertTrue(os.path.exists(nc_instance.file.path))
+        self.assertEqual(nc_instance.data_path, nc_instance.optimized_file.path)
+
+        with Dataset(nc_instance.file.path) as original, Dataset(nc_instance.data_path) as copy:
+            self.assertEqual(copy.variables["reflectivity"].chunking(), [2, 1, 2])
+            self.assertEqual(copy.variables["reflectivity"].filters()["zlib"], True)
+            for name, var in original.variables.items():
+                np.testing.assert_array_equal(copy.variables[name][:], var[:])
+                self.assertEqual(copy.variables[name].ncattrs(), var.ncattrs())
+        self.assertEqual(nc_instance.variables.get(name="reflectivity").chunking, [2, 1, 2])
+
+        response = self.client.get(
+            reverse("slice_api", args=[nc_instance.id, "reflectivity"]), {"time": 1}
+        )
+        with Dataset(nc_instance.file.path) as original:
+            np.testing.assert_array_equal(
+                decode_frames(response.content)[0], original.variables["reflectivity"][1]
+            )
+
+    def test_failed_rewrite_keeps_the_original(self):
+        """A file that cannot be rewritten stays readable from the original."""
+        nc_instance = NetCDFFile.objects.create(file=File(io.BytesIO(b"not netcdf"), name="bad.nc"))
+        optimize_file(nc_instance)
+        nc_instance.refresh_from_db()
+        self.assertEqual(nc_instance.optimize_status, NetCDFFile.OPTIMIZE_FAILED)
+        self.assertEqual(nc_instance.data_path, nc_instance.file.path)
+        self.assertEqual(os.listdir(os.path.join(settings.MEDIA_ROOT, "netcdf", "optimized")), [])
+
+    def test_copy_finished_before_ingest_waits_for_it(self):
+        """The ingest switches over to a copy that was ready before it ended."""
+        nc_instance = create_nc_instance()
+        name, path = begin_optimize(nc_instance)
+        self.addCleanup(os.remove, path)
+        chunking = optimize_netcdf(nc_instance.file.path, path, **optimize_options())
+
+        _finish_or_wait(nc_instance, name, chunking)
+        nc_instance.refresh_from_db()
+        self.assertEqual(nc_instance.optimize_status, NetCDFFile.OPTIMIZE_READY)
+        self.assertEqual(nc_instance.data_path, nc_instance.file.path)
+
+        ingest_file(nc_instance)
+        nc_instance.refresh_from_db()
+        self.assertEqual(nc_instance.optimize_status, NetCDFFile.OPTIMIZE_DONE)
+        self.assertEqual(nc_instance.data_path, nc_instance.optimized_file.path)
+        self.assertEqual(nc_instance.variables.get(name="reflectivity").chunking, [2, 1, 2])
+
+
+@unittest.skipUnless(zarr, "zarr is not installed")
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(), NETCDF_OPTIMIZE_CHUNK_BYTES=256, NETCDF_OPTIMIZE_TIME_CHUNK=2,
+    NETCDF_ZARR_READ_THREADS=3,
+)
+class ZarrBackendTests(TestCase):
+    def setUp(self):
+        slice_cache.clear()
+        payload_cache.clear()
+        self.nc_instance = create_packed_nc_instance()
+        call_command("convert_to_zarr", workers=1, stdout=io.StringIO())
+        self.nc_instance.refresh_from_db()
+
+    def test_converted_store_reads_like_the_file(self):
+        """A converted file is read from its store with the same values and masks."""
+        self.assertEqual(self.nc_instance.storage_format, NetCDFFile.STORAGE_ZARR)
+        self.assertEqual(backend_for(self.nc_instance.data_path).name, "zarr")
+
+        with Dataset(self.nc_instance.file.path) as original, open_dataset(self.nc_instance.data_path) as store:
+            # Variables keep the file's order, not Zarr's alphabetical one
+            self.assertEqual(list(store.variables), list(original.variables))
+            self.assertNotIn("_VARIABLE_ORDER", store.ncattrs())
+            rain = store.variables["rain"]
+            self.assertEqual(rain.dimensions, ("time", "lat", "lon"))
+            self.assertEqual(rain.chunking(), [2, 8, 8])
+            self.assertEqual(len(store.dimensions["lat"]), 40)
+            self.assertEqual(rain.missing_value, np.int16(-2))
+            expected = original.variables["rain"][:]
+            actual = rain[:]
+            np.testing.assert_array_equal(actual.mask, expected.mask)
+            np.testing.assert_allclose(actual.filled(np.nan), expected.filled(np.nan))
+            # Row bands that start and end inside chunks, read in parallel
+            np.testing.assert_allclose(
+                read_time_slice(store, "rain", 1, {})[3:37],
+                read_time_slice(original, "rain", 1, {})[3:37],
+            )
+            np.testing.assert_array_equal(rain[2, 3:37, 5], expected[2, 3:37, 5])
+
+        response = self.client.get(
+            reverse("slice_api", args=[self.nc_instance.id, "rain"]), {"time": 2}
+        )
+        with Dataset(self.nc_instance.file.path) as original:
+            np.testing.assert_allclose(
+                decode_frames(response.content)[0], read_time_slice(original, "rain", 2), rtol=1e-6,
+            )
+
+    def test_dataset_cache_shares_store_handles(self):
+        """Zarr handles are not locked, so concurrent requests share them."""
+        cache = DatasetCache()
+        with cache.open(self.nc_instance) as first, cache.open(self.nc_instance) as second:
+            self.assertIs(first, second)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), NETCDF_BULK_BATCH_SIZE=2)
+class BulkIngestTests(TestCase):
+    def setUp(self):
+        # Three distinct files, a copy of the first and one that is not NetCDF
+        self.folder = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.folder, "day2"))
+        for name in ("a.nc", "b.nc", "day2/c.nc"):
+            tmp_path = create_temp_netcdf_file()
+            os.replace(tmp_path, os.path.join(self.folder, name))
+        with open(os.path.join(self.folder, "a.nc"), "rb") as f:
+            contents = f.read()
+        with open(os.path.join(self.folder, "day2", "copy.nc"), "wb") as f:
+            f.write(contents)
+        with open(os.path.join(self.folder, "broken.nc"), "wb") as f:
+            f.write(b"not netcdf")
+
+    def test_directory_ingest_reports_failures_and_duplicates(self):
+        """Every new file is stored and ingested; bad files do not stop the run."""
+        out, err = io.StringIO(), io.StringIO()
+        call_command("ingest_netcdf", self.folder, workers=2, stdout=out, stderr=err)
+
+        self.assertEqual(NetCDFFile.objects.count(), 3)
+        for nc_file in NetCDFFile.objects.all():
+            self.assertTrue(nc_file.is_ingested)
+            self.assertTrue(os.path.exists(nc_file.file.path))
+            self.assertEqual(get_catalogue(nc_file)["variables"][-1]["name"], "reflectivity")
+            # Statistics are computed after the files are stored
+            self.assertIsNotNone(get_statistics(nc_file, "reflectivity"))
+        self.assertIn("broken.nc", err.getvalue())
+        self.assertIn("3 stored, 1 duplicate(s), 1 failed", out.getvalue())
+
+        # A second run finds nothing new
+        call_command("ingest_netcdf", self.folder, stdout=out, stderr=io.StringIO())
+        self.assertEqual(NetCDFFile.objects.count(), 3)
+
+    def test_bulk_upload_api(self):
+        """Several files in one POST; repeats come back as duplicates."""
+        names = ["a.nc", "b.nc", "broken.nc"]
+        handles = [open(os.path.join(self.folder, name), "rb") for name in names]
+        try:
+            response = self.client.post(reverse("bulk_upload"), {"files": handles})
+        finally:
+            for f in handles:
+                f.close()
+        self.assertEqual(response.status_code, 201)
+        report = response.json()
+        self.assertEqual(len(report["created"]), 2)
+        self.assertEqual([item["name"] for item in report["failed"]], ["broken.nc"])
+        with open(os.path.join(self.folder, "a.nc"), "rb") as f:
+            first = NetCDFFile.objects.get(sha256=hashlib.sha256(f.read()).hexdigest())
+
+        # Statistics are left to the background jobs, not the request
+        self.assertIsNone(get_statistics(first, "reflectivity"))
+
+        with open(os.path.join(self.folder, "day2", "copy.nc"), "rb") as f:
+            report = self.client.post(reverse("bulk_upload"), {"files": [f]}).json()
+        self.assertEqual(report["created"], [])
+        self.assertEqual(report["duplicates"], [{"id": first.id, "name": "copy.nc"}])
+
+        # A row whose file is gone from storage is not a duplicate
+        os.remove(first.file.path)
+        with open(os.path.join(self.folder, "day2", "copy.nc"), "rb") as f:
+            report = self.client.post(reverse("bulk_upload"), {"files": [f]}).json()
+        self.assertEqual(len(report["created"]), 1)
+
+    @override_settings(NETCDF_INGEST_ASYNC=False)
+    def test_bulk_upload_api_schedules_statistics(self):
+        """Files stored by the API get their statistics from submit_statistics."""
+        with open(os.path.join(self.folder, "a.nc"), "rb") as f:
+            report = self.client.post(reverse("bulk_upload"), {"files": [f]}).json()
+        nc_file = NetCDFFile.objects.get(id=report["created"][0]["id"])
+        self.assertIsNotNone(get_statistics(nc_file, "reflectivity"))
+
+    def test_register_in_place(self):
+        """Files inside MEDIA_ROOT keep their place; others cannot be registered."""
+        inside = os.path.join(settings.MEDIA_ROOT, "campaign", "scan.nc")
+        self.assertEqual(register_in_place(inside), "campaign/scan.nc")
+        with self.assertRaises(SuspiciousFileOperation):
+            register_in_place(os.path.join(self.folder, "a.nc"))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class TimeAxisTests(TestCase):
+    """Tests for the decoded time axis and its cache."""
+
+    def test_vectorised_decoding_matches_cftime(self):
+        """Offsets decode to epoch milliseconds exactly like cftime does."""
+        values = np.array([0, 0.5, 1, 36.25, np.nan])
+        epochs = decode_epochs(values, "hours since 2025-12-06 00:00:00")
+        expected = [
+            int(d.replace(tzinfo=datetime.timezone.utc).timestamp() * 1000)
+            for d in cftime.num2date(values[:4], "hours since 2025-12-06 00:00:00",
+                                     only_use_cftime_datetimes=False, only_use_python_datetimes=True)
+        ]
+        self.assertEqual(epochs[:4].tolist(), expected)
+        self.assertEqual(epochs[4], NAT)
+        # Model calendars have no real-world dates
+        self.assertTrue((decode_epochs(values, "days since 2000-01-01", "noleap") == NAT).all())
+        self.assertEqual(
+            decode_epochs([1500], "microseconds since 1970-01-01T00:00:01")[0], 1002,
+        )
+
+    def test_lookups_and_ticks(self):
+        """Nearest step and time ranges use binary search; ticks stay few."""
+        start = parse_time("2020-01-01T00:00:00")
+        epochs = start + np.arange(50000, dtype=np.int64) * 300 * 1000
+        axis = TimeAxis(epochs, np.arange(50000.0))
+
+        self.assertEqual(axis.nearest(parse_time("2020-01-01T00:07:00")), 1)
+        self.assertEqual(axis.nearest(parse_time("2020-01-01T00:08:00")), 2)
+        self.assertEqual(axis.nearest(parse_time("1999-01-01")), 0)
+        self.assertEqual(axis.nearest(parse_time("2099-01-01")), 49999)
+        self.assertEqual(axis.span(parse_time("2020-01-01T01:00:00"), parse_time("2020-01-01T02:00:00")), (12, 25))
+        self.assertEqual(axis.label(12), "2020-01-01T01:00:00Z")
+
+        ticks = axis.ticks(10)
+        self.assertEqual(len(ticks), 10)
+        self.assertEqual((ticks[0]["index"], ticks[-1]["index"]), (0, 49999))
+        self.assertEqual((ticks[0]["position"], ticks[-1]["position"]), (0, 100))
+        # The axis spans months, so ticks are labelled with dates
+        self.assertEqual(ticks[0]["label"], "2020-01-01")
+
+        # Unsorted axes are searched through their sort order
+        shuffled = TimeAxis(epochs[[2, 0, 1]], np.arange(3.0))
+        self.assertEqual(shuffled.nearest(int(epochs[2])), 0)
+
+    def test_time_api_and_page(self):
+        """The API answers lookups; the page draws ticks instead of every step."""
+        axis_cache.clear()
+        nc_instance = create_nc_instance()
+        url = reverse("time_api", args=[nc_instance.id])
+
+        axis = self.client.get(url, {"index": 1, "at": "2025-12-06T00:40:00Z"}).json()
+        self.assertEqual((axis["count"], axis["decoded"]), (2, True))
+        self.assertEqual(axis["label"], "2025-12-06T01:00:00Z")
+        self.assertEqual(axis["nearest"], {"index": 1, "label": "2025-12-06T01:00:00Z"})
+        span = self.client.get(url, {"from": "2025-12-06T00:30:00"}).json()["span"]
+        self.assertEqual(span, {"start": 1, "stop": 2})
+        self.assertEqual(self.client.get(url, {"index": 5}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"at": "yesterday"}).status_code, 400)
+
+        response = self.client.post(reverse("upload_netcdf"), {
+            "existing_file_id": nc_instance.id, "variable": "reflectivity", "time_idx": 1,
+        })
+        self.assertEqual(response.context["selected_time"], "2025-12-06T01:00:00Z")
+        self.assertEqual(len(response.context["time_axis"]["ticks"]), 2)
+
+
+class BenchmarkTests(TestCase):
+    def test_benchmark_run_and_baseline_comparison(self):
+        """A tiny benchmark run times every stage; slower stages are flagged."""
+        cases = benchmark_cases(["tiny"], ["contiguous", "step"], [0, 4], ["i2"])
+        # Compressed contiguous storage is not possible and is skipped
+        self.assertEqual([c["name"] for c in cases], [
+            "tiny-contiguous-z0-i2", "tiny-step-z0-i2", "tiny-step-z4-i2",
+        ])
+
+        results = run_benchmarks(cases[:1], repeat=2)
+        stages = results["cases"]["tiny-contiguous-z0-i2"]
+        self.assertEqual(list(stages), list(STAGES))
+        for summary in stages.values():
+            self.assertEqual(summary["n"], 2)
+            self.assertLessEqual(summary["p50"], summary["p99"])
+        self.assertEqual(compare_results(results, results), [])
+
+        slower = json.loads(json.dumps(results))
+        slower["cases"]["tiny-contiguous-z0-i2"]["page"]["p50"] = stages["page"]["p50"] * 2 + 5
+        self.assertEqual(
+            [(name, stage) for name, stage, _, _ in compare_results(slower, results)],
+            [("tiny-contiguous-z0-i2", "page")],
+        )
+
+
+class FileListTests(TestCase):
+    """Tests for the paged file list and the database settings behind it."""
+
+    def setUp(self):
+        # More than two pages; rows created together share uploaded_at, so
+        # the id has to break ties
+        NetCDFFile.objects.bulk_create(
+            NetCDFFile(file=f"netcdf/list_{i}.nc", ingest_status=NetCDFFile.INGEST_DONE)
+            for i in range(120)
+        )
+        NetCDFFile.objects.filter(file="netcdf/list_7.nc").update(ingest_status=NetCDFFile.INGEST_FAILED)
+
+    def test_pages_cover_every_file_once_newest_first(self):
+        """Following "Older files" visits every file once, newest first."""
+        expected = list(NetCDFFile.objects.order_by("-uploaded_at", "-id").values_list("id", flat=True))
+        seen = []
+        params = {}
+        while True:
+            response = self.client.get(reverse("file_list"), params)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(nc_file.id for nc_file in response.context["files"])
+            if not response.context["next_cursor"]:
+                break
+            params = {"after": response.context["next_cursor"]}
+        self.assertEqual(seen, expected)
+
+    def test_status_filter_and_bad_cursor(self):
+        """The list can be limited to one status; broken cursors are rejected."""
+        response = self.client.get(reverse("file_list"), {"status": "failed"})
+        self.assertEqual([f.file.name for f in response.context["files"]], ["netcdf/list_7.nc"])
+        self.assertIsNone(response.context["next_cursor"])
+
+        response = self.client.get(reverse("file_list"), {"after": "yesterday,3"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_sqlite_connections_are_tuned(self):
+        """init_command runs on every connection (the test database is in memory,
+        so only the busy timeout can be checked here)."""
+        from django.db import connection
+        if connection.vendor != "sqlite":
+            self.skipTest("SQLite only")
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], 20000)
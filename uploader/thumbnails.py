@@ -0,0 +1,195 @@
+# uploader/thumbnails.py
+
+# --------------------------------------------------------------------------
+# Thumbnails and quicklooks for NetCDF slices and archive images
+# --------------------------------------------------------------------------
+# Previews are small PNG or WebP images rendered once and then kept in a
+# cache directory (THUMBNAIL_ROOT). Every file there is named after a hash of
+# everything that went into it - the source's contents or version, the size,
+# the format and the colour limits - so a cached thumbnail never has to be
+# invalidated: if anything changes, the name changes too. That is also what
+# makes it safe to serve them with long-lived cache headers.
+#
+# Rendering decodes and resizes images, which is CPU work, so it happens on
+# a small process pool (THUMBNAIL_WORKERS) instead of in the request thread.
+# The render functions below only use NumPy, netCDF4 and Pillow - no
+# database access - so they can run in those worker processes.
+
+import hashlib
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+from django.conf import settings
+from django.http import FileResponse
+from django.utils.cache import patch_cache_control
+from PIL import Image
+from plotly.colors import hex_to_rgb, sequential
+
+from .backends import open_dataset
+from .lod import downsample_to
+from .slicing import read_reduced_slice, reduction_factors
+
+# Output formats and their content types
+FORMATS = {"png": "image/png", "webp": "image/webp"}
+
+# Edge lengths (in pixels) a thumbnail may be requested at
+SIZES = (128, 256, 512, 1024)
+
+
+def thumbnail_key(*parts):
+    """Content address of a thumbnail made from the given inputs."""
+    return hashlib.sha256("\x1f".join(str(p) for p in parts).encode()).hexdigest()
+
+
+def thumbnail_path(key, fmt):
+    """Where the thumbnail with this key is cached.
+
+    Two levels of subdirectories keep any one directory from growing huge.
+    """
+    root = getattr(settings, "THUMBNAIL_ROOT", os.path.join(settings.MEDIA_ROOT, "thumbnails"))
+    return os.path.join(root, key[:2], key[2:4], f"{key}.{fmt}")
+
+
+# --------------------------------------------------------------------------
+# Rendering (runs in the worker processes)
+# --------------------------------------------------------------------------
+def _save(image, dest, fmt):
+    """Write an image to dest atomically, so readers never see half a file."""
+    directory = os.path.dirname(dest)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            if fmt == "webp":
+                image.save(f, format="WEBP", quality=80, method=4)
+            else:
+                image.save(f, format="PNG", optimize=True)
+        os.replace(tmp, dest)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return dest
+
+
+def render_image_thumbnail(dest, fmt, size, src):
+    """Downscale an image file to fit in size x size pixels."""
+    with Image.open(src) as image:
+        # Lets JPEG decoding skip straight to a reduced resolution
+        image.draft("RGB", (size, size))
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        has_alpha = image.mode in ("RGBA", "LA") or "transparency" in image.info
+        image = image.convert("RGBA" if has_alpha else "RGB")
+    return _save(image, dest, fmt)
+
+
+# Plasma is the default heatmap colour scale in the viewer, so thumbnails
+# look like small versions of the plot. As (stops, 3) RGB values 0-255.
+COLOUR_SCALE = np.array([hex_to_rgb(c) for c in sequential.Plasma], dtype=np.float64)
+
+
+def colourise(data, vmin=None, vmax=None):
+    """Map a 2D float array to an RGBA image; NaN cells become transparent."""
+    finite = np.isfinite(data)
+    if vmin is None:
+        vmin = float(data[finite].min()) if finite.any() else 0.0
+    if vmax is None:
+        vmax = float(data[finite].max()) if finite.any() else 1.0
+    span = (vmax - vmin) or 1.0
+    scaled = np.clip((np.where(finite, data, vmin) - vmin) / span, 0, 1)
+    stops = np.linspace(0, 1, len(COLOUR_SCALE))
+    rgba = np.zeros(data.shape + (4,), dtype=np.uint8)
+    for channel in range(3):
+        rgba[..., channel] = np.interp(scaled, stops, COLOUR_SCALE[:, channel]).round()
+    rgba[..., 3] = np.where(finite, 255, 0)
+    return Image.fromarray(rgba, "RGBA")
+
+
+def render_slice_thumbnail(
+    dest, fmt, size, nc_path, var_name, time_idx, vmin=None, vmax=None, selection=None
+):
+    """Render one variable/time step of a NetCDF file as a small heatmap.
+
+    The slab is block-averaged while it is read, in row bands within the
+    read budget (see slicing.py), so a quicklook of a huge grid never holds
+    it at full resolution.
+    """
+    with open_dataset(nc_path) as ds:
+        factor_y, factor_x = reduction_factors(ds.variables[var_name].shape[-2:], size)
+        data = read_reduced_slice(ds, var_name, time_idx, selection, factor_y, factor_x, "mean")
+    data, _ = downsample_to(data, size, size, "mean")
+
+    # Row 0 is at the bottom of the viewer's heatmap, so flip to match
+    image = colourise(np.flipud(data), vmin, vmax)
+
+    # Coarse grids are enlarged with nearest-neighbour so cells stay sharp
+    scale = size // max(image.size)
+    if scale > 1:
+        image = image.resize((image.width * scale, image.height * scale), Image.Resampling.NEAREST)
+    return _save(image, dest, fmt)
+
+
+# --------------------------------------------------------------------------
+# The render service
+# --------------------------------------------------------------------------
+_executor = None
+_lock = threading.Lock()
+_in_flight = {}
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=getattr(settings, "THUMBNAIL_WORKERS", 2))
+    return _executor
+
+
+def get_thumbnail(key, fmt, size, render, *args):
+    """Return the path of a cached thumbnail, rendering it on a miss.
+
+    render(dest, fmt, size, *args) runs on the process pool. Requests for a
+    thumbnail that is already being rendered wait for that render instead
+    of starting another one. Errors raised by render are re-raised here.
+    """
+    path = thumbnail_path(key, fmt)
+    if os.path.exists(path):
+        return path
+
+    # THUMBNAIL_WORKERS = 0 renders in the request thread (useful for tests)
+    if not getattr(settings, "THUMBNAIL_WORKERS", 2):
+        return render(path, fmt, size, *args)
+
+    global _executor
+    with _lock:
+        future = _in_flight.get(path)
+        if future is None:
+            future = _get_executor().submit(render, path, fmt, size, *args)
+            _in_flight[path] = future
+    try:
+        return future.result(timeout=getattr(settings, "THUMBNAIL_TIMEOUT", 60))
+    except BrokenProcessPool:
+        # A worker died (e.g. out of memory); start a fresh pool next time
+        with _lock:
+            _executor = None
+        raise
+    finally:
+        with _lock:
+            _in_flight.pop(path, None)
+
+
+def thumbnail_response(path, fmt, key):
+    """Serve a cached thumbnail with long-lived cache headers.
+
+    The thumbnail for a URL only changes when its source does, and the
+    pages that link to thumbnails put the source's version in the URL.
+    """
+    response = FileResponse(open(path, "rb"), content_type=FORMATS[fmt])
+    response["ETag"] = f'"{key}"'
+    patch_cache_control(
+        response, public=True, immutable=True,
+        max_age=getattr(settings, "THUMBNAIL_MAX_AGE", 365 * 24 * 60 * 60),
+    )
+    return response
@@ -0,0 +1,224 @@
+# uploader/time_axis.py
+
+# --------------------------------------------------------------------------
+# The time axis of a file: decoded once, searched with binary search
+# --------------------------------------------------------------------------
+# Files can have tens of thousands of time steps. Instead of handing every
+# raw offset ("hours since ...") to the page, the axis is decoded once into
+# a compact int64 array of milliseconds since 1970-01-01 UTC and cached
+# per file (keyed by its content version, like response_cache.py).
+#
+#   - Decoding is vectorised: cftime decodes only the units' reference
+#     date, and the offsets are scaled and added to it with NumPy. Units
+#     spelled in a way not listed in UNIT_MS fall back to cftime.
+#   - nearest() and span() find steps by time with binary search
+#     (np.searchsorted) instead of scanning the axis.
+#   - ticks() picks a handful of evenly spaced steps to label, so the page
+#     never draws one tick per step.
+#
+# Steps that cannot be decoded (no units, a model calendar, a missing
+# value) hold NAT; such axes are labelled with their raw values instead.
+
+import datetime
+
+import cftime
+import numpy as np
+from django.conf import settings
+
+from .dataset_cache import dataset_cache
+from .response_cache import ByteBudgetLRU, make_key
+
+# Marks a step without a usable timestamp
+NAT = np.iinfo(np.int64).min
+
+# Milliseconds per CF time unit
+UNIT_MS = {}
+for _names, _ms in (
+    (("us", "usec", "usecs", "microsecond", "microseconds"), 0.001),
+    (("ms", "msec", "msecs", "millisecond", "milliseconds"), 1),
+    (("s", "sec", "secs", "second", "seconds"), 1000),
+    (("min", "mins", "minute", "minutes"), 60 * 1000),
+    (("h", "hr", "hrs", "hour", "hours"), 3600 * 1000),
+    (("d", "day", "days"), 86400 * 1000),
+):
+    UNIT_MS.update(dict.fromkeys(_names, _ms))
+
+# Calendars whose dates are ordinary (proleptic) Gregorian dates
+REAL_CALENDARS = ("standard", "gregorian", "proleptic_gregorian")
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+axis_cache = ByteBudgetLRU(getattr(settings, "NETCDF_TIME_AXIS_CACHE_BYTES", 16 * 1024 * 1024))
+
+
+# --------------------------------------------------------------------------
+# Decoding
+# --------------------------------------------------------------------------
+def _to_ms(moment):
+    return (moment.replace(tzinfo=None) - _EPOCH) // datetime.timedelta(milliseconds=1)
+
+
+def _decode_with_cftime(values, units, calendar, epochs):
+    """Slow path: decode every value with cftime."""
+    finite = np.isfinite(values)
+    try:
+        dates = cftime.num2date(
+            values[finite], units, calendar, only_use_cftime_datetimes=False,
+            only_use_python_datetimes=True,
+        )
+    except (ValueError, TypeError, OverflowError):
+        return epochs
+    epochs[finite] = [_to_ms(d) for d in np.ravel(dates)]
+    return epochs
+
+
+def decode_epochs(values, units, calendar="standard"):
+    """CF time values as int64 milliseconds since 1970 (NAT if undecodable)."""
+    values = np.ma.filled(np.ma.asarray(values, dtype=np.float64), np.nan).ravel()
+    epochs = np.full(values.shape, NAT, dtype=np.int64)
+    calendar = str(calendar or "standard").lower()
+    if not units or calendar not in REAL_CALENDARS or " since " not in units:
+        return epochs
+
+    unit = units.split(" since ")[0].strip().lower()
+    try:
+        origin = cftime.num2date(
+            0, units, calendar, only_use_cftime_datetimes=False, only_use_python_datetimes=True,
+        )
+    except (ValueError, TypeError):
+        return epochs
+    if unit not in UNIT_MS:
+        return _decode_with_cftime(values, units, calendar, epochs)
+
+    scale = UNIT_MS[unit]
+    # Values that would overflow int64 milliseconds stay NAT
+    valid = np.isfinite(values) & (np.abs(values) < 2.0 ** 62 / scale)
+    epochs[valid] = _to_ms(origin) + np.round(values[valid] * scale).astype(np.int64)
+    return epochs
+
+
+def epochs_to_datetimes(epochs):
+    """Timezone-aware datetimes (None for NAT) for an epoch array."""
+    dates = epochs.astype("datetime64[ms]").astype(object)
+    return [
+        None if e == NAT else d.replace(tzinfo=datetime.timezone.utc)
+        for e, d in zip(epochs.tolist(), dates.tolist())
+    ]
+
+
+# --------------------------------------------------------------------------
+# The axis
+# --------------------------------------------------------------------------
+class TimeAxis:
+    """Decoded times of one file: epochs (int64 ms) and the raw values."""
+
+    def __init__(self, epochs, values):
+        self.epochs = epochs
+        self.values = values
+        self.decoded = bool(len(epochs)) and bool((epochs != NAT).all())
+        # Binary search needs ascending times; unsorted axes are searched
+        # through an argsort
+        self.order = None
+        if self.decoded and (np.diff(epochs) < 0).any():
+            self.order = np.argsort(epochs, kind="stable")
+
+    def __len__(self):
+        return len(self.epochs)
+
+    # Labels --------------------------------------------------------------
+    def label(self, index):
+        return self.labels([index])[0]
+
+    def labels(self, indices, unit="s"):
+        """ISO 8601 labels (UTC) for steps, or their raw values if not decoded."""
+        indices = np.asarray(indices, dtype=np.int64)
+        if not self.decoded:
+            return [f"{v:g}" for v in self.values[indices].tolist()]
+        text = np.datetime_as_string(self.epochs[indices].astype("datetime64[ms]"), unit=unit, timezone="UTC")
+        return text.tolist()
+
+    # Lookups -------------------------------------------------------------
+    def _search(self, epoch_ms, side):
+        sorted_epochs = self.epochs if self.order is None else self.epochs[self.order]
+        return int(np.searchsorted(sorted_epochs, epoch_ms, side=side)), sorted_epochs
+
+    def nearest(self, epoch_ms):
+        """Index of the step closest to a time in epoch milliseconds."""
+        if not self.decoded:
+            raise ValueError("The time axis has no decoded timestamps")
+        position, sorted_epochs = self._search(epoch_ms, "left")
+        # The closest step is just before or at the insertion point
+        candidates = [p for p in (position - 1, position) if 0 <= p < len(sorted_epochs)]
+        best = min(candidates, key=lambda p: abs(int(sorted_epochs[p]) - epoch_ms))
+        return int(best if self.order is None else self.order[best])
+
+    def span(self, start_ms, end_ms):
+        """(start, stop) indices of the steps from start_ms to end_ms inclusive."""
+        if not self.decoded:
+            raise ValueError("The time axis has no decoded timestamps")
+        if self.order is not None:
+            raise ValueError("The time axis is not in order")
+        start, _ = self._search(start_ms, "left")
+        stop, _ = self._search(end_ms, "right")
+        return start, max(start, stop)
+
+    def ticks(self, count=None):
+        """About count evenly spaced steps with labels and slider positions (%)."""
+        count = count or getattr(settings, "NETCDF_TIME_TICKS", 10)
+        n = len(self)
+        if n == 0:
+            return []
+        indices = np.unique(np.linspace(0, n - 1, min(n, count)).round().astype(np.int64))
+        # Coarser labels when the axis spans days
+        unit = "s"
+        if self.decoded and n > 1:
+            seconds = (int(self.epochs.max()) - int(self.epochs.min())) / 1000
+            unit = "D" if seconds >= 30 * 86400 else "m" if seconds >= 3600 else "s"
+        return [
+            {"index": int(i), "label": label, "position": round(100 * i / max(1, n - 1), 3)}
+            for i, label in zip(indices.tolist(), self.labels(indices, unit))
+        ]
+
+    def summary(self, ticks=None):
+        """JSON description of the axis for the page and the API."""
+        n = len(self)
+        return {
+            "count": n,
+            "decoded": self.decoded,
+            "start": self.label(0) if n else None,
+            "end": self.label(n - 1) if n else None,
+            "ticks": self.ticks(ticks),
+        }
+
+
+def parse_time(text):
+    """Epoch milliseconds for an ISO 8601 time (naive times are UTC)."""
+    moment = datetime.datetime.fromisoformat(text.replace("Z", "+00:00"))
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(datetime.timezone.utc)
+    return _to_ms(moment)
+
+
+def read_time_axis(ds):
+    """Decode the "time" variable of an open Dataset; None without one."""
+    if "time" not in ds.variables:
+        return None
+    time_var = ds.variables["time"]
+    values = np.ma.filled(np.ma.asarray(time_var[:], dtype=np.float64), np.nan).ravel()
+    epochs = decode_epochs(
+        values, getattr(time_var, "units", None), getattr(time_var, "calendar", "standard")
+    )
+    return TimeAxis(epochs, values)
+
+
+def time_axis(nc_file):
+    """The cached TimeAxis of a NetCDFFile, or None if it has no time variable."""
+    key = make_key(nc_file, "time-axis")
+    arrays = axis_cache.get(key)
+    if arrays is None:
+        with dataset_cache.open(nc_file) as ds:
+            axis = read_time_axis(ds)
+        # Files without a time axis are remembered as empty arrays
+        arrays = (axis.epochs, axis.values) if axis else (np.empty(0, np.int64), np.empty(0))
+        axis_cache.set(key, arrays)
+    return TimeAxis(*arrays) if len(arrays[0]) else None
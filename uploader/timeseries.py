@@ -0,0 +1,122 @@
+# uploader/timeseries.py
+
+# --------------------------------------------------------------------------
+# Time series and vertical profiles at a point or over a small box
+# --------------------------------------------------------------------------
+# Clicking a pixel asks for its value at every time step (or, for a 4D
+# variable, at every level). Instead of reading one whole 2D slice per
+# step, a single hyperslab request reads just the cells needed along the
+# whole axis, e.g. var[:, j, i].
+#
+# HDF5 always decompresses whole chunks, so the read is widened to the
+# chunk boundaries around the point (a "chunk column": every step of one
+# spatial chunk) and that column is kept in a byte-budgeted cache. A click
+# on a neighbouring pixel falls in the same chunk column and is answered
+# from memory. Columns too large to be worth keeping are read exactly.
+
+import warnings
+
+import numpy as np
+from django.conf import settings
+
+from .response_cache import ByteBudgetLRU
+from .slicing import hyperslab, read_values, selector_dimensions, time_dimension, tune_chunk_cache
+
+# Decompressed chunk columns shared by all requests in this process
+column_cache = ByteBudgetLRU(getattr(settings, "NETCDF_SERIES_CACHE_BYTES", 128 * 1024 * 1024))
+
+
+def _spatial_chunk(var):
+    """(rows, cols) of one chunk, or None for contiguous variables."""
+    chunking = var.chunking()
+    if chunking == "contiguous":
+        return None
+    return tuple(chunking[-2:])
+
+
+def _axis_index(var, along, selection):
+    """Index tuple that reads the whole `along` axis with the rest fixed."""
+    size = var.shape[var.dimensions.index(along)]
+    fixed = {dim: index for dim, index in selection.items() if dim != along}
+    index = list(hyperslab(var, fixed, time_range=None))
+    index[var.dimensions.index(along)] = slice(0, size)
+    return index
+
+
+def read_series(ds, var_name, y0, y1, x0, x1, along=None, selection=None, cache_key=None):
+    """Read cells [y0:y1, x0:x1] of a variable along one non-spatial axis.
+
+    along defaults to the time dimension; selection fixes the other
+    non-spatial dimensions. Returns a float32 (steps, y1-y0, x1-x0) array
+    with NaN gaps. cache_key identifies the file version; without it
+    nothing is cached. Raises IndexError for out-of-range requests.
+    """
+    var = ds.variables[var_name]
+    dims = selector_dimensions(var.dimensions)
+    along = along or time_dimension(var.dimensions)
+    if along not in dims:
+        raise IndexError(f"{var_name} has no dimension {along!r} to extract along")
+
+    rows, cols = var.shape[-2:]
+    if not (0 <= y0 < y1 <= rows and 0 <= x0 < x1 <= cols):
+        raise IndexError(f"box {y0}:{y1}, {x0}:{x1} outside {rows} x {cols}")
+
+    index = _axis_index(var, along, selection or {})
+    chunk = _spatial_chunk(var)
+    steps = var.shape[var.dimensions.index(along)]
+    max_bytes = getattr(settings, "NETCDF_SERIES_BLOCK_BYTES", 16 * 1024 * 1024)
+    if chunk is None or cache_key is None or steps * chunk[0] * chunk[1] * 4 > max_bytes:
+        # Nothing to align to, or chunk columns too large to keep around
+        index[-2:] = [slice(y0, y1), slice(x0, x1)]
+        return read_values(var, tuple(index))
+
+    # Assemble the box from the chunk columns it touches
+    tune_chunk_cache(var)
+    fixed = tuple(i for i in index[:-2] if not isinstance(i, slice))
+    chunk_rows, chunk_cols = chunk
+    result = np.empty((steps, y1 - y0, x1 - x0), dtype=np.float32)
+    for cy in range(y0 // chunk_rows, (y1 - 1) // chunk_rows + 1):
+        for cx in range(x0 // chunk_cols, (x1 - 1) // chunk_cols + 1):
+            by0, bx0 = cy * chunk_rows, cx * chunk_cols
+            by1, bx1 = min(by0 + chunk_rows, rows), min(bx0 + chunk_cols, cols)
+            key = (cache_key, var_name, along, fixed, cy, cx)
+            column = column_cache.get(key)
+            if column is None:
+                index[-2:] = [slice(by0, by1), slice(bx0, bx1)]
+                column = read_values(var, tuple(index))
+                column_cache.set(key, column)
+
+            # Copy the part of this column that lies inside the box
+            ys = slice(max(y0, by0), min(y1, by1))
+            xs = slice(max(x0, bx0), min(x1, bx1))
+            result[:, ys.start - y0:ys.stop - y0, xs.start - x0:xs.stop - x0] = \
+                column[:, ys.start - by0:ys.stop - by0, xs.start - bx0:xs.stop - bx0]
+    return result
+
+
+def summarise(block):
+    """Per-step mean, min and max of a (steps, rows, cols) block, ignoring NaN."""
+    flat = block.reshape(block.shape[0], -1)
+    with warnings.catch_warnings():
+        # Steps where every cell is missing give NaN, reported as null
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return {
+            "values": np.nanmean(flat, axis=1),
+            "min": np.nanmin(flat, axis=1),
+            "max": np.nanmax(flat, axis=1),
+        }
+
+
+def axis_coordinates(ds, dim, axis=None):
+    """Labels for the steps along a dimension.
+
+    Time is labelled from the file's cached TimeAxis (see time_axis.py)
+    when given; other dimensions use their coordinate variable, or plain
+    indices.
+    """
+    if axis is not None and dim == "time":
+        return axis.labels(np.arange(len(axis)))
+    if dim in ds.variables and ds.variables[dim].dimensions == (dim,):
+        values = np.ma.filled(np.ma.asarray(ds.variables[dim][:], dtype=float), np.nan)
+        return [v if np.isfinite(v) else None for v in values.tolist()]
+    return list(range(len(ds.dimensions[dim])))
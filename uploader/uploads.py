@@ -0,0 +1,225 @@
+# uploader/uploads.py
+
+# --------------------------------------------------------------------------
+# Upload handling: content hashing, deduplication and chunked uploads
+# --------------------------------------------------------------------------
+# Every stored file is identified by the SHA-256 of its contents. Uploading
+# a file that is already stored reuses the existing NetCDFFile instead of
+# writing a second copy to disk and ingesting it again.
+#
+# Ordinary form uploads are hashed while Django streams them to a temporary
+# file (HashingUploadHandler). Very large files can instead be sent in
+# pieces through the resumable chunked upload API in views.py, which
+# appends each piece to a ".part" file until the upload is complete. Those
+# are hashed as the pieces arrive too, as long as every piece reaches the
+# same server process; otherwise the finished file is hashed once at the
+# end.
+
+import hashlib
+import os
+import threading
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.db import transaction
+
+from .models import ChunkedUpload, NetCDFFile
+
+# Size of the pieces files are read, hashed and written in
+CHUNK_SIZE = getattr(settings, "NETCDF_UPLOAD_CHUNK_SIZE", 8 * 1024 * 1024)
+
+
+class HashingUploadHandler(TemporaryFileUploadHandler):
+    """Stream uploads to a temporary file, hashing each chunk on the way.
+
+    The finished file gets a ``sha256`` attribute with the hex digest, so
+    the contents never have to be read a second time just to hash them.
+    """
+
+    chunk_size = CHUNK_SIZE
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.sha256 = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.sha256.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        uploaded = super().file_complete(file_size)
+        uploaded.sha256 = self.sha256.hexdigest()
+        return uploaded
+
+
+def sha256_of_file(f):
+    """Hash a file object in fixed-size chunks without loading it whole."""
+    digest = hashlib.sha256()
+    f.seek(0)
+    for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+        digest.update(chunk)
+    f.seek(0)
+    return digest.hexdigest()
+
+
+def find_duplicate(sha256):
+    """Return a stored NetCDFFile with these contents, if its file still exists."""
+    return find_duplicates([sha256]).get(sha256)
+
+
+def find_duplicates(hashes):
+    """{sha256: oldest NetCDFFile with those contents whose file still exists}.
+
+    Rows whose file was deleted from storage are not duplicates: the
+    contents are stored again.
+    """
+    found = {}
+    for nc_file in NetCDFFile.objects.filter(sha256__in=hashes).order_by("id"):
+        if nc_file.sha256 not in found and nc_file.file.storage.exists(nc_file.file.name):
+            found[nc_file.sha256] = nc_file
+    return found
+
+
+def store_upload(uploaded):
+    """Save an uploaded file unless identical contents are already stored.
+
+    Returns (nc_file, created).
+    """
+    sha256 = getattr(uploaded, "sha256", None) or sha256_of_file(uploaded)
+    existing = find_duplicate(sha256)
+    if existing is not None:
+        return existing, False
+    nc_file = NetCDFFile.objects.create(file=uploaded, sha256=sha256, size=uploaded.size)
+    return nc_file, True
+
+
+# --------------------------------------------------------------------------
+# Resumable chunked uploads
+# --------------------------------------------------------------------------
+class _PartFile(File):
+    """A finished .part file. Providing temporary_file_path() lets Django's
+    file storage move it into place instead of copying it."""
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+class OffsetMismatch(Exception):
+    """A chunk was sent for a different position than the upload has reached."""
+
+    def __init__(self, expected):
+        super().__init__(f"Expected a chunk at offset {expected}")
+        self.expected = expected
+
+
+class IncompleteUpload(Exception):
+    """complete_upload was called before every byte had been received."""
+
+
+def part_path(upload):
+    """Where the bytes received so far for a chunked upload are kept."""
+    directory = os.path.join(settings.MEDIA_ROOT, "uploads", "partial")
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"{upload.id}.part")
+
+
+# Running SHA-256 of each chunked upload received by this process, as
+# {upload id: (bytes hashed, hash object)}. Hash objects cannot be stored
+# in the database, so after a restart (or when pieces go to different
+# processes) the entry is missing and complete_upload hashes the file.
+_running_hashes = {}
+_running_hashes_lock = threading.Lock()
+
+
+def _take_running_hash(upload_id, offset):
+    """The running hash of an upload if it covers exactly offset bytes."""
+    with _running_hashes_lock:
+        hashed, digest = _running_hashes.pop(upload_id, (None, None))
+    if offset == 0:
+        return hashlib.sha256()
+    return digest if hashed == offset else None
+
+
+def append_chunk(upload, offset, stream):
+    """Append the request body at offset to the upload's .part file.
+
+    The body is copied in CHUNK_SIZE pieces so memory use does not depend
+    on how large a chunk the client sends. The upload row is locked while
+    the piece is written, so two requests for the same offset cannot both
+    write to the file; the second one sees the new offset and is refused.
+    On SQLite the IMMEDIATE transactions set up in settings.py serialise
+    them the same way.
+    """
+    with transaction.atomic():
+        locked = ChunkedUpload.objects.select_for_update().get(pk=upload.pk)
+        if offset != locked.offset:
+            upload.offset = locked.offset
+            raise OffsetMismatch(locked.offset)
+
+        digest = _take_running_hash(locked.pk, locked.offset)
+        path = part_path(locked)
+        with open(path, "ab") as part:
+            # Drop anything written by an earlier attempt that never finished
+            part.truncate(locked.offset)
+            for piece in iter(lambda: stream.read(CHUNK_SIZE), b""):
+                part.write(piece)
+                if digest is not None:
+                    digest.update(piece)
+            locked.offset = part.tell()
+
+        locked.save(update_fields=["offset"])
+        if digest is not None:
+            with _running_hashes_lock:
+                _running_hashes[locked.pk] = (locked.offset, digest)
+
+    upload.offset = locked.offset
+    return upload.offset
+
+
+def complete_upload(upload):
+    """Turn a fully received chunked upload into a NetCDFFile.
+
+    Returns (nc_file, created) like store_upload. The upload row is locked
+    (as in append_chunk) and read again, so when the client sends the
+    request twice only the first one stores the file; the second raises
+    ChunkedUpload.DoesNotExist.
+    """
+    with transaction.atomic():
+        locked = ChunkedUpload.objects.select_for_update().get(pk=upload.pk)
+        upload.offset = locked.offset
+        if locked.total_size is not None and locked.offset != locked.total_size:
+            raise IncompleteUpload(
+                f"Received {locked.offset} of {locked.total_size} bytes"
+            )
+
+        digest = _take_running_hash(locked.pk, locked.offset)
+        path = part_path(locked)
+        with open(path, "rb") as part:
+            sha256 = digest.hexdigest() if digest is not None else sha256_of_file(part)
+            existing = find_duplicate(sha256)
+            if existing is None:
+                nc_file = NetCDFFile.objects.create(
+                    file=_PartFile(part, name=locked.filename), sha256=sha256, size=locked.offset
+                )
+
+        if existing is not None:
+            os.unlink(path)
+            nc_file = existing
+        elif os.path.exists(path):
+            # Storage backends that cannot move files copy them instead
+            os.unlink(path)
+
+        locked.delete()
+    return nc_file, existing is None
+
+
+def discard_upload(upload):
+    """Abandon a chunked upload and remove its partial data."""
+    with _running_hashes_lock:
+        _running_hashes.pop(upload.pk, None)
+    path = part_path(upload)
+    if os.path.exists(path):
+        os.unlink(path)
+    upload.delete()
+
@@ -5,7 +5,43 @@ from . import views
 # URL patterns for the uploader app
 # When the root URL ('') is accessed, the upload_netcdf view function is called
 # This allows users to upload and visualize NetCDF files
+#
+# The api/ routes return raw data for the page's JavaScript to draw, so
+# changing the time step does not need a full page reload.
 # --------------------------------------------------------------------------
 
 urlpatterns = [
-    path('', views.upload_netcdf, name='upload_netcdf'),]
+    path('', views.upload_netcdf, name='upload_netcdf'),
+    path('api/files/<int:file_id>/metadata', views.metadata_api, name='metadata_api'),
+    path('api/files/<int:file_id>/time', views.time_api, name='time_api'),
+    path('api/files/<int:file_id>/vars/<str:var_name>/slice', views.slice_api, name='slice_api'),
+    path('api/files/<int:file_id>/vars/<str:var_name>/frames', views.frames_api, name='frames_api'),
+    path(
+        'api/files/<int:file_id>/vars/<str:var_name>/tiles/<int:level>/<int:tile_y>/<int:tile_x>',
+        views.tile_api, name='tile_api',
+    ),
+    path('api/files/<int:file_id>/derived/frames', views.derived_frames_api, name='derived_frames_api'),
+    path('api/files/<int:file_id>/vars/<str:var_name>/stats', views.stats_api, name='stats_api'),
+    path('api/files/<int:file_id>/vars/<str:var_name>/series', views.series_api, name='series_api'),
+    path(
+        'api/files/<int:file_id>/vars/<str:var_name>/thumbnail',
+        views.thumbnail_api, name='thumbnail_api',
+    ),
+    path('api/files/<int:file_id>/export', views.export_api, name='export_api'),
+    path('files/', views.file_list, name='file_list'),
+    path('collections/', views.collection_list, name='collection_list'),
+    path('collections/<int:collection_id>/', views.collection_view, name='collection_view'),
+    path(
+        'api/collections/<int:collection_id>/vars/<str:var_name>/frames',
+        views.collection_frames_api, name='collection_frames_api',
+    ),
+    path('api/uploads', views.chunked_upload_start, name='chunked_upload_start'),
+    path('api/uploads/bulk', views.bulk_upload, name='bulk_upload'),
+    path('api/uploads/<uuid:upload_id>', views.chunked_upload_detail, name='chunked_upload_detail'),
+    path(
+        'api/uploads/<uuid:upload_id>/complete',
+        views.chunked_upload_complete, name='chunked_upload_complete',
+    ),
+    path('assets/plotly.min.js', views.plotly_js, name='plotly_js'),
+    path('metrics', views.metrics_view, name='metrics'),
+]
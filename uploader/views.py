@@ -1,12 +1,202 @@
-from django.shortcuts import render
-from .forms import NetCDFUploadForm
-from .models import NetCDFFile
-from netCDF4 import Dataset
+import datetime
+import hashlib
+import os
+from functools import wraps
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.db.models import Q
+from django.http import (
+    Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse,
+)
+from django.shortcuts import get_object_or_404, redirect, render
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_GET, require_http_methods, require_POST
+from .aggregation import (
+    CollectionError, collection_index, read_member_range, read_member_slice, submit_build,
+)
+from .async_reads import run_read
+from .bulk import bulk_ingest, bulk_options, get_executor as bulk_executor
+from .forms import NetCDFCollectionForm, NetCDFUploadForm
+from .models import ChunkedUpload, NetCDFCollection, NetCDFFile
+from .dataset_cache import dataset_cache
+from .encoding import ENCODINGS, encode_frames, encode_slice
+from .expressions import ExpressionError, compile_expression
+from .export import (
+    FORMATS as EXPORT_FORMATS, ExportError, ExportTooLarge, check_export_size, plan_export,
+    start_export,
+)
+from .ingest import (
+    get_catalogue, get_statistics, statistics_enabled, submit_ingest, submit_statistics,
+)
+from .optimize import submit_optimize
+from .instrumentation import instrumentation_enabled, metrics, span
+from .response_cache import content_version, make_key, payload_cache, slice_cache
+from .lod import METHODS, Pyramid, PyramidCache, block_centres, block_reduce, downsample_to
+from .slicing import (
+    plottable_variables, read_budget, read_reduced_slice, read_time_range, read_time_slice,
+    reduction_factors, selector_dimensions, slab_bytes, time_chunk_length, time_dimension,
+)
+from .time_axis import parse_time, time_axis
+from .timeseries import axis_coordinates, read_series, summarise
+from .thumbnails import (
+    FORMATS, SIZES, get_thumbnail, render_slice_thumbnail, thumbnail_key, thumbnail_response,
+)
+from .uploads import (
+    CHUNK_SIZE, IncompleteUpload, OffsetMismatch, append_chunk, complete_upload, discard_upload,
+    store_upload,
+)
 import plotly.graph_objects as go
+import plotly.offline
+
+# Largest number of cells sent along each axis of a displayed slice
+DISPLAY_MAX_SIZE = getattr(settings, "NETCDF_DISPLAY_MAX_SIZE", 1024)
+
+# Pyramids built for the tile API, shared by all requests in this process
+pyramid_cache = PyramidCache(getattr(settings, "NETCDF_PYRAMID_CACHE_BYTES", 256 * 1024 * 1024))
+
+# Ways of choosing the heatmap's colour limits
+COLOUR_SCALES = ("auto", "global", "robust")
+
+
+def colour_limits(statistics, colour_scale):
+    """Heatmap zmin/zmax for a colour scale choice, or {} to autoscale."""
+    if colour_scale == "auto" or statistics is None:
+        return {}
+    summary = statistics["global"]
+    if colour_scale == "robust":
+        return {"zmin": summary["quantiles"]["2"], "zmax": summary["quantiles"]["98"]}
+    return {"zmin": summary["min"], "zmax": summary["max"]}
+
+
+def selection_key(selection):
+    """A stable cache key part for a dimension selection dict."""
+    return sorted((selection or {}).items())
+
+
+def cached_time_slice(nc_instance, var_name, time_idx, selection=None):
+    """Read a slice through the slice cache.
+
+    selection picks indices along non-spatial dimensions other than time
+    (see slicing.py). Cached arrays are shared between requests, so they
+    are made read-only.
+    """
+    def read():
+        # The handle comes from a per-process cache, so scrubbing through
+        # time steps does not reopen and re-parse the file every time.
+        with dataset_cache.open(nc_instance) as ds:
+            data = read_time_slice(ds, var_name, time_idx, selection)
+        data.setflags(write=False)
+        return data
+
+    key = make_key(nc_instance, "slice", var_name, time_idx, selection_key(selection))
+    return slice_cache.get_or_compute(key, read)
+
+
+def cached_display_slice(nc_instance, var_name, time_idx, selection=None, max_size=None, method="mean"):
+    """A slice reduced to at most max_size cells per axis, as (data, factors, shape).
+
+    shape is the variable's full (rows, cols). Slices within the read
+    budget come from cached_time_slice, shared with the other views, and
+    are reduced afterwards. Larger ones are reduced while they are read
+    (see the memory governor in slicing.py); their factors keep the result
+    within the budget even when max_size is None.
+    """
+    with dataset_cache.open(nc_instance) as ds:
+        var = ds.variables[var_name]
+        shape = var.shape[-2:]
+        oversize = slab_bytes(var) > read_budget()
+
+    if not oversize:
+        data = cached_time_slice(nc_instance, var_name, time_idx, selection)
+        if not max_size:
+            return data, (1, 1), shape
+        data, factors = downsample_to(data, max_size, max_size, method)
+        return data, factors, shape
+
+    factors = reduction_factors(shape, max_size)
+
+    def read():
+        with dataset_cache.open(nc_instance) as ds:
+            data = read_reduced_slice(ds, var_name, time_idx, selection, *factors, method)
+        data.setflags(write=False)
+        return data
+
+    key = make_key(
+        nc_instance, "reduced_slice", var_name, time_idx, selection_key(selection), factors, method,
+    )
+    return slice_cache.get_or_compute(key, read), factors, shape
+
+
+def cached_derived_slice(nc_instance, expression, time_idx, selection=None):
+    """cached_time_slice for a derived expression (see expressions.py)."""
+    def read():
+        with dataset_cache.open(nc_instance) as ds:
+            data = expression.evaluate(ds, time_idx, selection, cache_key=content_version(nc_instance))
+        data.setflags(write=False)
+        return data
+
+    key = make_key(nc_instance, "derived", expression.text, time_idx, selection_key(selection))
+    return slice_cache.get_or_compute(key, read)
+
+
+def cached_member_slice(member, var_name, local_idx, selection=None):
+    """cached_time_slice for one step of a collection member (see aggregation.py)."""
+    def read():
+        with dataset_cache.open(member.file) as ds:
+            data = read_member_slice(ds, var_name, local_idx, selection)
+        data.setflags(write=False)
+        return data
+
+    key = make_key(member.file, "member_slice", var_name, local_idx, selection_key(selection))
+    return slice_cache.get_or_compute(key, read)
+
+
+def render_heatmap(data2d, var_name, time_idx, lod_method, limits, factors=(1, 1), shape=None):
+    """Build the heatmap figure for a slice and return its HTML.
+
+    data2d may already be reduced by factors from a grid of the given
+    shape (see cached_display_slice).
+    """
+    # Reduce to display resolution; the x/y values keep the axes in
+    # full-resolution grid indices.
+    rows, cols = shape or data2d.shape
+    data2d, (factor_y, factor_x) = downsample_to(
+        data2d, DISPLAY_MAX_SIZE, DISPLAY_MAX_SIZE, lod_method
+    )
+    factor_y, factor_x = factor_y * factors[0], factor_x * factors[1]
+
+    # Plotly heatmap. plotly.js itself is loaded once by the page
+    # (see plotly_js below), so only the figure is embedded here.
+    with span("figure"):
+        fig = go.Figure()
+        fig.add_trace(go.Heatmap(
+            z=data2d,
+            x=block_centres(cols, factor_x),
+            y=block_centres(rows, factor_y),
+            **limits,
+        ))
+        fig.update_layout(
+            title=f"{var_name} — Time step {time_idx}",
+            xaxis_title="Longitude",
+            yaxis_title="Latitude",
+            height=600,
+        )
+    with span("to_html"):
+        return fig.to_html(full_html=False, include_plotlyjs=False, div_id="heatmap")
+
 
 def upload_netcdf(request):
 
-    context = {}
+    context = {
+        "plotly_version": plotly.offline.get_plotlyjs_version(),
+        # Files above this size are sent through the chunked upload API
+        "chunked_upload_threshold": getattr(settings, "NETCDF_CHUNKED_UPLOAD_THRESHOLD", 64 * 1024 * 1024),
+        "chunked_upload_chunk_size": CHUNK_SIZE,
+    }
 
     if request.method == "POST":
 
@@ -18,9 +208,16 @@ def upload_netcdf(request):
         # --------------------------------------------------------------
         if "file" in request.FILES:
 
-            nc_instance = NetCDFFile.objects.create(file=request.FILES["file"])
+            # Identical contents already on the server are reused rather
+            # than stored (and ingested) a second time
+            nc_instance, created = store_upload(request.FILES["file"])
             context["nc_file_instance"] = nc_instance
-            ds = Dataset(nc_instance.file.path, "r")
+
+            # Extract and store the file's metadata in the background, and
+            # (if enabled) write its optimised copy
+            if created:
+                submit_ingest(nc_instance)
+                submit_optimize(nc_instance)
 
         # --------------------------------------------------------------
         # CASE 2: VARIABLE/TIME CHANGE
@@ -34,63 +231,1187 @@ def upload_netcdf(request):
 
             nc_instance = NetCDFFile.objects.get(id=file_id)
             context["nc_file_instance"] = nc_instance
-            ds = Dataset(nc_instance.file.path, "r")
 
         # --------------------------------------------------------------
         # Shared processing
         # --------------------------------------------------------------
 
+        # Variables, dimensions and times come from the database once the
+        # file has been ingested (see ingest.py); until then they are read
+        # from the file itself.
+        catalogue = get_catalogue(nc_instance, include_times=False)
+
         # Variables that can be plotted
-        variables = [
-            v for v in ds.variables.keys()
-            if len(ds.variables[v].dimensions) >= 2
-        ]
+        variables = [v["name"] for v in catalogue["variables"] if v["is_plottable"]]
         context["variables"] = variables
 
         selected_var = request.POST.get("variable", variables[0])
+        if selected_var not in variables:
+            selected_var = variables[0]
         context["selected_var"] = selected_var
 
-        var_data = ds.variables[selected_var]
+        # A derived expression such as "sqrt(u**2 + v**2)" is plotted
+        # instead of the selected variable. Its first variable decides the
+        # time axis and the selectors below.
+        expression = None
+        context["expression"] = request.POST.get("expression", "").strip()
+        if context["expression"]:
+            try:
+                expression = compile_expression(context["expression"])
+                expression.check(catalogue["variables"])
+                selected_var = expression.base_variable
+            except ExpressionError as exc:
+                expression = None
+                context["expression_error"] = str(exc)
+        context["derived"] = expression
+
+        # One selector per dimension that is neither spatial (the last two)
+        # nor moved by the time slider, e.g. "level" of a 4D variable
+        details = next(v for v in catalogue["variables"] if v["name"] == selected_var)
+        time_dim = time_dimension(details["dimensions"])
+        selectors = []
+        selection = {}
+        for dim in selector_dimensions(details["dimensions"]):
+            if dim == time_dim:
+                continue
+            size = details["shape"][details["dimensions"].index(dim)]
+            try:
+                index = int(request.POST.get(f"dim_{dim}", 0))
+            except ValueError:
+                index = 0
+            index = index if 0 <= index < size else 0
+            selection[dim] = index
+            selectors.append({"name": dim, "size": size, "selected": index, "range": range(size)})
+        context["selectors"] = selectors
+        context["selection"] = selection
 
-        # Time axis
-        times = ds.variables["time"][:] if "time" in ds.variables else None
-        context["times"] = times.tolist() if times is not None else None
+        # Time steps stored together in one chunk; playback fetches whole
+        # chunks at a time
+        context["time_chunk"] = time_chunk_length(details["dimensions"], details["chunking"])
 
-        selected_time_idx = int(request.POST.get("time_idx", 0))
+        # Clicking the heatmap plots that cell along this dimension
+        context["series_along"] = time_dim if expression is None else None
+
+        # Time axis: decoded once per file (see time_axis.py). The page
+        # gets a few labelled ticks, not every step; the label of the
+        # selected step comes from the time API as the slider moves.
+        axis = time_axis(nc_instance)
+        context["time_axis"] = axis.summary() if axis is not None else None
+
+        # The slider spans the file's time axis. A variable with fewer
+        # steps (or none), reached by switching variables, starts again at
+        # its first step, like the selectors above.
+        time_count = details["shape"][details["dimensions"].index(time_dim)] if time_dim else 1
+        try:
+            selected_time_idx = _time_index_param(
+                request.POST.get("time_idx", 0), len(axis) if axis is not None else time_count
+            )
+        except BadRequest as exc:
+            return HttpResponseBadRequest(str(exc))
+        if selected_time_idx >= time_count:
+            selected_time_idx = 0
         context["selected_time_idx"] = selected_time_idx
 
-        # selected time value passed separately
+        # selected time label passed separately
         context["selected_time"] = (
-            times[selected_time_idx] if times is not None else None
+            axis.label(selected_time_idx) if axis is not None else None
         )
 
-        # 2D slice
-        if times is not None:
-            data2d = var_data[selected_time_idx, ...]
-        else:
-            data2d = var_data[:]
+        # How slices larger than the display are reduced
+        lod_method = request.POST.get("lod_method", "mean")
+        if lod_method not in METHODS:
+            lod_method = "mean"
+        context["lod_method"] = lod_method
+        context["lod_methods"] = METHODS
 
-        # Plotly heatmap
-        fig = go.Figure()
-        fig.add_trace(go.Heatmap(z=data2d))
-        fig.update_layout(
-            title=f"{selected_var} — Time step {selected_time_idx}",
-            xaxis_title="Longitude",
-            yaxis_title="Latitude",
-            height=600,
+        context["display_max_size"] = DISPLAY_MAX_SIZE
+
+        # Precomputed statistics let the colour scale stay fixed across
+        # time steps: "global" uses the variable's min/max, "robust" its
+        # 2nd-98th percentiles. "auto" rescales every time step.
+        statistics = None
+        if expression is None:
+            statistics = get_statistics(nc_instance, selected_var, selected_time_idx)
+        context["statistics"] = statistics
+
+        colour_scale = request.POST.get("colour_scale", "auto")
+        if colour_scale not in COLOUR_SCALES or statistics is None:
+            colour_scale = "auto"
+        context["colour_scale"] = colour_scale
+        context["colour_scales"] = COLOUR_SCALES
+
+        # Rendered figures are cached, so flipping back to a variable and
+        # time step already seen skips the read, the figure and to_html.
+        # Slices too large for the read budget arrive already reduced
+        # (see cached_display_slice).
+        limits = colour_limits(statistics, colour_scale)
+        if expression is not None:
+            title = expression.text
+            read = lambda: (
+                cached_derived_slice(nc_instance, expression, selected_time_idx, selection), (1, 1), None
+            )
+        else:
+            title = selected_var
+            read = lambda: cached_display_slice(
+                nc_instance, selected_var, selected_time_idx, selection, DISPLAY_MAX_SIZE, lod_method
+            )
+        figure_key = make_key(
+            nc_instance, "figure", title, selected_time_idx, selection_key(selection),
+            lod_method, DISPLAY_MAX_SIZE, sorted(limits.items()),
         )
-        context["plot_html"] = fig.to_html(full_html=False)
+
+        def plot():
+            data2d, factors, shape = read()
+            return render_heatmap(data2d, title, selected_time_idx, lod_method, limits, factors, shape)
+
+        context["plot_html"] = payload_cache.get_or_compute(figure_key, plot)
 
         # Metadata
         context["metadata"] = {
-            "dimensions": list(ds.dimensions.keys()),
-            "variables": list(ds.variables.keys()),
-            "times": times.tolist() if times is not None else "None",
+            "dimensions": [d["name"] for d in catalogue["dimensions"]],
+            "variables": [v["name"] for v in catalogue["variables"]],
+            "times": (
+                f"{len(axis)} steps, {context['time_axis']['start']} to {context['time_axis']['end']}"
+                if axis is not None else "None"
+            ),
+            "variable_details": catalogue["variables"],
+            "ingest_status": nc_instance.get_ingest_status_display(),
         }
 
-        ds.close()
-        return render(request, "uploader/upload.html", context)
+        with span("template"):
+            return render(request, "uploader/upload.html", context)
 
     # GET request
     context["form"] = NetCDFUploadForm()
     return render(request, "uploader/upload.html", context)
+
+
+# --------------------------------------------------------------------------
+# Binary slice API
+# --------------------------------------------------------------------------
+# GET /api/files/<id>/vars/<var>/slice?time=<idx>&encoding=<float32|float16|uint8>
+#                                     &max_size=<cells>&method=<mean|max|nearest>
+#
+# Returns one 2D slice in the compact format described in encoding.py, so
+# moving the time slider only transfers the numbers, not a new page.
+# With max_size the slice is block-reduced first; the factors used are
+# returned in the X-Downsample-Factor header as "<rows>,<cols>". Slices
+# larger than NETCDF_READ_BUDGET_BYTES are reduced even without max_size.
+#
+# Variables with more than three dimensions take dim_<name>=<index> for
+# each extra non-spatial dimension (e.g. dim_level=2); missing ones use 0.
+# This applies to the frames, tile and thumbnail APIs below as well.
+#
+# The slice, frames and metadata views are async: their file reads run on
+# the read pool in async_reads.py, so a slow read does not hold up other
+# requests when the site is served through ASGI (netcdf_viewer/asgi.py).
+
+class BadRequest(ValueError):
+    """Raised by the API helpers when a query parameter is invalid."""
+
+
+class SlabTooLarge(BadRequest):
+    """Raised when a request would read more than the read budget at once."""
+
+
+def _int_param(request, name, default=None):
+    value = request.GET.get(name, default)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise BadRequest(f"{name} must be an integer")
+
+
+def _choice_param(request, name, choices, default):
+    value = request.GET.get(name, default)
+    if value not in choices:
+        raise BadRequest(f"Unknown {name} {value!r}")
+    return value
+
+
+def _selection_param(request):
+    """Indices for non-spatial dimensions, given as dim_<name>=<index>."""
+    selection = {}
+    for name, value in request.GET.items():
+        if name.startswith("dim_"):
+            try:
+                selection[name[4:]] = int(value)
+            except ValueError:
+                raise BadRequest(f"{name} must be an integer")
+    return selection
+
+
+def _time_index_param(value, count):
+    """time_idx from a form or query string, checked against count steps."""
+    try:
+        index = int(value)
+    except (TypeError, ValueError):
+        raise BadRequest("time_idx must be an integer")
+    if not 0 <= index < count:
+        raise BadRequest(f"time_idx {index} outside 0:{count}")
+    return index
+
+
+def _read_api_slice(nc_instance, var_name, time_idx, selection=None, max_size=None, method=None):
+    """Read the slice an API request asked for, mapping errors to HTTP.
+
+    With method set, the slice is read through cached_display_slice and
+    (data, factors) is returned.
+    """
+    with dataset_cache.open(nc_instance) as ds:
+        if var_name not in plottable_variables(ds):
+            raise Http404(f"No plottable variable {var_name!r}")
+    try:
+        if method is None:
+            return cached_time_slice(nc_instance, var_name, time_idx, selection)
+        data2d, factors, _ = cached_display_slice(
+            nc_instance, var_name, time_idx, selection, max_size, method
+        )
+        return data2d, factors
+    except IndexError as exc:
+        raise BadRequest(str(exc))
+
+
+def _binary_response(payload):
+    return HttpResponse(payload, content_type="application/octet-stream")
+
+
+# --------------------------------------------------------------------------
+# HTTP revalidation for the data APIs
+# --------------------------------------------------------------------------
+# Every API response is fully determined by the file's contents, its ingest
+# state and the request URL, so that is what the ETag is made from. Browsers
+# and proxies revalidate (Cache-Control: no-cache) and get a 304 with no
+# body when nothing changed.
+
+def _api_file(request, file_id):
+    """Look the file up once per request, for the ETag and the view."""
+    if not hasattr(request, "_nc_file"):
+        request._nc_file = NetCDFFile.objects.filter(id=file_id).first()
+    return request._nc_file
+
+
+def _api_etag(request, file_id, **kwargs):
+    nc_instance = _api_file(request, file_id)
+    if nc_instance is None:
+        return None
+    key = make_key(nc_instance, nc_instance.ingested_at, request.path, sorted(request.GET.lists()))
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+
+def _api_last_modified(request, file_id, **kwargs):
+    nc_instance = _api_file(request, file_id)
+    if nc_instance is None:
+        return None
+    mtime = os.path.getmtime(nc_instance.data_path)
+    return max(
+        datetime.datetime.fromtimestamp(mtime, tz=datetime.timezone.utc),
+        nc_instance.ingested_at or nc_instance.uploaded_at,
+    )
+
+
+def revalidated_api(view):
+    """Decorate a GET data API view with ETag/Last-Modified handling."""
+    view = condition(etag_func=_api_etag, last_modified_func=_api_last_modified)(view)
+    view = cache_control(no_cache=True)(view)
+    return require_GET(view)
+
+
+def _api_validators(request, file_id, **kwargs):
+    return _api_etag(request, file_id), _api_last_modified(request, file_id)
+
+
+def async_revalidated_api(view):
+    """revalidated_api for async views.
+
+    Finding the ETag and Last-Modified needs a database query and file
+    system calls, so they are worked out on a thread before condition()
+    compares them. The view finds the file in request._nc_file.
+    """
+    conditional = condition(
+        etag_func=lambda request, *args, **kwargs: request._api_validators[0],
+        last_modified_func=lambda request, *args, **kwargs: request._api_validators[1],
+    )(view)
+    conditional = cache_control(no_cache=True)(conditional)
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        request._api_validators = await sync_to_async(_api_validators)(request, *args, **kwargs)
+        return await conditional(request, *args, **kwargs)
+
+    return require_GET(wrapper)
+
+
+def _read_timeout_response():
+    return HttpResponse("Reading the file took too long; try again.", status=504)
+
+
+# --------------------------------------------------------------------------
+# Metadata API
+# --------------------------------------------------------------------------
+# GET /api/files/<id>/metadata
+#
+# The file's dimensions, variables and time steps as JSON (the same
+# catalogue the viewer uses, see ingest.py), plus the ingest status.
+
+@async_revalidated_api
+async def metadata_api(request, file_id):
+
+    nc_instance = request._nc_file
+    if nc_instance is None:
+        raise Http404("No such file")
+
+    try:
+        # Read from the database once ingested, otherwise from the file
+        catalogue = await run_read(nc_instance.pk, get_catalogue, nc_instance)
+    except TimeoutError:
+        return _read_timeout_response()
+    catalogue["ingest_status"] = nc_instance.ingest_status
+    return JsonResponse(catalogue)
+
+
+def _slice_payload(nc_instance, var_name, time_idx, selection, encoding, max_size, method):
+    """Encoded slice and factors header for the slice API (blocking)."""
+    def build():
+        data2d, factors = _read_api_slice(nc_instance, var_name, time_idx, selection, max_size, method)
+        return encode_slice(data2d, encoding), f"{factors[0]},{factors[1]}"
+
+    key = make_key(
+        nc_instance, "slice_api", var_name, time_idx, selection_key(selection),
+        encoding, max_size, method,
+    )
+    return payload_cache.get_or_compute(key, build)
+
+
+@async_revalidated_api
+async def slice_api(request, file_id, var_name):
+
+    nc_instance = request._nc_file
+    if nc_instance is None:
+        raise Http404("No such file")
+
+    try:
+        encoding = _choice_param(request, "encoding", ENCODINGS, "float32")
+        method = _choice_param(request, "method", METHODS, "mean")
+        time_idx = _int_param(request, "time", 0)
+        max_size = _int_param(request, "max_size")
+        selection = _selection_param(request)
+    except BadRequest as exc:
+        return HttpResponseBadRequest(str(exc))
+
+    try:
+        payload, factors = await run_read(
+            nc_instance.pk, _slice_payload,
+            nc_instance, var_name, time_idx, selection, encoding, max_size, method,
+        )
+    except BadRequest as exc:
+        return HttpResponseBadRequest(str(exc))
+    except TimeoutError:
+        return _read_timeout_response()
+
+    response = _binary_response(payload)
+    response["X-Downsample-Factor"] = factors
+    return response
+
+
+# --------------------------------------------------------------------------
+# Frames API (animation playback)
+# --------------------------------------------------------------------------
+# GET /api/files/<id>/vars/<var>/frames?start=<t0>&stop=<t1>&encoding=..
+#                                       &max_size=..&method=..
+#
+# Returns time steps t0..t1-1 as one multi-frame payload (see encoding.py).
+# The player prefetches upcoming frames with this, so the file is read once
+# per batch of frames rather than once per frame. At most
+# NETCDF_MAX_FRAMES_PER_REQUEST frames are returned, and only as many as fit
+# NETCDF_READ_BUDGET_BYTES; clients check the frame count in the header.
+
+def _encode_frames(frames, encoding, max_size, method):
+    """Downsample and encode frames; returns (payload, factors header)."""
+    factors = (1, 1)
+    if max_size:
+        _, factors = downsample_to(frames[0], max_size, max_size, method)
+        frames = np.stack([block_reduce(frame, *factors, method=method) for frame in frames])
+    return encode_frames(frames, encoding), f"{factors[0]},{factors[1]}"
+
+
+def _frames_payload(nc_instance, var_name, start, stop, selection, encoding, max_size, method):
+    """Encoded frames, factors header and time range header (blocking).
+
+    Only as many frames as fit the read budget are read at once; a single
+    frame that does not fit is reduced while it is read.
+    """
+    def build():
+        with dataset_cache.open(nc_instance) as ds:
+            if var_name not in plottable_variables(ds):
+                raise Http404(f"No plottable variable {var_name!r}")
+            var = ds.variables[var_name]
+            frame_bytes = slab_bytes(var)
+            end = min(stop, start + max(1, read_budget() // frame_bytes))
+            try:
+                if frame_bytes > read_budget():
+                    factors = reduction_factors(var.shape[-2:], max_size)
+                    frame = read_reduced_slice(ds, var_name, start, selection, *factors, method)
+                    payload = encode_frames(frame[np.newaxis], encoding)
+                    return payload, f"{factors[0]},{factors[1]}", f"{start},{end}"
+                frames = read_time_range(ds, var_name, start, end, selection)
+            except IndexError as exc:
+                raise BadRequest(str(exc))
+        return (*_encode_frames(frames, encoding, max_size, method), f"{start},{end}")
+
+    key = make_key(
+        nc_instance, "frames_api", var_name, start, stop, selection_key(selection),
+        encoding, max_size, method,
+    )
+    return payload_cache.get_or_compute(key, build)
+
+
+@async_revalidated_api
+async def frames_api(request, file_id, var_name):
+
+    nc_instance = request._nc_file
+    if nc_instance is None:
+        raise Http404("No such file")
+    max_frames = getattr(settings, "NETCDF_MAX_FRAMES_PER_REQUEST", 32)
+
+    try:
+        encoding = _choice_param(request, "encoding", ENCODINGS, "float32")
+        method = _choice_param(request, "method", METHODS, "mean")
+        start = _int_param(request, "start", 0)
+        stop = _int_param(request, "stop", start + 1)
+        max_size = _int_param(request, "max_size")
+        selection = _selection_param(request)
+    except BadRequest as exc:
+        return HttpResponseBadRequest(str(exc))
+
+    stop = min(stop, start + max_frames)
+
+    try:
+        payload, factors, time_range = await run_read(
+            nc_instance.pk, _frames_payload,
+            nc_instance, var_name, start, stop, selection, encoding, max_size, method,
+        )
+    except BadRequest as exc:
+        return HttpResponseBadRequest(str(exc))
+    except TimeoutError:
+        return _read_timeout_response()
+
+    response = _binary_response(payload)
+    response["X-Downsample-Factor"] = factors
+    response["X-Time-Range"] = time_range
+    return response
+
+
+# --------------------------------------------------------------------------
+# Derived frames API
+# --------------------------------------------------------------------------
+# GET /api/files/<id>/derived/frames?expr=<expression>&start=<t0>&stop=<t1>&..
+#
+# The frames API for a derived expression (see expressions.py). Each frame
+# is evaluated from the slabs of the variables it uses and cached per
+# expression and time step, like the slices of raw variables.
+
+@revalidated_api
+def derived_frames_api(request, file_id):
+
+    nc_instance = _api_file(request, file_id) or get_object_or_404(NetCDFFile, id=file_id)
+    max_frames = getattr(settings, "NETCDF_MAX_FRAMES_PER_REQUEST", 32)
+
+    try:
+        encoding = _choice_param(request, "encoding", ENCODINGS, "float32")
+        method = _choice_param(request, "method", METHODS, "mean")
+        start = _int_param(request, "start", 0)
+        stop = _int_param(request, "stop", start + 1)
+        max_size = _int_param(request, "max_size")
+        selection = _selection_param(request)
+        expression = compile_expression(request.GET.get("expr", ""))
+        expression.check(get_catalogue(nc_instance, include_times=False)["variables"])
+    except (BadRequest, ExpressionError) as exc:
+        return HttpResponseBadRequest(str(exc))
+
+    stop = min(stop, start + max_frames)
+    if not 0 <= start < stop:
+        return HttpResponseBadRequest(f"time range {start}:{stop} is empty")
+
+    def build():
+        try:
+            frames = np.stack([
+                cached_derived_slice(nc_instance, expression, t, selection)
+                for t in range(start, stop)
+            ])
+        except (ExpressionError, IndexError) as exc:
+            raise BadRequest(str(exc))
+        return _encode_frames(frames, encoding, max_size, method)
+
+    key = make_key(
+        nc_instance, "derived_frames", expression.text, start, stop, selection_key(selection),
+        encoding, max_size, method,
+    )
+    try:
+        payload, factors = payload_cache.get_or_compute(key, build)
+    except BadRequest as exc:
+        return HttpResponseBadRequest(str(exc))
+
+    response = _binary_response(payload)
+    response["X-Downsample-Factor"] = factors
+    response["X-Time-Range"] = f"{start},{stop}"
+    return response
+
+
+# --------------------------------------------------------------------------
+# Tile API
+# --------------------------------------------------------------------------
+# GET /api/files/<id>/vars/<var>/tiles/<level>/<tile_y>/<tile_x>?time=<idx>
+#
+# Serves one square tile of the slice's LOD pyramid (level 0 is full
+# resolution, each level above halves both axes). Pyramids are built once
+# per file version/variable/time/method and cached in this process.
+# The response headers describe the pyramid so clients can plan requests.
+#
+# A pyramid holds its slab at full resolution, so slabs larger than the
+# read budget (NETCDF_READ_BUDGET_BYTES) get 413 instead of a pyramid.
+
+@revalidated_api
+def tile_api(request, file_id, var_name, level, tile_y, tile_x):
+
+    nc_instance = _api_file(request, file_id) or get_object_or_404(NetCDFFile, id=file_id)
+    tile_size = getattr(settings, "NETCDF_TILE_SIZE", 256)
+
+    try:
+        encoding = _choice_param(request, "encoding", ENCODINGS, "float32")
+        method = _choice_param(request, "method", METHODS, "mean")
+        time_idx = _int_param(request, "time", 0)
+        selection = _selection_param(request)
+    except BadRequest as exc:
+        return HttpResponseBadRequest(str(exc))
+
+    key = make_key(
+        nc_instance, "pyramid", var_name, time_idx, selection_key(selection), method, tile_size
+    )
+
+    def build():
+        with dataset_cache.open(nc_instance) as ds:
+            if var_name in ds.variables and slab_bytes(ds.variables[var_name]) > read_budget():
+                raise SlabTooLarge(f"{var_name} is too large to tile; use the slice API's max_size")
+        data2d = _read_api_slice(nc_instance, var_name, time_idx, selection)
+        return Pyramid(data2d, method, tile_size)
+
+    try:
+        pyramid = pyramid_cache.get_or_build(key, build)
+        tile = pyramid.tile(level, tile_y, tile_x)
+    except SlabTooLarge as exc:
+        return HttpResponse(str(exc), status=413)
+    except BadRequest as exc:
+        return HttpResponseBadRequest(str(exc))
+    except IndexError as exc:
+        raise Http404(str(exc))
+
+    tiles_y, tiles_x = pyramid.tile_counts(level)
+    response = _binary_response(encode_slice(tile, encoding))
+    response["X-Pyramid-Levels"] = str(len(pyramid.levels))
+    response["X-Tile-Size"] = str(tile_size)
+    response["X-Tile-Grid"] = f"{tiles_y},{tiles_x}"
+    return response
+
+
+# --------------------------------------------------------------------------
+# Time axis API
+# --------------------------------------------------------------------------
+# GET /api/files/<id>/time[?ticks=<n>]
+#
+# The number of steps, the first and last time and about n labelled ticks
+# (see time_axis.py). Lookups are added with:
+#
+#   index=<i>                the label of step i
+#   at=<ISO time>            the step nearest to a time ("nearest")
+#   from=<ISO>&to=<ISO>      the steps between two times, inclusive, as
+#                            start/stop indices ("span"); either may be left out
+#
+# Times without a timezone are UTC. 404 for files without a time variable.
+
+@revalidated_api
+def time_api(request, file_id):
+
+    nc_instance = _api_file(request, file_id) or get_object_or_404(NetCDFFile, id=file_id)
+    axis = time_axis(nc_instance)
+    if axis is None:
+        raise Http404("The file has no time axis")
+
+    try:
+        ticks = _int_param(request, "ticks")
+        index = _int_param(request, "index")
+        result = axis.summary(None if ticks is None else min(max(ticks, 2), 100))
+        if index is not None:
+            if not 0 <= index < len(axis):
+                raise BadRequest("index is out of range")
+            result["index"] = index
+            result["label"] = axis.label(index)
+        if "at" in request.GET:
+            nearest = axis.nearest(parse_time(request.GET["at"]))
+            result["nearest"] = {"index": nearest, "label": axis.label(nearest)}
+        if "from" in request.GET or "to" in request.GET:
+            start = parse_time(request.GET["from"]) if request.GET.get("from") else -(2 ** 62)
+            end = parse_time(request.GET["to"]) if request.GET.get("to") else 2 ** 62
+            start, stop = axis.span(start, end)
+            result["span"] = {"start": start, "stop": stop}
+    except ValueError as exc:
+        # BadRequest, unreadable times and lookups on undecoded axes
+        return HttpResponseBadRequest(str(exc))
+    return JsonResponse(result)
+
+
+# --------------------------------------------------------------------------
+# Statistics API
+# --------------------------------------------------------------------------
+# GET /api/files/<id>/vars/<var>/stats?time=<idx>
+#
+# Returns the statistics stored at ingest time as JSON: {"global": {...},
+# "step": {...}}. 404 until the file has been ingested.
+
+@revalidated_api
+def stats_api(request, file_id, var_name):
+
+    nc_instance = _api_file(request, file_id) or get_object_or_404(NetCDFFile, id=file_id)
+
+    try:
+        time_idx = _int_param(request, "time")
+    except BadRequest as exc:
+        return HttpResponseBadRequest(str(exc))
+
+    statistics = get_statistics(nc_instance, var_name, time_idx)
+    if statistics is None:
+        raise Http404(f"No statistics for {var_name!r} yet")
+    return JsonResponse(statistics)
+
+
+# --------------------------------------------------------------------------
+# Time series / profile API
+# --------------------------------------------------------------------------
+# GET /api/files/<id>/vars/<var>/series?y=<row>&x=<col>[&y1=..&x1=..]
+#                                        [&along=<dim>][&dim_<name>=..]
+#
+# Values of one cell (or the box y:y1, x:x1, end exclusive) at every step
+# along a dimension - time by default, or e.g. along=level for a vertical
+# profile. The other non-spatial dimensions are fixed with dim_<name>.
+# Boxes report the mean per step plus min and max. See timeseries.py for
+# how the reads are aligned to chunks and cached.
+
+def _json_floats(values):
+    return [float(v) if np.isfinite(v) else None for v in values]
+
+
+@revalidated_api
+def series_api(request, file_id, var_name):
+
+    nc_instance = _api_file(request, file_id) or get_object_or_404(NetCDFFile, id=file_id)
+    max_cells = getattr(settings, "NETCDF_SERIES_MAX_CELLS", 4096)
+
+    try:
+        y0 = _int_param(request, "y")
+        x0 = _int_param(request, "x")
+        if y0 is None or x0 is None:
+            raise BadRequest("x and y are required")
+        y1 = _int_param(request, "y1", y0 + 1)
+        x1 = _int_param(request, "x1", x0 + 1)
+        if (y1 - y0) * (x1 - x0) > max_cells:
+            raise BadRequest(f"Boxes are limited to {max_cells} cells")
+        selection = _selection_param(request)
+    except BadRequest as exc:
+        return HttpResponseBadRequest(str(exc))
+
+    # Decoded once per file and cached, so clicks do not re-read the axis
+    axis = time_axis(nc_instance)
+    with dataset_cache.open(nc_instance) as ds:
+        if var_name not in plottable_variables(ds):
+            raise Http404(f"No plottable variable {var_name!r}")
+        along = request.GET.get("along") or time_dimension(ds.variables[var_name].dimensions)
+        try:
+            block = read_series(
+                ds, var_name, y0, y1, x0, x1, along, selection,
+                cache_key=content_version(nc_instance),
+            )
+        except IndexError as exc:
+            return HttpResponseBadRequest(str(exc))
+        coordinates = axis_coordinates(ds, along, axis)
+
+    summary = summarise(block)
+    result = {
+        "variable": var_name,
+        "along": along,
+        "box": [y0, y1, x0, x1],
+        "coordinates": coordinates,
+        "values": _json_floats(summary["values"]),
+    }
+    if block[0].size > 1:
+        result["min"] = _json_floats(summary["min"])
+        result["max"] = _json_floats(summary["max"])
+    return JsonResponse(result)
+
+
+# --------------------------------------------------------------------------
+# Thumbnail API
+# --------------------------------------------------------------------------
+# GET /api/files/<id>/vars/<var>/thumbnail?time=<idx>&size=256&format=webp
+#
+# A small rendered heatmap of one time step (see thumbnails.py). When the
+# file has statistics the variable's global min/max are used, so the
+# thumbnails of different time steps share one colour scale.
+
+@require_GET
+def thumbnail_api(request, file_id, var_name):
+
+    nc_instance = get_object_or_404(NetCDFFile, id=file_id)
+
+    try:
+        fmt = _choice_param(request, "format", FORMATS, "png")
+        size = _int_param(request, "size", 256)
+        time_idx = _int_param(request, "time", 0)
+        selection = _selection_param(request)
+        if size not in SIZES:
+            raise BadRequest(f"size must be one of {', '.join(map(str, SIZES))}")
+    except BadRequest as exc:
+        return HttpResponseBadRequest(str(exc))
+
+    variables = get_catalogue(nc_instance, include_times=False)["variables"]
+    if not any(v["name"] == var_name and v["is_plottable"] for v in variables):
+        raise Http404(f"No plottable variable {var_name!r}")
+
+    limits = colour_limits(get_statistics(nc_instance, var_name), "global")
+    vmin, vmax = limits.get("zmin"), limits.get("zmax")
+
+    key = thumbnail_key(
+        "netcdf", content_version(nc_instance), var_name, time_idx, selection_key(selection),
+        size, fmt, vmin, vmax,
+    )
+    try:
+        path = get_thumbnail(
+            key, fmt, size, render_slice_thumbnail,
+            nc_instance.data_path, var_name, time_idx, vmin, vmax, selection,
+        )
+    except IndexError as exc:
+        return HttpResponseBadRequest(str(exc))
+    return thumbnail_response(path, fmt, key)
+
+
+# --------------------------------------------------------------------------
+# Subset export
+# --------------------------------------------------------------------------
+# GET /api/files/<id>/export?format=<nc|csv|zarr>&var=<name>[&var=..]
+#                           [&start=<t0>&stop=<t1>][&lat_min=..&lat_max=..
+#                           &lon_min=..&lon_max=..][&dim_<name>=..]
+#
+# Streams the chosen variables over time steps t0..t1-1 inside the lat/lon
+# box (bounds on the last two dimensions' coordinates) as a download. See
+# export.py for how it is written block by block. When too many exports
+# are already running the answer is 503 with a Retry-After header. NetCDF
+# subsets are written to a temporary file before they are sent, so ones
+# larger than NETCDF_EXPORT_NETCDF_MAX_BYTES get 413.
+
+BBOX_PARAMS = ("lat_min", "lat_max", "lon_min", "lon_max")
+
+
+def _float_param(request, name):
+    value = request.GET.get(name)
+    if value in (None, ""):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise BadRequest(f"{name} must be a number")
+
+
+@require_GET
+def export_api(request, file_id):
+
+    nc_instance = get_object_or_404(NetCDFFile, id=file_id)
+
+    try:
+        fmt = _choice_param(request, "format", EXPORT_FORMATS, "nc")
+        start = _int_param(request, "start")
+        stop = _int_param(request, "stop")
+        bbox = {name: _float_param(request, name) for name in BBOX_PARAMS}
+        selection = _selection_param(request)
+    except BadRequest as exc:
+        return HttpResponseBadRequest(str(exc))
+
+    # The subset is checked up front, so errors are still plain 400s
+    with dataset_cache.open(nc_instance) as ds:
+        try:
+            plan = plan_export(ds, request.GET.getlist("var"), start, stop, bbox, selection)
+            check_export_size(fmt, plan)
+        except ExportTooLarge as exc:
+            return HttpResponse(str(exc), status=413)
+        except (ExportError, IndexError) as exc:
+            return HttpResponseBadRequest(str(exc))
+
+    stream = start_export(fmt, nc_instance.data_path, plan)
+    if stream is None:
+        response = HttpResponse("Too many exports are running; try again shortly.", status=503)
+        response["Retry-After"] = "10"
+        return response
+
+    content_type, suffix = EXPORT_FORMATS[fmt]
+    name = os.path.splitext(os.path.basename(nc_instance.file.name))[0]
+    response = StreamingHttpResponse(stream, content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="{name}_subset{suffix}"'
+    return response
+
+
+# --------------------------------------------------------------------------
+# /files/ - every stored file, newest first
+# --------------------------------------------------------------------------
+# The list is paged with a cursor instead of page numbers: "Older files"
+# links to ?after=<uploaded_at>,<id> of the last file shown, and the next
+# page is the files that come after it. Counting every file or skipping
+# OFFSET rows gets slower as the table grows; this query reads one page
+# straight from the netcdf_file_recent index (see models.py), so it is as
+# fast with 100,000 files as with ten.
+
+FILES_PER_PAGE = getattr(settings, "NETCDF_FILES_PER_PAGE", 50)
+
+
+def _file_cursor(nc_file):
+    return f"{nc_file.uploaded_at.isoformat()},{nc_file.id}"
+
+
+def _parse_file_cursor(text):
+    """(uploaded_at, id) from a cursor made by _file_cursor."""
+    moment, _, file_id = text.rpartition(",")
+    try:
+        uploaded_at = parse_datetime(moment)
+        file_id = int(file_id)
+    except ValueError:
+        uploaded_at = None
+    if uploaded_at is None:
+        raise BadRequest("after is not a valid cursor")
+    return uploaded_at, file_id
+
+
+def file_list(request):
+
+    status = request.GET.get("status", "")
+    files = NetCDFFile.objects.order_by("-uploaded_at", "-id")
+    if status in dict(NetCDFFile.INGEST_CHOICES):
+        files = files.filter(ingest_status=status)
+    else:
+        status = ""
+
+    if request.GET.get("after"):
+        try:
+            uploaded_at, file_id = _parse_file_cursor(request.GET["after"])
+        except BadRequest as exc:
+            return HttpResponseBadRequest(str(exc))
+        files = files.filter(
+            Q(uploaded_at__lt=uploaded_at) | Q(uploaded_at=uploaded_at, id__lt=file_id)
+        )
+
+    # One row more than a page tells whether there is a next page
+    page = list(files[:FILES_PER_PAGE + 1])
+    next_cursor = _file_cursor(page[FILES_PER_PAGE - 1]) if len(page) > FILES_PER_PAGE else None
+
+    return render(request, "uploader/files.html", {
+        "files": page[:FILES_PER_PAGE],
+        "status": status,
+        "statuses": NetCDFFile.INGEST_CHOICES,
+        "next_cursor": next_cursor,
+        "first_page": not request.GET.get("after"),
+    })
+
+
+# --------------------------------------------------------------------------
+# Collections (many files along time, see aggregation.py)
+# --------------------------------------------------------------------------
+# /collections/        lists the collections and builds new ones
+# /collections/<id>/   views one, with a time slider over all its files
+#
+# The page works like the single-file viewer, except that each time step
+# is looked up in the collection's index first, and only the member file
+# holding it is opened.
+
+def collection_list(request):
+
+    form = NetCDFCollectionForm(request.POST or None)
+    if request.method == "POST" and form.is_valid():
+        collection = form.save()
+        try:
+            submit_build(collection, form.cleaned_data["files"])
+        except CollectionError as exc:
+            collection.delete()
+            form.add_error("files", str(exc))
+        else:
+            return redirect("collection_view", collection_id=collection.id)
+
+    return render(request, "uploader/collections.html", {
+        "form": form,
+        "collections": NetCDFCollection.objects.all(),
+    })
+
+
+def collection_view(request, collection_id):
+
+    collection = get_object_or_404(NetCDFCollection, id=collection_id)
+    context = {
+        "collection": collection,
+        "plotly_version": plotly.offline.get_plotlyjs_version(),
+    }
+    if not collection.variables or not collection.time_count:
+        return render(request, "uploader/collection.html", context)
+
+    # Variables every member file has (chosen when the collection was built)
+    variables = [v["name"] for v in collection.variables]
+    selected_var = request.GET.get("variable", variables[0])
+    if selected_var not in variables:
+        selected_var = variables[0]
+    context["variables"] = variables
+    context["selected_var"] = selected_var
+
+    # Same selectors as the single-file viewer, for dimensions other than
+    # time and the spatial ones
+    details = next(v for v in collection.variables if v["name"] == selected_var)
+    selectors = []
+    selection = {}
+    for dim in selector_dimensions(details["dimensions"]):
+        if dim == "time":
+            continue
+        size = details["shape"][details["dimensions"].index(dim)]
+        try:
+            index = int(request.GET.get(f"dim_{dim}", 0))
+        except ValueError:
+            index = 0
+        index = index if 0 <= index < size else 0
+        selection[dim] = index
+        selectors.append({"name": dim, "size": size, "selected": index, "range": range(size)})
+    context["selectors"] = selectors
+    context["selection"] = selection
+    context["time_chunk"] = time_chunk_length(details["dimensions"], details["chunking"])
+
+    try:
+        time_idx = _time_index_param(request.GET.get("time_idx", 0), collection.time_count)
+    except BadRequest as exc:
+        return HttpResponseBadRequest(str(exc))
+    context["times"] = collection.times
+    context["selected_time_idx"] = time_idx
+    context["selected_time"] = collection.times[time_idx]
+
+    lod_method = request.GET.get("lod_method", "mean")
+    if lod_method not in METHODS:
+        lod_method = "mean"
+    context["lod_method"] = lod_method
+    context["lod_methods"] = METHODS
+    context["display_max_size"] = DISPLAY_MAX_SIZE
+
+    # Only the member file holding this step is opened
+    member, local_idx = collection_index(collection).locate(time_idx)
+    context["member"] = member
+    figure_key = make_key(
+        member.file, "member_figure", selected_var, local_idx, time_idx, selection_key(selection),
+        lod_method, DISPLAY_MAX_SIZE,
+    )
+    context["plot_html"] = payload_cache.get_or_compute(
+        figure_key,
+        lambda: render_heatmap(
+            cached_member_slice(member, selected_var, local_idx, selection),
+            selected_var, time_idx, lod_method, {},
+        ),
+    )
+    return render(request, "uploader/collection.html", context)
+
+
+# GET /api/collections/<id>/vars/<var>/frames?start=<t0>&stop=<t1>&...
+#
+# The frames API for a collection, with the same parameters and response
+# format as frames_api. A batch that crosses from one file into the next
+# is read from each file in turn.
+
+@require_GET
+def collection_frames_api(request, collection_id, var_name):
+
+    collection = get_object_or_404(NetCDFCollection, id=collection_id)
+    if not any(v["name"] == var_name for v in collection.variables):
+        raise Http404(f"No plottable variable {var_name!r}")
+    max_frames = getattr(settings, "NETCDF_MAX_FRAMES_PER_REQUEST", 32)
+
+    try:
+        encoding = _choice_param(request, "encoding", ENCODINGS, "float32")
+        method = _choice_param(request, "method", METHODS, "mean")
+        start = _int_param(request, "start", 0)
+        stop = _int_param(request, "stop", start + 1)
+        max_size = _int_param(request, "max_size")
+        selection = _selection_param(request)
+        pieces = collection_index(collection).split(start, min(stop, start + max_frames))
+    except (BadRequest, IndexError) as exc:
+        return HttpResponseBadRequest(str(exc))
+
+    def build():
+        frames = []
+        for member, local_start, local_stop in pieces:
+            with dataset_cache.open(member.file) as ds:
+                try:
+                    frames.append(read_member_range(ds, var_name, local_start, local_stop, selection))
+                except IndexError as exc:
+                    raise BadRequest(str(exc))
+        return _encode_frames(np.concatenate(frames), encoding, max_size, method)
+
+    # Keyed by the member files' versions, like every other cached payload
+    key = ":".join(
+        [make_key(member.file, local_start, local_stop) for member, local_start, local_stop in pieces]
+        + ["collection_frames", var_name, str(selection_key(selection)), encoding, str(max_size), method]
+    )
+    try:
+        payload, factors = payload_cache.get_or_compute(key, build)
+    except BadRequest as exc:
+        return HttpResponseBadRequest(str(exc))
+
+    stop = start + sum(local_stop - local_start for _, local_start, local_stop in pieces)
+    response = _binary_response(payload)
+    response["X-Downsample-Factor"] = factors
+    response["X-Time-Range"] = f"{start},{stop}"
+    return response
+
+
+# --------------------------------------------------------------------------
+# Resumable chunked upload API
+# --------------------------------------------------------------------------
+# For files too large to send in one request:
+#
+#   POST   /api/uploads                    filename=..&size=..  -> {"upload_id", "offset"}
+#   PUT    /api/uploads/<id>?offset=<n>    raw bytes of the next piece -> {"offset"}
+#   GET    /api/uploads/<id>               -> {"offset"} (where to resume)
+#   DELETE /api/uploads/<id>               abandon the upload
+#   POST   /api/uploads/<id>/complete      -> {"file_id", "created"}
+#
+# A PUT for the wrong offset gets 409 with the offset the server expects.
+
+def _upload_status(upload):
+    return {
+        "upload_id": str(upload.id),
+        "filename": upload.filename,
+        "offset": upload.offset,
+        "total_size": upload.total_size,
+    }
+
+
+@require_POST
+def chunked_upload_start(request):
+
+    filename = os.path.basename(request.POST.get("filename", "").replace("\\", "/"))
+    if not filename:
+        return HttpResponseBadRequest("filename is required")
+
+    size = request.POST.get("size")
+    try:
+        total_size = int(size) if size else None
+    except ValueError:
+        return HttpResponseBadRequest("size must be an integer")
+
+    upload = ChunkedUpload.objects.create(filename=filename, total_size=total_size)
+    return JsonResponse(_upload_status(upload), status=201)
+
+
+@require_http_methods(["GET", "PUT", "DELETE"])
+def chunked_upload_detail(request, upload_id):
+
+    upload = get_object_or_404(ChunkedUpload, id=upload_id)
+
+    if request.method == "GET":
+        return JsonResponse(_upload_status(upload))
+
+    if request.method == "DELETE":
+        discard_upload(upload)
+        return HttpResponse(status=204)
+
+    try:
+        offset = int(request.GET.get("offset", upload.offset))
+    except ValueError:
+        return HttpResponseBadRequest("offset must be an integer")
+
+    try:
+        append_chunk(upload, offset, request)
+    except OffsetMismatch as exc:
+        return JsonResponse({"error": str(exc), "offset": exc.expected}, status=409)
+    return JsonResponse(_upload_status(upload))
+
+
+@require_POST
+def chunked_upload_complete(request, upload_id):
+
+    upload = get_object_or_404(ChunkedUpload, id=upload_id)
+
+    try:
+        nc_instance, created = complete_upload(upload)
+    except IncompleteUpload as exc:
+        return JsonResponse({"error": str(exc), "offset": upload.offset}, status=409)
+    except ChunkedUpload.DoesNotExist:
+        # Another request completed (or discarded) the upload meanwhile
+        return JsonResponse({"error": "This upload is already finished"}, status=404)
+
+    if created:
+        submit_ingest(nc_instance)
+        submit_optimize(nc_instance)
+    return JsonResponse({"file_id": nc_instance.id, "created": created})
+
+
+# --------------------------------------------------------------------------
+# Bulk upload
+# --------------------------------------------------------------------------
+# POST api/uploads/bulk with any number of "files" fields stores them all in
+# one go (see bulk.py): headers are checked in parallel and the rows are
+# inserted in batches. The response lists the stored files, the duplicates
+# and every file that failed with its error, plus the throughput. Django
+# refuses requests with more than DATA_UPLOAD_MAX_NUMBER_FILES files; use
+# "manage.py ingest_netcdf" for whole directories.
+
+@require_POST
+def bulk_upload(request):
+
+    uploaded = request.FILES.getlist("files")
+    if not uploaded:
+        return HttpResponseBadRequest("files are required")
+
+    # Uploads are streamed to temporary files (see HashingUploadHandler),
+    # which the worker processes read directly
+    files = [(f.temporary_file_path(), f.name, getattr(f, "sha256", None)) for f in uploaded]
+    # Statistics read every value, so they are computed after the response
+    # like those of single uploads
+    report = bulk_ingest(files, bulk_executor(), statistics=False, **bulk_options())
+    for nc_instance in report.created:
+        if statistics_enabled():
+            submit_statistics(nc_instance)
+        submit_optimize(nc_instance)
+    return JsonResponse(report.as_dict(), status=201 if report.created else 200)
+
+
+# --------------------------------------------------------------------------
+# plotly.js bundle
+# --------------------------------------------------------------------------
+# The page loads plotly.js from here exactly once; the URL carries the
+# version so browsers can cache it indefinitely. Serving it from the
+# installed plotly package keeps the viewer working without internet access.
+
+@require_GET
+def plotly_js(request):
+    response = HttpResponse(
+        plotly.offline.get_plotlyjs(), content_type="application/javascript"
+    )
+    response["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+
+# --------------------------------------------------------------------------
+# Prometheus metrics
+# --------------------------------------------------------------------------
+# GET /metrics returns the request and stage timings collected by
+# instrumentation.py in Prometheus text format. Outside DEBUG only staff
+# users may read it (scrape it with a staff session, or restrict it to the
+# monitoring network at the proxy); it does not exist while
+# instrumentation is disabled.
+
+@require_GET
+def metrics_view(request):
+    if not instrumentation_enabled():
+        raise Http404("Instrumentation is disabled")
+    if not (settings.DEBUG or request.user.is_staff):
+        raise PermissionDenied("Metrics are only available to staff users")
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")